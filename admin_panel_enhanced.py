@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 import requests
 import json
 from guimabet_melhorado import *
+from cache import LIVE_REFRESH_SECONDS, cache_stats, reload_if_changed
+from odds_engine import MARGIN
+from profiler import clear_runs, finish_run, profile_summary, read_sql, set_page, start_run
+from rebalancer import LIQUIDITY, rebalance_odds
+from simulator import simulate_matches
+from widgets import settlement_progress
 
 # Configure page
 st.set_page_config(
@@ -58,6 +65,7 @@ def main_admin_panel():
     ]
     
     selected_page = st.sidebar.selectbox("Selecione uma página:", menu_options)
+    set_page(selected_page)
     
     if st.sidebar.button("🚪 Logout"):
         st.session_state.logged_in = False
@@ -88,30 +96,21 @@ def main_admin_panel():
 def dashboard_page():
     st.header("📊 Dashboard Administrativo")
     
-    # Get statistics
+    # Get statistics (one read of the counters table, whatever the data size)
+    counters = get_counters()
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        users = get_all_users()
-        st.metric("Total de Usuários", len(users))
+        st.metric("Total de Usuários", counters.get('total_users', 0))
     
     with col2:
-        matches = get_upcoming_matches() + get_match_history()
-        st.metric("Total de Partidas", len(matches))
+        st.metric("Partidas Abertas", counters.get('open_matches', 0))
     
     with col3:
-        # Count active bets
-        conn = sqlite3.connect('guimabet.db')
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM bets WHERE status = 'pending'")
-        active_bets = c.fetchone()[0]
-        conn.close()
-        st.metric("Apostas Ativas", active_bets)
+        st.metric("Apostas Ativas", counters.get('pending_bets', 0))
     
     with col4:
-        # Count custom bet proposals
-        proposals = get_custom_bet_proposals('pending')
-        st.metric("Propostas Pendentes", len(proposals))
+        st.metric("Propostas Pendentes", counters.get('pending_proposals', 0))
     
     # Recent activity
     st.subheader("📈 Atividade Recente")
@@ -120,20 +119,21 @@ def dashboard_page():
     
     with col1:
         st.write("**Últimas Apostas**")
-        conn = sqlite3.connect('guimabet.db')
-        recent_bets = pd.read_sql_query('''
-        SELECT b.user_id, b.amount, b.bet_type, b.timestamp, m.team1_id, m.team2_id
+        recent_bets = read_sql("dashboard_recent_bets", '''
+        SELECT b.user_id, b.amount, b.bet_type, b.timestamp, m.team1_id, m.team2_id,
+               t1.name AS team1_name, t2.name AS team2_name
         FROM bets b
         JOIN matches m ON b.match_id = m.id
-        ORDER BY b.timestamp DESC
+        LEFT JOIN teams t1 ON m.team1_id = t1.id
+        LEFT JOIN teams t2 ON m.team2_id = t2.id
+        ORDER BY b.placed_at DESC, b.id DESC
         LIMIT 10
-        ''', conn)
-        conn.close()
+        ''')
         
         if not recent_bets.empty:
             for _, bet in recent_bets.iterrows():
-                team1 = get_team_name(bet['team1_id'])
-                team2 = get_team_name(bet['team2_id'])
+                team1 = bet['team1_name']
+                team2 = bet['team2_name']
                 st.write(f"• {bet['user_id']} apostou {bet['amount']} pts em {team1} vs {team2}")
         else:
             st.write("Nenhuma aposta recente")
@@ -149,10 +149,44 @@ def dashboard_page():
                 st.write(f"• {proposal['username']}: {proposal['description'][:50]}...")
         else:
             st.write("Nenhuma proposta pendente")
+    
+    # Worst case per open match, read from match_exposure (not from bets)
+    st.subheader("💰 Maiores Exposições")
+    overview = get_exposure_overview(5)
+    if overview:
+        df = pd.DataFrame(overview)
+        df['partida'] = df['team1_name'] + " vs " + df['team2_name']
+        df = df[['partida', 'status', 'bets', 'stake', 'worst_case']]
+        df.columns = ['Partida', 'Status', 'Apostas', 'Valor Apostado', 'Perda Máxima da Casa']
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.write("Nenhuma aposta pendente")
 
 def manage_odds_page():
     st.header("🎯 Gerenciar Odds")
     
+    # Reprice every upcoming match from the team ratings (odds_engine.py)
+    with st.expander("🧮 Recalcular Odds pelo Histórico"):
+        st.write("Ajusta a força de cada time com todos os jogos finalizados e recalcula as odds "
+                 "de resultado de todas as partidas agendadas. Apostas já feitas mantêm suas odds.")
+        margin = st.number_input("Margem da casa (%)", min_value=0.0, max_value=30.0, value=MARGIN * 100, step=0.5)
+        if st.button("🔄 Recalcular Todas"):
+            repriced = reprice_upcoming_matches(st.session_state.username, margin / 100)
+            st.success(f"{repriced} partidas recalculadas!")
+    
+    # Move the odds of every open match towards its stakes (rebalancer.py)
+    with st.expander("⚖️ Rebalancear pelas Apostas"):
+        st.write("Recalcula as odds de resultado de todas as partidas abertas misturando o modelo com a "
+                 "distribuição do valor apostado em cada resultado. Quanto mais apostas, mais as odds "
+                 "seguem o dinheiro. Cada alteração fica no histórico de odds.")
+        liquidity = st.number_input("Liquidez (pts)", min_value=1, value=int(LIQUIDITY), step=500,
+                                    help="Valor apostado em uma partida a partir do qual as apostas pesam tanto quanto o modelo")
+        rebalance_margin = st.number_input("Margem da casa (%)", min_value=0.0, max_value=30.0, value=MARGIN * 100,
+                                           step=0.5, key="rebalance_margin")
+        if st.button("⚖️ Rebalancear Agora"):
+            checked, changed = rebalance_odds(st.session_state.username, rebalance_margin / 100, liquidity)
+            st.success(f"{changed} de {checked} partidas abertas tiveram as odds alteradas!")
+    
     # Select match
     matches = get_upcoming_matches()
     if not matches:
@@ -161,13 +195,65 @@ def manage_odds_page():
     
     match_options = {}
     for match in matches:
-        team1 = get_team_name(match['team1_id'])
-        team2 = get_team_name(match['team2_id'])
+        team1 = match['team1_name']
+        team2 = match['team2_name']
         match_key = f"{team1} vs {team2} - {match['date']} {match['time']}"
         match_options[match_key] = match['id']
     
     selected_match_key = st.selectbox("Selecione uma partida:", list(match_options.keys()))
     selected_match_id = match_options[selected_match_key]
+    match = next(m for m in matches if m['id'] == selected_match_id)
+    
+    # What the house pays on each outcome if it happens, from match_exposure
+    st.subheader("💰 Exposição da Casa")
+    exposure = get_match_exposure(selected_match_id)
+    result_rows = {row['outcome']: row for row in exposure if row['custom_bet_id'] is None}
+    result_stake = sum(row['stake'] for row in result_rows.values())
+    cols = st.columns(3)
+    for col, (outcome, label) in zip(cols, [('team1_win', f"{match['team1_name']} vence"), ('draw', "Empate"),
+                                            ('team2_win', f"{match['team2_name']} vence")]):
+        row = result_rows.get(outcome, {'bets': 0, 'stake': 0, 'payout': 0})
+        with col:
+            st.metric(label, f"{row['payout']} pts a pagar", f"{result_stake - row['payout']} pts para a casa")
+            st.caption(f"{row['bets']} apostas • {row['stake']} pts apostados")
+    custom_rows = [row for row in exposure if row['custom_bet_id'] is not None]
+    if custom_rows:
+        df = pd.DataFrame(custom_rows)[['description', 'bets', 'stake', 'payout']]
+        df.columns = ['Aposta Personalizada', 'Apostas', 'Valor Apostado', 'Pagamento se Ganhar']
+        st.dataframe(df, use_container_width=True)
+    
+    # Result odds (1X2); bets already placed keep the odds they were accepted at
+    if match['team1_win'] is not None:
+        with st.form(f"result_odds_{selected_match_id}"):
+            st.subheader("⚖️ Resultado Final")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                team1_win = st.number_input(f"{match['team1_name']} vence", min_value=1.01,
+                                            value=float(match['team1_win']), step=0.01)
+            with col2:
+                draw = st.number_input("Empate", min_value=1.01, value=float(match['draw']), step=0.01)
+            with col3:
+                team2_win = st.number_input(f"{match['team2_name']} vence", min_value=1.01,
+                                            value=float(match['team2_win']), step=0.01)
+            reason = st.text_input("Motivo da alteração:")
+            
+            if st.form_submit_button("💾 Atualizar Odds do Resultado"):
+                if (team1_win, draw, team2_win) != (match['team1_win'], match['draw'], match['team2_win']):
+                    update_odds(selected_match_id, team1_win, draw, team2_win, st.session_state.username, reason)
+                    st.success("Odds atualizadas!")
+                    st.rerun()
+                else:
+                    st.info("Nenhuma alteração detectada")
+    
+    with st.expander("📜 Histórico de Alterações de Odds"):
+        history = get_odds_history(selected_match_id)
+        if history:
+            df = pd.DataFrame(history)
+            df = df[['changed_time', 'market', 'player_name', 'old_odds', 'new_odds', 'changed_by', 'reason']]
+            df.columns = ['Quando', 'Mercado', 'Jogador', 'Odds Anterior', 'Odds Nova', 'Alterado por', 'Motivo']
+            st.dataframe(df, use_container_width=True)
+        else:
+            st.info("Nenhuma alteração de odds registrada")
     
     # Get current odds for the match
     match_odds = get_match_odds(selected_match_id)
@@ -293,16 +379,20 @@ def manage_custom_bets_page():
     tab1, tab2 = st.tabs(["📋 Ver Apostas", "➕ Criar Aposta"])
     
     with tab1:
+        settlement_progress("⏳ Liquidação de Apostas")
+        
         # Display existing custom bets
         matches = get_upcoming_matches()
         
         if matches:
             match_options = {}
+            match_teams = {}
             for match in matches:
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
+                team1 = match['team1_name']
+                team2 = match['team2_name']
                 match_key = f"{team1} vs {team2} - {match['date']} {match['time']}"
                 match_options[match_key] = match['id']
+                match_teams[match['id']] = (team1, team2)
             
             selected_match_key = st.selectbox("Filtrar por partida:", ["Todas"] + list(match_options.keys()))
             
@@ -314,8 +404,7 @@ def manage_custom_bets_page():
             if custom_bets:
                 for bet in custom_bets:
                     with st.expander(f"🎯 {bet['description']} (Odds: {bet['odds']})"):
-                        team1 = get_team_name(bet.get('team1_id', 0))
-                        team2 = get_team_name(bet.get('team2_id', 0))
+                        team1, team2 = match_teams.get(bet['match_id'], ("Unknown Team", "Unknown Team"))
                         
                         col1, col2 = st.columns(2)
                         
@@ -337,8 +426,8 @@ def manage_custom_bets_page():
                                 
                                 if st.button(f"✅ Finalizar Aposta", key=f"finish_{bet['id']}"):
                                     if result:
-                                        update_custom_bet_result(bet['id'], result)
-                                        st.success("Aposta finalizada!")
+                                        enqueue_custom_bet_settlement(bet['id'], result)
+                                        st.success("Aposta finalizada! Liquidação em andamento.")
                                         st.rerun()
                                     else:
                                         st.error("Selecione um resultado")
@@ -358,8 +447,8 @@ def manage_custom_bets_page():
         with st.form("create_custom_bet"):
             match_options = {}
             for match in matches:
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
+                team1 = match['team1_name']
+                team2 = match['team2_name']
                 match_key = f"{team1} vs {team2} - {match['date']} {match['time']}"
                 match_options[match_key] = match['id']
             
@@ -456,57 +545,65 @@ def manage_proposals_page():
                     else:
                         st.error("Selecione uma ação")
 
+# Open matches with their start/finish controls. Reruns on its own every
+# LIVE_REFRESH_SECONDS and reloads only when feed_generation has moved.
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def active_matches():
+    matches = reload_if_changed(st.session_state, 'admin_active_matches', get_upcoming_matches)
+    
+    if matches:
+        for match in matches:
+            team1 = match['team1_name']
+            team2 = match['team2_name']
+            
+            with st.expander(f"⚽ {team1} vs {team2} - {match['date']} {match['time']}"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**Status:** {match['status']}")
+                    if match['status'] == 'live':
+                        st.write(f"**Placar:** {match['team1_score'] or 0} - {match['team2_score'] or 0}")
+                
+                with col2:
+                    if match['status'] == 'upcoming':
+                        if st.button(f"🔴 Iniciar Partida", key=f"start_{match['id']}"):
+                            set_match_live(match['id'])
+                            st.success("Partida iniciada!")
+                            st.rerun()
+                    
+                    elif match['status'] == 'live':
+                        st.subheader("📊 Finalizar Partida")
+                        
+                        col_a, col_b = st.columns(2)
+                        with col_a:
+                            team1_score = st.number_input(f"Gols {team1}:", min_value=0, key=f"t1_{match['id']}")
+                        with col_b:
+                            team2_score = st.number_input(f"Gols {team2}:", min_value=0, key=f"t2_{match['id']}")
+                        
+                        if st.button(f"✅ Finalizar", key=f"finish_{match['id']}"):
+                            enqueue_match_settlement(match['id'], team1_score, team2_score)
+                            st.success("Partida finalizada! Liquidação em andamento.")
+                            st.rerun()
+    else:
+        st.info("Nenhuma partida ativa")
+
 def manage_matches_page():
     st.header("⚽ Gerenciar Partidas")
     
     tab1, tab2, tab3 = st.tabs(["📋 Partidas Ativas", "📈 Resultados", "➕ Nova Partida"])
     
     with tab1:
-        matches = get_upcoming_matches()
+        settlement_progress("⏳ Liquidação de Apostas")
         
-        if matches:
-            for match in matches:
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
-                
-                with st.expander(f"⚽ {team1} vs {team2} - {match['date']} {match['time']}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**Status:** {match['status']}")
-                        if match['status'] == 'live':
-                            st.write(f"**Placar:** {match['team1_score'] or 0} - {match['team2_score'] or 0}")
-                    
-                    with col2:
-                        if match['status'] == 'upcoming':
-                            if st.button(f"🔴 Iniciar Partida", key=f"start_{match['id']}"):
-                                set_match_live(match['id'])
-                                st.success("Partida iniciada!")
-                                st.rerun()
-                        
-                        elif match['status'] == 'live':
-                            st.subheader("📊 Finalizar Partida")
-                            
-                            col_a, col_b = st.columns(2)
-                            with col_a:
-                                team1_score = st.number_input(f"Gols {team1}:", min_value=0, key=f"t1_{match['id']}")
-                            with col_b:
-                                team2_score = st.number_input(f"Gols {team2}:", min_value=0, key=f"t2_{match['id']}")
-                            
-                            if st.button(f"✅ Finalizar", key=f"finish_{match['id']}"):
-                                update_match_result(match['id'], team1_score, team2_score)
-                                st.success("Partida finalizada!")
-                                st.rerun()
-        else:
-            st.info("Nenhuma partida ativa")
+        active_matches()
     
     with tab2:
         history = get_match_history()
         
         if history:
             for match in history[:10]:  # Show last 10 matches
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
+                team1 = match['team1_name']
+                team2 = match['team2_name']
                 
                 st.write(f"⚽ **{team1} {match['team1_score']} - {match['team2_score']} {team2}** ({match['date']})")
         else:
@@ -671,8 +768,8 @@ def manage_teams_players_page():
 def reports_page():
     st.header("📈 Relatórios")
     
-    # Betting statistics
-    conn = sqlite3.connect('guimabet.db')
+    # Everything below reads the rollup tables, never bets itself
+    status_totals = pd.DataFrame(get_status_totals(), columns=['status', 'bets', 'volume'])
     
     col1, col2 = st.columns(2)
     
@@ -680,68 +777,126 @@ def reports_page():
         st.subheader("📊 Estatísticas de Apostas")
         
         # Total bets by status
-        bet_stats = pd.read_sql_query('''
-        SELECT status, COUNT(*) as count, SUM(amount) as total_amount
-        FROM bets
-        GROUP BY status
-        ''', conn)
-        
-        if not bet_stats.empty:
-            st.dataframe(bet_stats)
+        if not status_totals.empty:
+            st.dataframe(status_totals.rename(columns={'bets': 'count', 'volume': 'total_amount'}))
         
         # Top bettors
         st.subheader("🏆 Maiores Apostadores")
-        top_bettors = pd.read_sql_query('''
-        SELECT user_id, COUNT(*) as total_bets, SUM(amount) as total_amount
-        FROM bets
-        GROUP BY user_id
-        ORDER BY total_amount DESC
-        LIMIT 10
-        ''', conn)
+        top_bettors = pd.DataFrame(get_top_bettors(10), columns=['user_id', 'bets', 'volume'])
         
         if not top_bettors.empty:
-            st.dataframe(top_bettors)
+            st.dataframe(top_bettors.rename(columns={'bets': 'total_bets', 'volume': 'total_amount'}))
     
     with col2:
         st.subheader("💰 Análise Financeira")
         
         # Daily betting volume
-        daily_volume = pd.read_sql_query('''
-        SELECT DATE(timestamp) as date, COUNT(*) as bets, SUM(amount) as volume
-        FROM bets
-        WHERE timestamp >= date('now', '-30 days')
-        GROUP BY DATE(timestamp)
-        ORDER BY date DESC
-        ''', conn)
+        daily_volume = pd.DataFrame(get_daily_volume(30), columns=['day', 'bets', 'volume'])
         
         if not daily_volume.empty:
-            st.line_chart(daily_volume.set_index('date')['volume'])
+            st.line_chart(daily_volume.rename(columns={'day': 'date'}).set_index('date')['volume'])
         
         # Win/Loss ratio
-        win_loss = pd.read_sql_query('''
-        SELECT 
-            SUM(CASE WHEN status = 'won' THEN amount ELSE 0 END) as total_winnings,
-            SUM(CASE WHEN status = 'lost' THEN amount ELSE 0 END) as total_losses,
-            COUNT(CASE WHEN status = 'won' THEN 1 END) as wins,
-            COUNT(CASE WHEN status = 'lost' THEN 1 END) as losses
-        FROM bets
-        WHERE status IN ('won', 'lost')
-        ''', conn)
-        
-        if not win_loss.empty and win_loss.iloc[0]['wins'] > 0:
-            st.metric("Taxa de Vitória", f"{win_loss.iloc[0]['wins'] / (win_loss.iloc[0]['wins'] + win_loss.iloc[0]['losses']) * 100:.1f}%")
-    
-    conn.close()
+        settled = status_totals.set_index('status')['bets']
+        wins = int(settled.get('won', 0))
+        losses = int(settled.get('lost', 0))
+        
+        if wins > 0:
+            st.metric("Taxa de Vitória", f"{wins / (wins + losses) * 100:.1f}%")
+    
+    # Range of house results on pending bets before settling (simulator.py)
+    st.subheader("🎲 Simulação de Resultados da Casa")
+    open_matches = {f"{m['team1_name']} vs {m['team2_name']} - {m['date']}": m['id'] for m in get_upcoming_matches()}
+    if not open_matches:
+        st.info("Nenhuma partida aberta para simular.")
+    else:
+        selected = st.multiselect("Partidas (vazio = todas as abertas):", list(open_matches.keys()))
+        simulations = st.select_slider("Simulações", options=[10_000, 100_000, 1_000_000], value=100_000)
+        if st.button("🎲 Simular"):
+            match_ids = [open_matches[key] for key in selected] or list(open_matches.values())
+            summary, profit = simulate_matches(match_ids, simulations)
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Lucro Médio", f"{summary['mean']:,.0f} pts")
+            col2.metric("Chance de Prejuízo", f"{summary['loss_chance'] * 100:.1f}%")
+            col3.metric("Apostas Pendentes", f"{summary['bets']} ({summary['stake']} pts)")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("VaR 95%", f"{summary['var_95']:,.0f} pts", help="Prejuízo superado em 5% das simulações")
+            col2.metric("VaR 99%", f"{summary['var_99']:,.0f} pts", help="Prejuízo superado em 1% das simulações")
+            col3.metric("Pior Simulado", f"{summary['worst_simulated']:,} pts",
+                        help=f"Pior caso possível: {summary['worst_possible']:,} pts")
+            
+            counts, edges = np.histogram(profit, bins=50)
+            st.bar_chart(pd.DataFrame({'simulações': counts}, index=np.round((edges[:-1] + edges[1:]) / 2)))
+    
+    # Balance history and reconciliation from the points ledger (ledger.py)
+    with st.expander("📒 Livro de Pontos"):
+        usernames = [user['username'] for user in get_all_users()]
+        if usernames:
+            username = st.selectbox("Usuário:", usernames, key="ledger_user")
+            day = st.date_input("Saldo no fim do dia:", datetime.date.today(), key="ledger_day")
+            at = datetime.datetime.combine(day, datetime.time.max)
+            st.metric(f"Saldo em {day.strftime('%d/%m/%Y')}", f"{get_balance_at(username, at)} pts")
+            entries = get_ledger_entries(username)
+            if entries:
+                st.dataframe(pd.DataFrame(entries)[['created_time', 'kind', 'delta', 'balance', 'ref']].rename(columns={
+                    'created_time': 'Data', 'kind': 'Tipo', 'delta': 'Variação', 'balance': 'Saldo', 'ref': 'Referência'
+                }))
+        if st.button("🔍 Conciliar Saldos"):
+            mismatches = reconcile()
+            if mismatches:
+                st.error(f"{len(mismatches)} usuário(s) com saldo diferente do livro de pontos")
+                st.dataframe(pd.DataFrame(mismatches))
+            else:
+                st.success("Todos os saldos conferem com o livro de pontos.")
+    
+    # Read cache effectiveness in this process
+    with st.expander("🗄️ Cache de Leitura"):
+        stats = cache_stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Acertos", stats['hits'])
+        col2.metric("Faltas", stats['misses'])
+        col3.metric("Taxa de Acerto", f"{stats['hit_rate'] * 100:.1f}%")
+        if stats['functions']:
+            st.dataframe(pd.DataFrame.from_dict(stats['functions'], orient='index'))
+    
+    # Data access per script run in this process (see profiler.py)
+    with st.expander("⏱️ Perfil de Consultas"):
+        pages, functions = profile_summary()
+        if not pages:
+            st.info("Nenhuma execução registrada ainda.")
+        else:
+            st.write("**Por página**")
+            st.dataframe(pd.DataFrame(pages).round(2))
+            st.write("**Por função** (latência inclui as consultas de funções chamadas dentro dela)")
+            st.dataframe(pd.DataFrame(functions).round(2))
+            if st.button("Limpar perfil"):
+                clear_runs()
+                st.rerun()
+
+# Schema migrations and the settlement worker run once per process
+@st.cache_resource
+def bootstrap():
+    init_db()
+    start_worker()
+    return True
 
 # Main app logic
 def main():
-    init_db()  # Initialize database
+    bootstrap()  # Initialize database
     
     if not st.session_state.logged_in:
+        set_page("login")
         admin_login_page()
     else:
         main_admin_panel()
 
+# Every script run is profiled (see profiler.py); st.rerun() ends a run
+# with an exception, hence the finally
 if __name__ == "__main__":
-    main()
+    start_run()
+    try:
+        main()
+    finally:
+        finish_run()
 
@@ -0,0 +1,244 @@
+"""JSON API for bettors, served next to the Streamlit apps over the same database.
+
+    python api.py [--host 127.0.0.1] [--port 8600] [--workers 8]
+
+    GET  /api/matches                  open matches with odds and custom bets
+    GET  /api/leaderboard?page=1       ranked users, LEADERBOARD_PAGE_SIZE per page
+    GET  /api/bets[?cursor=<c>]        the caller's bets, newest first (auth)
+    POST /api/bets                     place a bet (auth), body:
+         {"match_id": 1, "bet_type": "team1_win" | "draw" | "team2_win" | "custom",
+          "amount": 50, "custom_bet_id": 3}
+
+Authenticated endpoints take HTTP Basic credentials of a registered user.
+
+A Streamlit click reruns the whole page script. Here a request costs one
+call into guimabet_melhorado. The event loop only parses HTTP; every
+handler, SQLite included, runs on a bounded thread pool. Each worker
+thread keeps its pooled connection, and cached reads are shared with the
+rest of the process. Requests beyond MAX_PENDING in flight are turned away
+with 503 rather than queued behind a busy database.
+"""
+import argparse
+import asyncio
+import base64
+import concurrent.futures
+import json
+import traceback
+import urllib.parse
+
+from db import get_connection
+from guimabet_melhorado import (BET_TYPES, get_home_feed, get_leaderboard, get_user_bets_page, init_db,
+                                login, place_bet)
+
+# Threads running handlers (and so holding SQLite connections)
+WORKERS = 8
+
+# Requests in flight before new ones get 503
+MAX_PENDING = 256
+
+# Largest request body accepted (bytes)
+MAX_BODY = 16 * 1024
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Username from the request's Basic credentials, checked against the users table
+def _authenticate(headers):
+    scheme, _, credentials = headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'basic':
+        raise ApiError(401, "Autenticação necessária")
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(':')
+    except ValueError:
+        raise ApiError(401, "Credenciais inválidas")
+    if not login(username, password):
+        raise ApiError(401, "Usuário ou senha incorretos")
+    return username
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{name}' deve ser um número inteiro")
+
+
+def matches(query, headers, body):
+    return 200, {'matches': get_home_feed()}
+
+
+def leaderboard(query, headers, body):
+    page = _int(query.get('page', 1), 'page')
+    if page < 1:
+        raise ApiError(400, "'page' deve ser maior que zero")
+    rows, has_more = get_leaderboard(page)
+    return 200, {'leaderboard': rows, 'page': page, 'has_more': has_more}
+
+
+# The keyset cursor of get_user_bets_page travels as "<placed_at>:<id>"
+def bet_history(query, headers, body):
+    username = _authenticate(headers)
+    cursor = None
+    if query.get('cursor'):
+        placed_at, _, bet_id = query['cursor'].partition(':')
+        cursor = (_int(placed_at, 'cursor'), _int(bet_id, 'cursor'))
+    bets, next_cursor = get_user_bets_page(username, cursor)
+    return 200, {'bets': bets, 'next_cursor': f"{next_cursor[0]}:{next_cursor[1]}" if next_cursor else None}
+
+
+def create_bet(query, headers, body):
+    username = _authenticate(headers)
+    try:
+        bet = json.loads(body or b'{}')
+    except ValueError:
+        raise ApiError(400, "Corpo da requisição não é JSON válido")
+    if not isinstance(bet, dict):
+        raise ApiError(400, "Corpo da requisição deve ser um objeto JSON")
+
+    match_id = _int(bet.get('match_id'), 'match_id')
+    amount = _int(bet.get('amount'), 'amount')
+    bet_type = bet.get('bet_type')
+    if bet_type not in BET_TYPES:
+        raise ApiError(400, f"'bet_type' deve ser um de: {', '.join(BET_TYPES)}")
+    if amount <= 0:
+        raise ApiError(400, "'amount' deve ser positivo")
+
+    custom_bet_id = player_id = None
+    if bet_type == 'custom':
+        custom_bet_id = _int(bet.get('custom_bet_id'), 'custom_bet_id')
+        # The bet carries the custom bet's player, as it does from the app
+        row = get_connection().execute("SELECT player_id FROM custom_bets WHERE id = ?", (custom_bet_id,)).fetchone()
+        if row is None:
+            raise ApiError(404, "Aposta personalizada não encontrada")
+        player_id = row['player_id']
+
+    success, message = place_bet(username, match_id, bet_type, amount, custom_bet_id, player_id)
+    if not success:
+        raise ApiError(409, message)
+    return 201, {'message': message}
+
+
+ROUTES = {
+    ('GET', '/api/matches'): matches,
+    ('GET', '/api/leaderboard'): leaderboard,
+    ('GET', '/api/bets'): bet_history,
+    ('POST', '/api/bets'): create_bet,
+}
+
+
+# Runs on a worker thread: route, call the handler and encode the JSON body
+def _handle(method, target, headers, body):
+    url = urllib.parse.urlsplit(target)
+    handler = ROUTES.get((method, url.path))
+    try:
+        if handler is None:
+            raise ApiError(404, "Rota não encontrada")
+        query = dict(urllib.parse.parse_qsl(url.query))
+        status, payload = handler(query, headers, body)
+    except ApiError as e:
+        status, payload = e.status, {'error': str(e)}
+    return status, json.dumps(payload, ensure_ascii=False).encode()
+
+
+def _error(message):
+    return json.dumps({'error': message}, ensure_ascii=False).encode()
+
+
+class Server:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def _respond(self, writer, status, body, keep_alive):
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 401:
+            head += 'WWW-Authenticate: Basic realm="guimabet"\r\n'
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, headers, body):
+        if self.pending >= self.max_pending:
+            return 503, _error("Servidor ocupado, tente novamente")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _handle, method, target, headers, body)
+        except Exception:
+            traceback.print_exc()
+            return 500, _error("Erro interno")
+        finally:
+            self.pending -= 1
+
+    # One client connection; HTTP/1.1 keep-alive, requests answered in order
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, _error("Requisição inválida"), False)
+                    break
+                method, target, version = parts
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, _error("Corpo muito grande"), False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, payload = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    init_db()
+    print(f"GuimaBet API on http://{args.host}:{args.port} ({args.workers} workers)")
+    try:
+        asyncio.run(Server(args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
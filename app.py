@@ -1,529 +1,17 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import datetime
-import hashlib
-import os
-import random
 
-# Initialize the database if it doesn't exist
-def init_db():
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    # Create users table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        username TEXT PRIMARY KEY,
-        password TEXT,
-        points INTEGER,
-        is_admin INTEGER
-    )
-    ''')
-    
-    # Create teams table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS teams (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT
-    )
-    ''')
-    
-    # Create players table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS players (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        team_id INTEGER,
-        FOREIGN KEY (team_id) REFERENCES teams (id)
-    )
-    ''')
-    
-    # Create matches table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS matches (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        team1_id INTEGER,
-        team2_id INTEGER,
-        date TEXT,
-        time TEXT,
-        status TEXT DEFAULT 'upcoming',
-        team1_score INTEGER DEFAULT NULL,
-        team2_score INTEGER DEFAULT NULL,
-        FOREIGN KEY (team1_id) REFERENCES teams (id),
-        FOREIGN KEY (team2_id) REFERENCES teams (id)
-    )
-    ''')
-    
-    # Create odds table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS odds (
-        match_id INTEGER,
-        team1_win REAL,
-        draw REAL,
-        team2_win REAL,
-        FOREIGN KEY (match_id) REFERENCES matches (id)
-    )
-    ''')
-    
-    # Create bets table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS bets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        match_id INTEGER,
-        bet_type TEXT,
-        amount INTEGER,
-        status TEXT DEFAULT 'pending',
-        timestamp TEXT,
-        custom_bet_id INTEGER DEFAULT NULL,
-        player_id INTEGER DEFAULT NULL,
-        FOREIGN KEY (user_id) REFERENCES users (username),
-        FOREIGN KEY (match_id) REFERENCES matches (id),
-        FOREIGN KEY (custom_bet_id) REFERENCES custom_bets (id),
-        FOREIGN KEY (player_id) REFERENCES players (id)
-    )
-    ''')
-    
-    # Create custom bets table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS custom_bets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        match_id INTEGER,
-        description TEXT,
-        odds REAL,
-        player_id INTEGER DEFAULT NULL,
-        status TEXT DEFAULT 'pending',
-        result TEXT DEFAULT NULL,
-        FOREIGN KEY (match_id) REFERENCES matches (id),
-        FOREIGN KEY (player_id) REFERENCES players (id)
-    )
-    ''')
-    
-    # Insert default admin user if not exists
-    c.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not c.fetchone():
-        hashed_password = hashlib.sha256("123".encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
-                 ("admin", hashed_password, 1000, 1))
-    
-    # Insert default teams if not exists
-    default_teams = ["Tropa da Sônia", "Cubanos", "Dynamos", "Os Feras", "Gaviões", "Leões do Recreio"]
-    for team in default_teams:
-        c.execute("SELECT * FROM teams WHERE name = ?", (team,))
-        if not c.fetchone():
-            c.execute("INSERT INTO teams (name) VALUES (?)", (team,))
-    
-    conn.commit()
-    conn.close()
-
-# Get team name by ID
-def get_team_name(team_id):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    c.execute("SELECT name FROM teams WHERE id = ?", (team_id,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else "Unknown Team"
-
-# Get player name by ID
-def get_player_name(player_id):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    c.execute("SELECT name FROM players WHERE id = ?", (player_id,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else "Unknown Player"
-
-# Login function
-def login(username, password):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hashed_password))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-# Register function
-def register(username, password):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    try:
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
-                 (username, hashed_password, 100, 0))
-        conn.commit()
-        conn.close()
-        return True
-    except:
-        conn.close()
-        return False
-
-# Get upcoming matches
-def get_upcoming_matches():
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute('''
-    SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
-           o.team1_win, o.draw, o.team2_win
-    FROM matches m
-    LEFT JOIN odds o ON m.id = o.match_id
-    WHERE m.status = 'upcoming' OR m.status = 'live'
-    ORDER BY m.date, m.time
-    ''')
-    matches = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return matches
-
-# Get match history
-def get_match_history():
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute('''
-    SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
-           o.team1_win, o.draw, o.team2_win
-    FROM matches m
-    LEFT JOIN odds o ON m.id = o.match_id
-    WHERE m.status = 'completed'
-    ORDER BY m.date DESC, m.time DESC
-    ''')
-    matches = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return matches
-
-# Get custom bets for a match
-def get_custom_bets(match_id=None):
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    if match_id:
-        c.execute('''
-        SELECT * FROM custom_bets WHERE match_id = ? AND status = 'pending'
-        ''', (match_id,))
-    else:
-        c.execute('SELECT * FROM custom_bets WHERE status = "pending"')
-    
-    custom_bets = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return custom_bets
-
-# Get user bets
-def get_user_bets(username):
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute('''
-    SELECT b.id, b.match_id, b.bet_type, b.amount, b.status, b.timestamp, b.custom_bet_id, b.player_id,
-           m.team1_id, m.team2_id, m.date, m.time, m.status as match_status, m.team1_score, m.team2_score
-    FROM bets b
-    JOIN matches m ON b.match_id = m.id
-    WHERE b.user_id = ?
-    ORDER BY b.timestamp DESC
-    ''', (username,))
-    bets = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return bets
-
-# Place bet function
-def place_bet(username, match_id, bet_type, amount, custom_bet_id=None, player_id=None):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    # Check if user has enough points
-    c.execute("SELECT points FROM users WHERE username = ?", (username,))
-    user_points = c.fetchone()[0]
-    
-    if user_points < amount:
-        conn.close()
-        return False, "Pontos insuficientes"
-    
-    # Check if match is still open for betting
-    c.execute("SELECT status FROM matches WHERE id = ?", (match_id,))
-    match_status = c.fetchone()[0]
-    
-    if match_status != 'upcoming' and match_status != 'live':
-        conn.close()
-        return False, "Apostas fechadas para este jogo"
-    
-    # Update user points
-    c.execute("UPDATE users SET points = points - ? WHERE username = ?", (amount, username))
-    
-    # Record the bet
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute('''
-    INSERT INTO bets (user_id, match_id, bet_type, amount, status, timestamp, custom_bet_id, player_id)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (username, match_id, bet_type, amount, 'pending', timestamp, custom_bet_id, player_id))
-    
-    conn.commit()
-    conn.close()
-    return True, "Aposta realizada com sucesso!"
-
-# Admin functions
-def add_match(team1_id, team2_id, date, time):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    c.execute('''
-    INSERT INTO matches (team1_id, team2_id, date, time, status)
-    VALUES (?, ?, ?, ?, ?)
-    ''', (team1_id, team2_id, date, time, 'upcoming'))
-    
-    match_id = c.lastrowid
-    
-    # Generate random odds (slightly favoring team1 for this example)
-    team1_win = round(random.uniform(1.5, 3.0), 2)
-    draw = round(random.uniform(2.0, 4.0), 2)
-    team2_win = round(random.uniform(1.8, 3.5), 2)
-    
-    c.execute('''
-    INSERT INTO odds (match_id, team1_win, draw, team2_win)
-    VALUES (?, ?, ?, ?)
-    ''', (match_id, team1_win, draw, team2_win))
-    
-    conn.commit()
-    conn.close()
-    return True
-
-def update_match_result(match_id, team1_score, team2_score):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    # Update match status and scores
-    c.execute('''
-    UPDATE matches 
-    SET status = 'completed', team1_score = ?, team2_score = ?
-    WHERE id = ?
-    ''', (team1_score, team2_score, match_id))
-    
-    # Determine match result
-    if team1_score > team2_score:
-        result = 'team1_win'
-    elif team1_score < team2_score:
-        result = 'team2_win'
-    else:
-        result = 'draw'
-    
-    # Get all standard bets for this match
-    c.execute('''
-    SELECT id, user_id, bet_type, amount FROM bets 
-    WHERE match_id = ? AND status = 'pending' AND custom_bet_id IS NULL
-    ''', (match_id,))
-    bets = c.fetchall()
-    
-    # Get odds for this match
-    c.execute('''
-    SELECT team1_win, draw, team2_win FROM odds
-    WHERE match_id = ?
-    ''', (match_id,))
-    odds = c.fetchone()
-    
-    # Process standard bets
-    for bet_id, user_id, bet_type, amount in bets:
-        if bet_type == result:
-            # Winning bet - user gets back stake + winnings based on odds
-            odds_value = odds[0] if bet_type == 'team1_win' else odds[1] if bet_type == 'draw' else odds[2]
-            winnings = int(amount * odds_value)
-            c.execute("UPDATE users SET points = points + ? WHERE username = ?", (winnings + amount, user_id))
-            c.execute("UPDATE bets SET status = 'won' WHERE id = ?", (bet_id,))
-        else:
-            # Losing bet - user already lost stake when placing bet, just update status
-            c.execute("UPDATE bets SET status = 'lost' WHERE id = ?", (bet_id,))
-    
-    conn.commit()
-    conn.close()
-    return True
-
-def set_match_live(match_id):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    c.execute("UPDATE matches SET status = 'live' WHERE id = ?", (match_id,))
-    conn.commit()
-    conn.close()
-    return True
-
-def add_team(name):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO teams (name) VALUES (?)", (name,))
-        conn.commit()
-        conn.close()
-        return True
-    except:
-        conn.close()
-        return False
-
-def add_player(name, team_id):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO players (name, team_id) VALUES (?, ?)", (name, team_id))
-        conn.commit()
-        conn.close()
-        return True
-    except:
-        conn.close()
-        return False
-
-def add_custom_bet(match_id, description, odds, player_id=None):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    try:
-        c.execute('''
-        INSERT INTO custom_bets (match_id, description, odds, player_id, status)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (match_id, description, odds, player_id, 'pending'))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(e)
-        conn.close()
-        return False
+from cache import LIVE_REFRESH_SECONDS, reload_if_changed
+from guimabet_melhorado import *
+from profiler import finish_run, set_page, start_run
+from widgets import settlement_progress
 
-def update_custom_bet_result(custom_bet_id, result):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    # Update custom bet status and result
-    c.execute('''
-    UPDATE custom_bets 
-    SET status = 'completed', result = ?
-    WHERE id = ?
-    ''', (result, custom_bet_id))
-    
-    # Get all bets for this custom bet
-    c.execute('''
-    SELECT id, user_id, amount FROM bets 
-    WHERE custom_bet_id = ? AND status = 'pending'
-    ''', (custom_bet_id,))
-    bets = c.fetchall()
-    
-    # Get custom bet odds
-    c.execute('''
-    SELECT odds FROM custom_bets
-    WHERE id = ?
-    ''', (custom_bet_id,))
-    odds = c.fetchone()[0]
-    
-    # Process bets
-    for bet_id, user_id, amount in bets:
-        if result == 'yes':
-            # Winning bet
-            winnings = int(amount * odds)
-            c.execute("UPDATE users SET points = points + ? WHERE username = ?", (winnings + amount, user_id))
-            c.execute("UPDATE bets SET status = 'won' WHERE id = ?", (bet_id,))
-        else:
-            # Losing bet
-            c.execute("UPDATE bets SET status = 'lost' WHERE id = ?", (bet_id,))
-    
-    conn.commit()
-    conn.close()
-    return True
-
-def get_all_teams():
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM teams ORDER BY name")
-    teams = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return teams
-
-def get_all_players():
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM players ORDER BY name")
-    players = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return players
-
-def get_team_players(team_id):
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM players WHERE team_id = ? ORDER BY name", (team_id,))
-    players = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return players
-
-def get_match_players(match_id):
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute('''
-    SELECT p.* FROM players p
-    JOIN matches m ON (p.team_id = m.team1_id OR p.team_id = m.team2_id)
-    WHERE m.id = ?
-    ORDER BY p.name
-    ''', (match_id,))
-    players = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return players
-
-def get_all_users():
-    conn = sqlite3.connect('guimabet.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT username, points, is_admin FROM users ORDER BY points DESC")
-    users = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return users
-
-def update_user_points(username, points):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    c.execute("UPDATE users SET points = ? WHERE username = ?", (points, username))
-    conn.commit()
-    conn.close()
-    return True
-
-def update_user(username, new_username=None, new_points=None, is_admin=None):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    if new_username and new_username != username:
-        # Check if new username already exists
-        c.execute("SELECT * FROM users WHERE username = ?", (new_username,))
-        if c.fetchone():
-            conn.close()
-            return False, "Nome de usuário já existe."
-        
-        # Update username in users table
-        c.execute("UPDATE users SET username = ? WHERE username = ?", (new_username, username))
-        
-        # Update username in bets table
-        c.execute("UPDATE bets SET user_id = ? WHERE user_id = ?", (new_username, username))
-        
-        username = new_username
-    
-    if new_points is not None:
-        c.execute("UPDATE users SET points = ? WHERE username = ?", (new_points, username))
-    
-    if is_admin is not None:
-        c.execute("UPDATE users SET is_admin = ? WHERE username = ?", (1 if is_admin else 0, username))
-    
-    conn.commit()
-    conn.close()
-    return True, "Usuário atualizado com sucesso!"
-
-def delete_user(username):
-    conn = sqlite3.connect('guimabet.db')
-    c = conn.cursor()
-    
-    # Delete user's bets first
-    c.execute("DELETE FROM bets WHERE user_id = ?", (username,))
-    
-    # Delete user
-    c.execute("DELETE FROM users WHERE username = ?", (username,))
-    
-    conn.commit()
-    conn.close()
+# Schema migrations and the settlement worker only need to run once per
+# process, not on every Streamlit rerun
+@st.cache_resource
+def bootstrap():
+    init_db()
+    start_worker()
     return True
 
 # Page setup
@@ -535,8 +23,8 @@ def main():
         initial_sidebar_state="expanded"
     )
     
-    # Initialize database
-    init_db()
+    # Initialize database (once per process)
+    bootstrap()
     
     # Custom CSS
     st.markdown("""
@@ -628,6 +116,7 @@ def main():
     
     # If not logged in, show login/register page
     if not st.session_state.logged_in:
+        set_page("login")
         login_register_page()
     else:
         # Sidebar for navigation
@@ -635,11 +124,7 @@ def main():
             st.write(f"Bem-vindo, **{st.session_state.username}**!")
             
             # Get user points
-            conn = sqlite3.connect('guimabet.db')
-            c = conn.cursor()
-            c.execute("SELECT points FROM users WHERE username = ?", (st.session_state.username,))
-            user_points = c.fetchone()[0]
-            conn.close()
+            user_points = get_user_points(st.session_state.username)
             
             st.write(f"Seus pontos: **{user_points}**")
             
@@ -650,6 +135,7 @@ def main():
             
             if st.button(" Histórico de Apostas"):
                 st.session_state.page = "bet_history"
+                st.session_state.pop('history_bets', None)
             
             if st.button(" Ranking"):
                 st.session_state.page = "ranking"
@@ -664,13 +150,14 @@ def main():
                 st.session_state.logged_in = False
                 st.session_state.username = ""
                 st.session_state.is_admin = False
-                st.experimental_rerun()
+                st.rerun()
         
         # Default page
         if 'page' not in st.session_state:
             st.session_state.page = "home"
         
         # Page router
+        set_page(st.session_state.page)
         if st.session_state.page == "home":
             home_page()
         elif st.session_state.page == "bet_history":
@@ -698,7 +185,7 @@ def login_register_page():
                     st.session_state.logged_in = True
                     st.session_state.username = login_username
                     st.session_state.is_admin = (user[3] == 1)  # Check if user is admin
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error("Usuário ou senha incorretos.")
     
@@ -719,18 +206,19 @@ def login_register_page():
                 else:
                     st.error("Nome de usuário já existe.")
 
-# Home page - Upcoming matches and betting
-def home_page():
-    st.subheader("Jogos Disponíveis para Apostas")
-    
-    upcoming_matches = get_upcoming_matches()
+# Match cards with their odds and custom bets. Reruns on its own every
+# LIVE_REFRESH_SECONDS, but only reloads the feed when feed_generation has
+# moved; an idle tab costs one small query per refresh.
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_match_feed():
+    upcoming_matches = reload_if_changed(st.session_state, 'home_feed', get_home_feed)
     
     if not upcoming_matches:
         st.info("Não há jogos programados no momento.")
     else:
         for match in upcoming_matches:
-            team1 = get_team_name(match['team1_id'])
-            team2 = get_team_name(match['team2_id'])
+            team1 = match['team1_name']
+            team2 = match['team2_name']
             
             with st.container():
                 st.markdown(f"""
@@ -753,36 +241,51 @@ def home_page():
                     if st.button(f"{team1} Vence (Odds: {match['team1_win']})", key=f"team1_{match['id']}"):
                         st.session_state.selected_match = match
                         st.session_state.bet_type = "team1_win"
+                        st.rerun()
                 
                 with col2:
                     if st.button(f"Empate (Odds: {match['draw']})", key=f"draw_{match['id']}"):
                         st.session_state.selected_match = match
                         st.session_state.bet_type = "draw"
+                        st.rerun()
                 
                 with col3:
                     if st.button(f"{team2} Vence (Odds: {match['team2_win']})", key=f"team2_{match['id']}"):
                         st.session_state.selected_match = match
                         st.session_state.bet_type = "team2_win"
+                        st.rerun()
                 
                 # Custom bets for this match
-                custom_bets = get_custom_bets(match['id'])
+                custom_bets = match['custom_bets']
                 if custom_bets:
                     st.write("Apostas Personalizadas:")
                     for custom_bet in custom_bets:
                         player_info = ""
                         if custom_bet['player_id']:
-                            player_info = f" - {get_player_name(custom_bet['player_id'])}"
+                            player_info = f" - {custom_bet['player_name']}"
                         
                         if st.button(f"{custom_bet['description']}{player_info} (Odds: {custom_bet['odds']})", key=f"custom_{custom_bet['id']}"):
                             st.session_state.selected_match = match
                             st.session_state.bet_type = "custom"
                             st.session_state.custom_bet_id = custom_bet['id']
-        
+                            st.rerun()
+
+# Home page - Upcoming matches and betting
+def home_page():
+    st.subheader("Jogos Disponíveis para Apostas")
+    
+    live_match_feed()
+    
+    # Picking odds in the feed reruns the whole page, so the form shows here
+    upcoming_matches = reload_if_changed(st.session_state, 'home_feed', get_home_feed)
+    if upcoming_matches:
         # If a match is selected, show betting form
         if st.session_state.selected_match:
-            match = st.session_state.selected_match
-            team1 = get_team_name(match['team1_id'])
-            team2 = get_team_name(match['team2_id'])
+            # Prefer the current feed entry so odds and custom bets are fresh
+            feed_by_id = {m['id']: m for m in upcoming_matches}
+            match = feed_by_id.get(st.session_state.selected_match['id'], st.session_state.selected_match)
+            team1 = match['team1_name']
+            team2 = match['team2_name']
             
             st.markdown("---")
             st.subheader("Fazer Aposta")
@@ -797,12 +300,13 @@ def home_page():
                 bet_text = f"Aposta: {team2} vence"
                 odds = match['team2_win']
             else:  # Custom bet
-                custom_bet = next((cb for cb in get_custom_bets() if cb['id'] == st.session_state.custom_bet_id), None)
+                custom_bets_by_id = {cb['id']: cb for cb in match['custom_bets']}
+                custom_bet = custom_bets_by_id.get(st.session_state.custom_bet_id)
                 if custom_bet:
                     bet_description = custom_bet['description']
                     player_info = ""
                     if custom_bet['player_id']:
-                        player_info = f" - {get_player_name(custom_bet['player_id'])}"
+                        player_info = f" - {custom_bet['player_name']}"
                     
                     bet_text = f"Aposta Personalizada: {bet_description}{player_info}"
                     odds = custom_bet['odds']
@@ -811,18 +315,14 @@ def home_page():
                     st.session_state.selected_match = None
                     st.session_state.bet_type = None
                     st.session_state.custom_bet_id = None
-                    st.experimental_rerun()
+                    st.rerun()
             
             st.write(f"{team1} vs {team2}")
             st.write(bet_text)
             st.write(f"Odds: {odds}")
             
             # Get user points
-            conn = sqlite3.connect('guimabet.db')
-            c = conn.cursor()
-            c.execute("SELECT points FROM users WHERE username = ?", (st.session_state.username,))
-            user_points = c.fetchone()[0]
-            conn.close()
+            user_points = get_user_points(st.session_state.username)
             
             st.write(f"Seus pontos: {user_points}")
             
@@ -849,7 +349,7 @@ def home_page():
                     st.session_state.selected_match = None
                     st.session_state.bet_type = None
                     st.session_state.custom_bet_id = None
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error(message)
             
@@ -857,33 +357,68 @@ def home_page():
                 st.session_state.selected_match = None
                 st.session_state.bet_type = None
                 st.session_state.custom_bet_id = None
-                st.experimental_rerun()
+                st.rerun()
+
+    # Players suggest custom bets; an admin approves or rejects them in the
+    # admin panel's "Propostas de Usuários" page
+    st.markdown("---")
+    st.subheader("Sugerir Aposta Personalizada")
+    
+    if upcoming_matches:
+        match_options = {m['id']: f"{m['team1_name']} vs {m['team2_name']} - {m['date']} {m['time']}" for m in upcoming_matches}
+        
+        with st.form(key="proposal_form", clear_on_submit=True):
+            proposal_match = st.selectbox("Jogo", options=list(match_options.keys()), format_func=lambda x: match_options[x])
+            proposal_description = st.text_input("Descrição da aposta", key="proposal_description")
+            proposal_odds = st.number_input("Odds sugeridas", min_value=1.01, value=2.0, step=0.1, key="proposal_odds")
+            
+            submit_proposal = st.form_submit_button("Enviar Proposta")
+        
+        if submit_proposal:
+            if not proposal_description.strip():
+                st.error("Por favor, descreva a aposta.")
+            else:
+                success, message = propose_custom_bet(st.session_state.username, proposal_match,
+                                                      proposal_description.strip(), proposal_odds)
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
+    else:
+        st.info("Não há jogos abertos para propostas.")
+    
+    my_proposals = get_custom_bet_proposals(username=st.session_state.username)
+    if my_proposals:
+        st.write("Suas Propostas:")
+        status_labels = {'pending': "Em análise", 'approved': "Aprovada", 'rejected': "Rejeitada"}
+        for proposal in my_proposals:
+            st.write(f"{proposal['team1_name']} vs {proposal['team2_name']}: {proposal['description']} "
+                     f"(Odds: {proposal['proposed_odds']}) - {status_labels.get(proposal['status'], proposal['status'])}")
+            if proposal['admin_response']:
+                st.caption(f"Resposta: {proposal['admin_response']}")
 
 # Bet history page
 def bet_history_page():
     st.subheader("Seu Histórico de Apostas")
     
-    bets = get_user_bets(st.session_state.username)
+    # Pages loaded so far live in the session; "Carregar mais" fetches the next one
+    if 'history_bets' not in st.session_state:
+        st.session_state.history_bets, st.session_state.history_cursor = get_user_bets_page(st.session_state.username)
+    bets = st.session_state.history_bets
     
     if not bets:
         st.info("Você ainda não fez nenhuma aposta.")
     else:
         for bet in bets:
-            team1 = get_team_name(bet['team1_id'])
-            team2 = get_team_name(bet['team2_id'])
+            team1 = bet['team1_name']
+            team2 = bet['team2_name']
             
             # Determine bet description
             if bet['custom_bet_id']:
-                conn = sqlite3.connect('guimabet.db')
-                c = conn.cursor()
-                c.execute("SELECT description, player_id FROM custom_bets WHERE id = ?", (bet['custom_bet_id'],))
-                custom_bet = c.fetchone()
-                conn.close()
-                
-                if custom_bet:
-                    bet_description = custom_bet['description']
-                    if custom_bet['player_id']:
-                        bet_description += f" - {get_player_name(custom_bet['player_id'])}"
+                if bet['custom_description'] is not None:
+                    bet_description = bet['custom_description']
+                    if bet['custom_player_name']:
+                        bet_description += f" - {bet['custom_player_name']}"
                 else:
                     bet_description = "Aposta Personalizada"
             else:
@@ -916,7 +451,7 @@ def bet_history_page():
                     <div>
                         <h4>{team1} vs {team2}</h4>
                         <p>Data: {bet['date']} • Aposta: {bet_description}</p>
-                        <p>Valor: {bet['amount']} pontos • Data da aposta: {bet['timestamp']}</p>
+                        <p>Valor: {bet['amount']} pontos • Odds: {bet['odds']} • Data da aposta: {bet['timestamp']}</p>
                         <p>{match_result}</p>
                     </div>
                     <div>
@@ -925,22 +460,50 @@ def bet_history_page():
                 </div>
             </div>
             """, unsafe_allow_html=True)
+        
+        if st.session_state.history_cursor and st.button("Carregar mais"):
+            more, st.session_state.history_cursor = get_user_bets_page(
+                st.session_state.username, st.session_state.history_cursor)
+            st.session_state.history_bets = bets + more
+            st.rerun()
 
 # Ranking page
 def ranking_page():
     st.subheader("Ranking de Usuários")
     
-    users = get_all_users()
+    if 'ranking_page' not in st.session_state:
+        st.session_state.ranking_page = 1
+    page = st.session_state.ranking_page
     
-    # Create a pandas DataFrame
-    df = pd.DataFrame(users)
-    df.columns = ['Usuário', 'Pontos', 'Admin']
-    df = df.drop(columns=['Admin'])
+    rows, has_more = get_leaderboard(page)
     
-    # Add rank column
-    df.insert(0, 'Posição', range(1, len(df) + 1))
+    if not rows:
+        st.info("Nenhum usuário nesta página.")
+    else:
+        df = pd.DataFrame(rows, columns=['rank', 'username', 'points'])
+        df.columns = ['Posição', 'Usuário', 'Pontos']
+        st.table(df)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if page > 1 and st.button("Anterior"):
+            st.session_state.ranking_page = page - 1
+            st.rerun()
     
-    st.table(df)
+    with col2:
+        st.write(f"Página {page}")
+    
+    with col3:
+        if has_more and st.button("Próxima"):
+            st.session_state.ranking_page = page + 1
+            st.rerun()
+    
+    # The logged-in user's own row, when it isn't on this page
+    me = get_user_rank(st.session_state.username)
+    if me and not any(row['username'] == me['username'] for row in rows):
+        st.markdown("---")
+        st.write(f"Sua posição: **{me['rank']}º** • {me['points']} pontos")
 
 # Admin page
 def admin_page():
@@ -951,6 +514,8 @@ def admin_page():
     with tab1:
         st.subheader("Gerenciar Jogos")
         
+        settlement_progress()
+        
         upcoming_matches = get_upcoming_matches()
         completed_matches = get_match_history()
         
@@ -959,8 +524,8 @@ def admin_page():
             st.info("Não há jogos próximos.")
         else:
             for match in upcoming_matches:
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
+                team1 = match['team1_name']
+                team2 = match['team2_name']
                 
                 with st.container():
                     st.markdown(f"""
@@ -978,7 +543,7 @@ def admin_page():
                             if st.button("Definir como Ao Vivo", key=f"live_{match['id']}"):
                                 set_match_live(match['id'])
                                 st.success("Jogo definido como Ao Vivo!")
-                                st.experimental_rerun()
+                                st.rerun()
                     
                     with col2:
                         if st.button("Atualizar Resultado", key=f"result_{match['id']}"):
@@ -995,16 +560,16 @@ def admin_page():
                             team2_score = st.number_input(f"Placar {team2}", min_value=0, value=0, key=f"score2_{match['id']}")
                         
                         if st.button("Salvar Resultado"):
-                            update_match_result(match['id'], team1_score, team2_score)
-                            st.success("Resultado atualizado com sucesso!")
+                            enqueue_match_settlement(match['id'], team1_score, team2_score)
+                            st.success("Resultado salvo! As apostas estão sendo liquidadas.")
                             if 'update_match' in st.session_state:
                                 del st.session_state.update_match
-                            st.experimental_rerun()
+                            st.rerun()
                         
                         if st.button("Cancelar", key=f"cancel_update_{match['id']}"):
                             if 'update_match' in st.session_state:
                                 del st.session_state.update_match
-                            st.experimental_rerun()
+                            st.rerun()
         
         st.markdown("---")
         st.write("Jogos Finalizados")
@@ -1013,8 +578,8 @@ def admin_page():
             st.info("Não há jogos finalizados.")
         else:
             for match in completed_matches:
-                team1 = get_team_name(match['team1_id'])
-                team2 = get_team_name(match['team2_id'])
+                team1 = match['team1_name']
+                team2 = match['team2_name']
                 
                 st.markdown(f"""
                 <div class="match-card">
@@ -1076,7 +641,7 @@ def admin_page():
                     success, message = update_user(user['username'], new_username, new_points, is_admin)
                     if success:
                         st.success(message)
-                        st.experimental_rerun()
+                        st.rerun()
                     else:
                         st.error(message)
                 
@@ -1087,7 +652,7 @@ def admin_page():
                         if st.button(f"Confirmar exclusão de {user['username']}?", key=f"confirm_delete_{user['username']}"):
                             delete_user(user['username'])
                             st.success(f"Usuário {user['username']} excluído com sucesso!")
-                            st.experimental_rerun()
+                            st.rerun()
         
         st.markdown("---")
         st.subheader("Adicionar Novo Usuário")
@@ -1104,18 +669,10 @@ def admin_page():
             if not new_user_username or not new_user_password:
                 st.error("Por favor, preencha todos os campos.")
             else:
-                conn = sqlite3.connect('guimabet.db')
-                c = conn.cursor()
-                try:
-                    hashed_password = hashlib.sha256(new_user_password.encode()).hexdigest()
-                    c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
-                             (new_user_username, hashed_password, new_user_points, 1 if new_user_admin else 0))
-                    conn.commit()
-                    conn.close()
+                if register(new_user_username, new_user_password, new_user_points, new_user_admin):
                     st.success("Usuário adicionado com sucesso!")
-                    st.experimental_rerun()
-                except:
-                    conn.close()
+                    st.rerun()
+                else:
                     st.error("Nome de usuário já existe.")
     
     with tab4:
@@ -1136,7 +693,7 @@ def admin_page():
             else:
                 if add_player(player_name, player_team_id):
                     st.success("Jogador adicionado com sucesso!")
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error("Erro ao adicionar jogador.")
         
@@ -1164,7 +721,7 @@ def admin_page():
             else:
                 if add_team(team_name):
                     st.success("Time adicionado com sucesso!")
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error("Erro ao adicionar time.")
         
@@ -1179,5 +736,11 @@ def admin_page():
             for team in teams:
                 st.write(f"• {team['name']}")
 
+# Every script run is profiled (see profiler.py); st.rerun() ends a run
+# with an exception, hence the finally
 if __name__ == "__main__":
-    main()
+    start_run()
+    try:
+        main()
+    finally:
+        finish_run()
@@ -0,0 +1,173 @@
+"""Load test bet placement through api.py against the Streamlit rerun path.
+
+    python benchmarks/bench_api.py [--bets 20000] [--requests 2000] [--concurrency 1 16 64] [--workers 8]
+
+Builds a loadgen database and starts `python api.py` on it in a separate
+process. Then, for each concurrency level, that many keep-alive clients
+POST /api/bets as different users until --requests bets are placed, and
+the same is done for GET /api/matches. Reports requests/s and p50/p99
+latency.
+
+The Streamlit path is the logged-in home page run through AppTest: a bet
+is the odds click that opens the form plus the "Confirmar Aposta" click,
+each a full script rerun. It is measured at concurrency 1 with no
+websocket or browser rendering in the loop, which favours it.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import loadgen
+
+STREAMLIT_BETS = 100
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_api(path, port, workers):
+    env = dict(os.environ, GUIMABET_DB=path)
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "api.py"), "--port", str(port),
+                                "--workers", str(workers)], env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("api.py did not start")
+
+
+class Client:
+    def __init__(self, reader, writer, username):
+        self.reader = reader
+        self.writer = writer
+        token = base64.b64encode(f"{username}:senha".encode()).decode()
+        self.auth = f"Authorization: Basic {token}\r\n"
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\n{self.auth}"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+
+async def run_clients(port, concurrency, requests, make_request):
+    latencies, failures = [], []
+    remaining = iter(range(requests))
+
+    async def client(index):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        client = Client(reader, writer, f"user{index}")
+        for n in remaining:
+            start = time.perf_counter()
+            status = await client.request(*make_request(index, n))
+            latencies.append(time.perf_counter() - start)
+            if status >= 300:
+                failures.append(status)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def report(name, concurrency, latencies, failures, elapsed):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{name:<24} | {concurrency:>4} | {len(latencies) / elapsed:>9.0f} | {quantiles[49] * 1000:>8.2f} | "
+          f"{quantiles[98] * 1000:>8.2f} | {len(failures):>6}")
+
+
+def streamlit_bets(path, username, match_id):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['GUIMABET_DB'] = path
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.session_state.logged_in = True
+    at.session_state.username = username
+    at.run()
+
+    # Picking the odds opens the form (one rerun); confirming places the
+    # bet and reruns again to close it
+    latencies = []
+    for _ in range(STREAMLIT_BETS):
+        start = time.perf_counter()
+        at.button(key=f"draw_{match_id}").click().run()
+        next(b for b in at.button if b.label == "Confirmar Aposta").click().run()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bets", type=int, default=20000, help="bets in the generated database")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.db")
+        users = max(max(args.concurrency), 100)
+        loadgen.generate(path, users=users, bets=args.bets, matches=200)
+        conn = db.get_connection()
+        conn.execute("UPDATE users SET points = 1000000000")
+        conn.commit()
+        open_matches = [row[0] for row in conn.execute("SELECT id FROM matches WHERE status IN ('upcoming', 'live')")]
+        db.release_connection()
+
+        def bet(index, n):
+            return "POST", "/api/bets", {'match_id': open_matches[n % len(open_matches)], 'bet_type': 'draw',
+                                         'amount': 10}
+
+        def feed(index, n):
+            return "GET", "/api/matches"
+
+        port = free_port()
+        process = start_api(path, port, args.workers)
+        print(f"{'path':<24} | {'conc':>4} | {'req/s':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'errors':>6}")
+        try:
+            for concurrency in args.concurrency:
+                report("api POST /api/bets", concurrency,
+                       *asyncio.run(run_clients(port, concurrency, args.requests, bet)))
+            for concurrency in args.concurrency:
+                report("api GET /api/matches", concurrency,
+                       *asyncio.run(run_clients(port, concurrency, args.requests, feed)))
+        finally:
+            process.terminate()
+            process.wait()
+
+        start = time.perf_counter()
+        latencies = streamlit_bets(path, "user0", open_matches[0])
+        report("streamlit bet (2 clicks)", 1, latencies, [], time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Time the database bootstrap a Streamlit rerun used to pay.
+
+    python benchmarks/bench_bootstrap.py [--reruns 200]
+
+"legacy" is the old init_db(): a fresh connection, the CREATE TABLE IF NOT
+EXISTS statements, the admin lookup and the default-team SELECTs on every
+rerun. "migrate" is init_db() today on an up-to-date database: a single
+PRAGMA user_version read. With bootstrap() behind st.cache_resource even
+that runs only once per process.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from migrations import migrate
+
+LEGACY_TABLES = [
+    "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, points INTEGER, is_admin INTEGER)",
+    "CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)",
+    "CREATE TABLE IF NOT EXISTS players (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, team_id INTEGER)",
+    "CREATE TABLE IF NOT EXISTS matches (id INTEGER PRIMARY KEY AUTOINCREMENT, team1_id INTEGER, team2_id INTEGER, date TEXT, time TEXT, status TEXT DEFAULT 'upcoming', team1_score INTEGER DEFAULT NULL, team2_score INTEGER DEFAULT NULL)",
+    "CREATE TABLE IF NOT EXISTS odds (match_id INTEGER, team1_win REAL, draw REAL, team2_win REAL)",
+    "CREATE TABLE IF NOT EXISTS bets (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, match_id INTEGER, bet_type TEXT, amount INTEGER, status TEXT DEFAULT 'pending', timestamp TEXT, custom_bet_id INTEGER DEFAULT NULL, player_id INTEGER DEFAULT NULL)",
+    "CREATE TABLE IF NOT EXISTS custom_bets (id INTEGER PRIMARY KEY AUTOINCREMENT, match_id INTEGER, description TEXT, odds REAL, player_id INTEGER DEFAULT NULL, status TEXT DEFAULT 'pending', result TEXT DEFAULT NULL)",
+]
+
+
+# init_db() as every rerun ran it before migrations
+def legacy_init_db(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    for sql in LEGACY_TABLES:
+        c.execute(sql)
+    c.execute("SELECT * FROM users WHERE username = 'admin'")
+    if not c.fetchone():
+        c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
+                  ("admin", hashlib.sha256("123".encode()).hexdigest(), 1000, 1))
+    for team in ["Tropa da Sônia", "Cubanos", "Dynamos", "Os Feras", "Gaviões", "Leões do Recreio"]:
+        c.execute("SELECT * FROM teams WHERE name = ?", (team,))
+        if not c.fetchone():
+            c.execute("INSERT INTO teams (name) VALUES (?)", (team,))
+    conn.commit()
+    conn.close()
+
+
+def per_call_ms(fn, reruns):
+    start = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - start) / reruns * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reruns", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        legacy_init_db(legacy_path)
+        legacy = per_call_ms(lambda: legacy_init_db(legacy_path), args.reruns)
+
+        db.set_db_path(os.path.join(tmp, "migrated.db"))
+        start = time.perf_counter()
+        migrate()
+        first = (time.perf_counter() - start) * 1000
+        current = per_call_ms(migrate, args.reruns)
+        db.release_connection()
+
+    print(f"legacy init_db per rerun:        {legacy:8.3f} ms")
+    print(f"migrate() on an empty database:  {first:8.3f} ms (once)")
+    print(f"migrate() on a current schema:   {current:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compare opening a connection per call with the pooled thread-local connection.
+
+    python benchmarks/bench_connection_pool.py [--calls 1000 10000 100000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+def setup_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE teams (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)")
+    conn.executemany("INSERT INTO teams (name) VALUES (?)", [(f"Time {i}",) for i in range(50)])
+    conn.commit()
+    conn.close()
+
+
+# The pattern every data function used before: connect, query, close
+def connect_per_call(path, calls):
+    for i in range(calls):
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        c.execute("SELECT name FROM teams WHERE id = ?", (i % 50 + 1,))
+        c.fetchone()
+        conn.close()
+
+
+def pooled(calls):
+    for i in range(calls):
+        c = db.get_connection().cursor()
+        c.execute("SELECT name FROM teams WHERE id = ?", (i % 50 + 1,))
+        c.fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        setup_database(path)
+        db.set_db_path(path)
+
+        print(f"{'calls':>8} | {'connect/call (s)':>16} | {'pooled (s)':>10} | {'speedup':>7}")
+        for calls in args.calls:
+            start = time.perf_counter()
+            connect_per_call(path, calls)
+            legacy = time.perf_counter() - start
+
+            start = time.perf_counter()
+            pooled(calls)
+            pool = time.perf_counter() - start
+
+            print(f"{calls:>8} | {legacy:>16.3f} | {pool:>10.3f} | {legacy / pool:>6.1f}x")
+
+        db.release_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Time the bet/match ordering and range queries on text vs epoch columns.
+
+    python benchmarks/bench_epoch_ordering.py [--bets 1000000] [--matches 20000]
+
+"text" runs each query the way it was written against bets.timestamp and
+matches.date/time, with the v2 text indexes recreated so it gets the same
+help it had before; "epoch" runs the current query on placed_at/starts_at.
+Each timing is the median of several runs.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+
+USERS = 5000
+RUNS = 7
+START = 1767225600  # 2026-01-01 00:00:00
+SPAN = 365 * 86400
+
+QUERIES = [
+    ("bet history page",
+     "SELECT * FROM bets WHERE user_id = 'user7' ORDER BY timestamp DESC, id DESC LIMIT 21",
+     "SELECT * FROM bets WHERE user_id = 'user7' ORDER BY placed_at DESC, id DESC LIMIT 21"),
+    ("latest 10 bets",
+     "SELECT * FROM bets ORDER BY timestamp DESC LIMIT 10",
+     "SELECT * FROM bets ORDER BY placed_at DESC, id DESC LIMIT 10"),
+    ("bets in last 7 days",
+     "SELECT COUNT(*), SUM(amount) FROM bets WHERE timestamp >= '2026-12-25 00:00:00'",
+     "SELECT COUNT(*), SUM(amount) FROM bets WHERE placed_at >= 1798156800"),
+    ("match history",
+     "SELECT * FROM matches WHERE status = 'completed' ORDER BY date DESC, time DESC",
+     "SELECT * FROM matches WHERE status = 'completed' ORDER BY starts_at DESC, id DESC"),
+    ("upcoming matches",
+     "SELECT * FROM matches WHERE status = 'upcoming' OR status = 'live' ORDER BY date, time",
+     "SELECT * FROM matches WHERE status = 'upcoming' OR status = 'live' ORDER BY starts_at, id"),
+]
+
+
+def build_database(path, bets, matches, seed=42):
+    db.set_db_path(path)
+    service.init_db()
+    db.release_connection()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    match_rows = []
+    for _ in range(matches):
+        starts_at = START + rng.randrange(SPAN // 3600) * 3600
+        status = 'completed' if rng.random() < 0.9 else rng.choice(['upcoming', 'live'])
+        match_rows.append((starts_at, starts_at, starts_at, status))
+    conn.executemany('''
+    INSERT INTO matches (team1_id, team2_id, date, time, starts_at, status)
+    VALUES (1, 2, date(?, 'unixepoch'), strftime('%H:%M', ?, 'unixepoch'), ?, ?)
+    ''', match_rows)
+
+    # Bets arrive in time order, so ids grow with placed_at like in production
+    def bet_rows():
+        for placed_at in sorted(START + rng.randrange(SPAN) for _ in range(bets)):
+            yield (f"user{rng.randrange(USERS)}", rng.randrange(1, matches + 1), rng.randrange(10, 500),
+                   placed_at, placed_at)
+    conn.executemany('''
+    INSERT INTO bets (user_id, match_id, bet_type, amount, status, timestamp, placed_at, odds)
+    VALUES (?, ?, 'draw', ?, 'pending', datetime(?, 'unixepoch'), ?, 3.0)
+    ''', bet_rows())
+
+    # The text-ordered indexes from v2 that the epoch columns replaced
+    conn.execute("CREATE INDEX idx_bets_user_timestamp ON bets (user_id, timestamp)")
+    conn.execute("CREATE INDEX idx_matches_status_date_time ON matches (status, date, time)")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def median_time(conn, sql):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bets", type=int, default=1000000)
+    parser.add_argument("--matches", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "epoch.db")
+        build_database(path, args.bets, args.matches)
+        conn = sqlite3.connect(path)
+
+        print(f"{args.bets} bets, {args.matches} matches")
+        print(f"{'query':<20} | {'text (ms)':>10} | {'epoch (ms)':>10} | {'speedup':>8}")
+        for name, text_sql, epoch_sql in QUERIES:
+            text = median_time(conn, text_sql)
+            epoch = median_time(conn, epoch_sql)
+            print(f"{name:<20} | {text * 1000:>10.2f} | {epoch * 1000:>10.2f} | {text / epoch:>7.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
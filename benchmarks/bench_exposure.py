@@ -0,0 +1,86 @@
+"""Time reading match exposure from bets against reading match_exposure.
+
+    python benchmarks/bench_exposure.py [--sizes 10000 100000 1000000]
+
+Each size is a loadgen database with that many bets. "busiest match" reads
+the exposure of the open match with the most pending bets, and "overview"
+reads the worst case of every open match for the dashboard. "scan" runs
+the GROUP BY over pending bets it would take without the table; "table"
+is what the admin pages call now. Timings are medians of several runs.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import exposure
+import loadgen
+
+RUNS = 7
+
+MATCH_SCAN = '''
+SELECT bet_type, custom_bet_id, COUNT(*), SUM(amount), SUM(amount + CAST(amount * odds AS INTEGER))
+FROM bets
+WHERE match_id = ? AND status = 'pending'
+GROUP BY bet_type, custom_bet_id
+'''
+
+OVERVIEW_SCAN = '''
+SELECT match_id, SUM(stake), MAX(CASE WHEN custom_bet_id IS NULL THEN payout END)
+FROM (
+    SELECT match_id, custom_bet_id, bet_type, SUM(amount) AS stake,
+           SUM(amount + CAST(amount * odds AS INTEGER)) AS payout
+    FROM bets
+    WHERE status = 'pending'
+    GROUP BY 1, 2, 3
+)
+GROUP BY match_id
+ORDER BY 3 DESC
+LIMIT 10
+'''
+
+
+def median_time(fn):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'bets':>8} | {'query':<14} | {'scan (ms)':>9} | {'table (ms)':>10} | {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"exposure_{size}.db")
+            loadgen.generate(path, users=max(100, size // 100), matches=max(50, size // 200), bets=size)
+            conn = db.get_connection()
+            busiest = conn.execute('''
+            SELECT match_id FROM bets WHERE status = 'pending' GROUP BY match_id ORDER BY COUNT(*) DESC LIMIT 1
+            ''').fetchone()[0]
+
+            for name, scan, table in [
+                ("busiest match", lambda: conn.execute(MATCH_SCAN, (busiest,)).fetchall(),
+                 lambda: exposure.get_match_exposure(busiest)),
+                ("overview", lambda: conn.execute(OVERVIEW_SCAN).fetchall(),
+                 lambda: exposure.get_exposure_overview(10)),
+            ]:
+                scan_time = median_time(scan)
+                table_time = median_time(table)
+                print(f"{size:>8} | {name:<14} | {scan_time * 1000:>9.2f} | {table_time * 1000:>10.3f} | "
+                      f"{scan_time / table_time:>7.0f}x")
+            db.release_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Count the SQL statements one home_page render issues.
+
+    python benchmarks/bench_home_feed.py [--matches 20] [--custom-bets 3]
+
+"legacy" replays the queries home_page used to make with a selected custom
+bet: the match list, two team lookups and a custom bet query per match, a
+player lookup per custom bet, the unfiltered custom bet scan of the bet
+form and the points lookup. "feed" is get_home_feed() + get_user_points(),
+cold (after a write) and warm (read cache hit).
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+
+
+def build_database(path, matches, custom_bets):
+    db.set_db_path(path)
+    service.init_db()
+    service.register('bettor', 'x')
+    for team_id in range(1, 7):
+        service.add_player(f"Jogador {team_id}", team_id)
+    for i in range(matches):
+        service.add_match(i % 6 + 1, (i + 1) % 6 + 1, '2026-01-01', f"{i % 24:02d}:00")
+        for j in range(custom_bets):
+            service.add_custom_bet(i + 1, f"Aposta {j}", 2.5, i % 6 + 1)
+
+
+def legacy_render(conn, username):
+    c = conn.cursor()
+    c.execute('''
+    SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
+           o.team1_win, o.draw, o.team2_win
+    FROM matches m LEFT JOIN odds o ON m.id = o.match_id
+    WHERE m.status = 'upcoming' OR m.status = 'live'
+    ORDER BY m.date, m.time
+    ''')
+    for match in c.fetchall():
+        for team_id in (match['team1_id'], match['team2_id']):
+            conn.execute("SELECT name FROM teams WHERE id = ?", (team_id,)).fetchone()
+        for custom_bet in conn.execute("SELECT * FROM custom_bets WHERE match_id = ? AND status = 'pending'",
+                                       (match['id'],)).fetchall():
+            if custom_bet['player_id']:
+                conn.execute("SELECT name FROM players WHERE id = ?", (custom_bet['player_id'],)).fetchone()
+    custom_bet = conn.execute("SELECT * FROM custom_bets WHERE status = 'pending'").fetchall()[0]
+    conn.execute("SELECT name FROM players WHERE id = ?", (custom_bet['player_id'],)).fetchone()
+    conn.execute("SELECT points FROM users WHERE username = ?", (username,)).fetchone()
+
+
+def feed_render(username):
+    service.get_home_feed()
+    service.get_user_points(username)
+
+
+def count_statements(conn, render):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    start = time.perf_counter()
+    render()
+    elapsed = time.perf_counter() - start
+    conn.set_trace_callback(None)
+    return len(statements), elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--custom-bets", type=int, default=3, help="custom bets per match")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_database(path, args.matches, args.custom_bets)
+
+        legacy_conn = sqlite3.connect(path)
+        legacy_conn.row_factory = sqlite3.Row
+        legacy = count_statements(legacy_conn, lambda: legacy_render(legacy_conn, 'bettor'))
+        legacy_conn.close()
+
+        conn = db.get_connection()
+        cold = count_statements(conn, lambda: feed_render('bettor'))
+        warm = count_statements(conn, lambda: feed_render('bettor'))
+        db.release_connection()
+
+    print(f"{args.matches} open matches, {args.custom_bets} custom bets each")
+    print(f"legacy home_page:  {legacy[0]:4d} queries  {legacy[1]:7.2f} ms")
+    print(f"feed (cold):       {cold[0]:4d} queries  {cold[1]:7.2f} ms")
+    print(f"feed (warm cache): {warm[0]:4d} queries  {warm[1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
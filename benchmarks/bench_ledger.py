@@ -0,0 +1,97 @@
+"""Time ledger reconciliation and balance lookups with and without snapshots.
+
+    python benchmarks/bench_ledger.py [--entries 100000 1000000] [--users 10000] [--after 0.01]
+
+Each size is a fresh database with that many points_ledger entries spread
+over --users users, one per second of simulated time. A snapshot is taken
+after all but the last --after share of them. "replay" sums every entry (a
+whole-ledger GROUP BY for reconciliation, a user's whole history for a
+balance). "snapshot" is what ledger.py does. Timings are medians of
+several runs.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import ledger
+from migrations import migrate
+
+RUNS = 7
+
+REPLAY_RECONCILE = '''
+SELECT u.username FROM users u
+LEFT JOIN (SELECT user_id, SUM(delta) AS balance FROM points_ledger GROUP BY user_id) b ON b.user_id = u.username
+WHERE u.points IS NOT COALESCE(b.balance, 0)
+'''
+
+REPLAY_BALANCE = "SELECT COALESCE(SUM(delta), 0) FROM points_ledger WHERE user_id = ? AND created_at <= ?"
+
+
+def median_ms(fn):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def build(path, entries, users, after, seed=42):
+    rng = random.Random(seed)
+    db.set_db_path(path)
+    migrate()
+    conn = db.get_connection()
+    names = [f"user{i}" for i in range(users)]
+    balances = dict.fromkeys(names, 0)
+    rows = []
+    for i in range(entries):
+        user, delta = rng.choice(names), rng.randint(-50, 100)
+        balances[user] += delta
+        rows.append((user, 'adjustment', delta, i))
+    split = int(entries * (1 - after))
+
+    conn.executemany("INSERT INTO users (username, password, points, is_admin) VALUES (?, '', ?, 0)",
+                     balances.items())
+    conn.executemany("INSERT INTO points_ledger (user_id, kind, delta, created_at) VALUES (?, ?, ?, ?)", rows[:split])
+    ledger.take_snapshot(conn.cursor())
+    conn.executemany("INSERT INTO points_ledger (user_id, kind, delta, created_at) VALUES (?, ?, ?, ?)", rows[split:])
+    conn.commit()
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--after", type=float, default=0.01, help="share of entries after the snapshot")
+    args = parser.parse_args()
+
+    print(f"{'entries':>9} | {'query':<22} | {'replay (ms)':>11} | {'snapshot (ms)':>13} | {'speedup':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for entries in args.entries:
+            conn = build(os.path.join(tmp, f"ledger_{entries}.db"), entries, args.users, args.after)
+            assert ledger.reconcile() == [] and conn.execute(REPLAY_RECONCILE).fetchall() == []
+            halfway = entries // 2
+
+            for name, replay, snapshot in (
+                ("reconcile all users", lambda: conn.execute(REPLAY_RECONCILE).fetchall(), ledger.reconcile),
+                ("balance now", lambda: conn.execute(REPLAY_BALANCE, ("user1", entries)).fetchone(),
+                 lambda: ledger.get_balance_at("user1")),
+                ("balance at mid-ledger", lambda: conn.execute(REPLAY_BALANCE, ("user1", halfway)).fetchone(),
+                 lambda: ledger.get_balance_at("user1", halfway)),
+            ):
+                replay_ms, snapshot_ms = median_ms(replay), median_ms(snapshot)
+                print(f"{entries:>9} | {name:<22} | {replay_ms:>11.3f} | {snapshot_ms:>13.3f} | "
+                      f"{replay_ms / snapshot_ms:>6.0f}x")
+            db.release_connection()
+
+
+if __name__ == "__main__":
+    main()
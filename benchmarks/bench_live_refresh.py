@@ -0,0 +1,106 @@
+"""Cost of keeping an open home page current: full reruns against the live fragment.
+
+    python benchmarks/bench_live_refresh.py [--bets 100000] [--matches 500]
+
+Builds a loadgen database. Then it measures SQL statements and time per
+refresh of the match feed in four cases:
+
+    full rerun        the whole logged-in home page script through AppTest,
+                      which is what a click or a timed rerun of the page costs
+    idle              the live_match_feed fragment when nothing changed
+    after a bet       the fragment after another user placed a bet, which
+                      moves the global generation but not feed_generation
+    after odds change the fragment after an admin edited a match's odds
+
+The fragment cases also show the cached_read path the page used before
+(get_home_feed keyed on the global generation) for comparison. Timings
+are medians of several runs.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import guimabet_melhorado as service
+import loadgen
+import profiler
+from cache import reload_if_changed
+
+RUNS = 9
+
+
+# Median (statements, milliseconds) of `fn` after `before` sets up each run
+def measure(fn, before=lambda: None):
+    statements, timings = [], []
+    for _ in range(RUNS):
+        before()
+        count = [0]
+        conn = db.get_connection()
+        conn.set_trace_callback(lambda _sql: count.__setitem__(0, count[0] + 1))
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+        conn.set_trace_callback(None)
+        statements.append(count[0])
+    return statistics.median(statements), statistics.median(timings) * 1000
+
+
+def full_rerun(path):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['GUIMABET_DB'] = path
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.session_state.logged_in = True
+    at.session_state.username = "user0"
+    at.run()
+    runs = []
+    for _ in range(RUNS):
+        at.run()
+        runs.append(profiler.recent_runs()[-1])
+    return (statistics.median(run['queries'] for run in runs),
+            statistics.median(run['duration_ms'] for run in runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bets", type=int, default=100000)
+    parser.add_argument("--matches", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "live.db")
+        loadgen.generate(path, bets=args.bets, matches=args.matches)
+        conn = db.get_connection()
+        open_match = conn.execute("SELECT id FROM matches WHERE status = 'upcoming' LIMIT 1").fetchone()[0]
+        conn.execute("UPDATE users SET points = 1000000000 WHERE username = 'user1'")
+        conn.commit()
+
+        def place_bet():
+            service.place_bet("user1", open_match, 'draw', 10)
+
+        def edit_odds():
+            service.update_odds(open_match, 2.0 + time.perf_counter() % 1, 3.1, 3.2, "admin")
+
+        store = {}
+        live = lambda: reload_if_changed(store, 'home_feed', service.get_home_feed)
+        rows = [("full rerun", full_rerun(path), None)]
+        db.set_db_path(path)
+        live()
+        service.get_home_feed()
+        for name, before in (("idle", lambda: None), ("after a bet", place_bet), ("after odds change", edit_odds)):
+            rows.append((name, measure(live, before), measure(service.get_home_feed, before)))
+
+        print(f"{'refresh':<18} | {'statements':>10} | {'ms':>8} | {'cached_read statements':>22} | {'cached_read ms':>14}")
+        for name, (statements, ms), old in rows:
+            old_statements, old_ms = old if old else ("-", float('nan'))
+            print(f"{name:<18} | {statements:>10} | {ms:>8.3f} | {old_statements:>22} | {old_ms:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
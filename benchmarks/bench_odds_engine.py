@@ -0,0 +1,100 @@
+"""Time the odds engine and check its prices against the random odds it replaced.
+
+    python benchmarks/bench_odds_engine.py [--sizes 1000 5000 20000] [--teams 40] [--upcoming 500]
+
+Each league is simulated from hidden team strengths with Poisson goals.
+The engine is fitted on every match but the last 20%, and prices those
+held-out fixtures. The timing covers fit plus pricing (median of several
+runs). Also reported is the mean log loss of the implied probabilities on
+the held-out results, for the engine and for the random.uniform odds
+add_match used to draw (lower is better). The last column times repricing
+--upcoming fixtures in one batch.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import odds_engine
+
+RUNS = 7
+
+
+def simulate(matches, teams, seed=42):
+    rng = np.random.default_rng(seed)
+    attack = rng.lognormal(0, 0.3, teams + 1)
+    defence = rng.lognormal(0, 0.3, teams + 1)
+    team1 = rng.integers(1, teams + 1, matches)
+    team2 = (team1 + rng.integers(1, teams, matches) - 1) % teams + 1
+    team1_goals = rng.poisson(1.35 * 1.2 * attack[team1] * defence[team2])
+    team2_goals = rng.poisson(1.35 * attack[team2] * defence[team1])
+    return team1, team2, team1_goals, team2_goals
+
+
+def outcome_index(team1_goals, team2_goals):
+    return np.where(team1_goals > team2_goals, 0, np.where(team1_goals == team2_goals, 1, 2))
+
+
+def log_loss(probs, outcomes):
+    return float(-np.log(probs[np.arange(len(outcomes)), outcomes]).mean())
+
+
+def random_odds_probs(count, seed=42):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        odds = [rng.uniform(1.5, 3.0), rng.uniform(2.0, 4.0), rng.uniform(1.8, 3.5)]
+        implied = [1 / value for value in odds]
+        rows.append([p / sum(implied) for p in implied])
+    return np.array(rows)
+
+
+def median_time(fn):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--teams", type=int, default=40)
+    parser.add_argument("--upcoming", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'matches':>8} | {'fit+price (ms)':>14} | {'log loss engine':>15} | {'log loss random':>15} | "
+          f"{'reprice (ms)':>12}")
+    for size in args.sizes:
+        team1, team2, team1_goals, team2_goals = simulate(size, args.teams)
+        split = int(size * 0.8)
+        outcomes = outcome_index(team1_goals[split:], team2_goals[split:])
+
+        def fit_and_price():
+            ratings = odds_engine.fit(team1[:split], team2[:split], team1_goals[:split], team2_goals[:split])
+            return odds_engine.probabilities(ratings, team1[split:], team2[split:])
+
+        elapsed = median_time(fit_and_price)
+        engine_loss = log_loss(fit_and_price(), outcomes)
+        random_loss = log_loss(random_odds_probs(len(outcomes)), outcomes)
+
+        upcoming1, upcoming2, _, _ = simulate(args.upcoming, args.teams, seed=7)
+        ratings = odds_engine.fit(team1, team2, team1_goals, team2_goals)
+        reprice = median_time(lambda: odds_engine.to_odds(odds_engine.probabilities(ratings, upcoming1, upcoming2)))
+
+        print(f"{size:>8} | {elapsed * 1000:>14.2f} | {engine_loss:>15.4f} | {random_loss:>15.4f} | "
+              f"{reprice * 1000:>12.2f}")
+    print(f"(uniform 1/3 guess: {math.log(3):.4f})")
+
+
+if __name__ == "__main__":
+    main()
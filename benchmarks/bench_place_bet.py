@@ -0,0 +1,86 @@
+"""Concurrent place_bet stress test.
+
+    python benchmarks/bench_place_bet.py [--bettors 50] [--bets 200]
+
+Each bettor is a thread with its own pooled connection placing bets on
+the same open matches. Reports throughput, p50/p99 latency, rejected
+bets, and checks that no points were created or lost.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+
+START_POINTS = 10000
+
+
+def build_database(path, bettors):
+    db.set_db_path(path)
+    service.init_db()
+    for i in range(3):
+        service.add_match(1, i + 2, '2026-01-01', '20:00')
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (username, password, points, is_admin) VALUES (?, '', ?, 0)",
+                     [(f"bettor{i}", START_POINTS) for i in range(bettors)])
+    conn.commit()
+    conn.close()
+
+
+def bettor(index, bets, latencies, rejected):
+    username = f"bettor{index}"
+    bet_types = ['team1_win', 'draw', 'team2_win']
+    for n in range(bets):
+        start = time.perf_counter()
+        success, _ = service.place_bet(username, n % 3 + 1, bet_types[n % 3], 10)
+        latencies.append(time.perf_counter() - start)
+        if not success:
+            rejected.append(username)
+    db.release_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bettors", type=int, default=50)
+    parser.add_argument("--bets", type=int, default=200, help="bets per bettor")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_database(path, args.bettors)
+
+        latencies, rejected = [], []
+        threads = [threading.Thread(target=bettor, args=(i, args.bets, latencies, rejected))
+                   for i in range(args.bettors)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        conn = sqlite3.connect(path)
+        placed = conn.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM bets").fetchone()
+        points = conn.execute("SELECT SUM(points) FROM users WHERE username LIKE 'bettor%'").fetchone()[0]
+        conn.close()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"bettors:      {args.bettors}")
+    print(f"bets placed:  {placed[0]} ({len(rejected)} rejected)")
+    print(f"throughput:   {placed[0] / elapsed:.0f} bets/s")
+    print(f"latency p50:  {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"latency p99:  {p99 * 1000:.2f} ms")
+    print(f"points conserved: {points + placed[1] == args.bettors * START_POINTS}")
+
+
+if __name__ == "__main__":
+    main()
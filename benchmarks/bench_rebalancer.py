@@ -0,0 +1,83 @@
+"""Time a rebalancing pass over every open match.
+
+    python benchmarks/bench_rebalancer.py [--open 100 300 1000] [--bets 100000]
+
+Each size is a loadgen database with about that many open (upcoming or
+live) matches and --bets bets. "first pass" moves the odds of every match
+off their loadgen values. "repeat pass" runs again on the same stakes,
+finds nothing to change and writes nothing. "per-match" writes the same
+odds with one update_odds call per match, as the odds page does, for
+comparison. Timings are medians of several runs, each on a fresh copy.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+import loadgen
+import odds_engine
+import rebalancer
+
+RUNS = 5
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+# The odds a pass would write, computed without writing them
+def target_odds(conn):
+    matches = rebalancer._load_open_matches(conn)
+    model = odds_engine.probabilities(odds_engine.fit_from_db(conn), matches[:, 1], matches[:, 2])
+    odds = odds_engine.to_odds(rebalancer.blend(model, matches[:, 6:9]))
+    return [(int(match_id), *row.tolist()) for match_id, row in zip(matches[:, 0], odds)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--open", type=int, nargs="+", default=[100, 300, 1000], help="open matches")
+    parser.add_argument("--bets", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'open':>6} | {'changed':>7} | {'first pass (ms)':>15} | {'repeat pass (ms)':>16} | "
+          f"{'per-match (ms)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.open:
+            template = os.path.join(tmp, f"template_{size}.db")
+            matches = round(size / (1 - loadgen.COMPLETED_SHARE))
+            loadgen.generate(template, matches=matches, bets=args.bets)
+            # Fold the WAL into the main file so it can be copied as a plain file
+            db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.set_db_path(template)
+
+            first, repeat, per_match = [], [], []
+            for run in range(RUNS):
+                batch, single = (os.path.join(tmp, f"{name}_{size}_{run}.db") for name in ("batch", "single"))
+                shutil.copy(template, batch)
+                shutil.copy(template, single)
+
+                db.set_db_path(batch)
+                seconds, (checked, changed) = timed(rebalancer.rebalance_odds)
+                first.append(seconds)
+                repeat.append(timed(rebalancer.rebalance_odds)[0])
+
+                db.set_db_path(single)
+                odds = target_odds(db.get_connection())
+                per_match.append(timed(lambda: [service.update_odds(*row, rebalancer.USERNAME, rebalancer.REASON)
+                                                for row in odds])[0])
+
+            print(f"{checked:>6} | {changed:>7} | {statistics.median(first) * 1000:>15.1f} | "
+                  f"{statistics.median(repeat) * 1000:>16.1f} | {statistics.median(per_match) * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
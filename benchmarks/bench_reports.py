@@ -0,0 +1,104 @@
+"""Time the reports page queries against bets and against the rollup tables.
+
+    python benchmarks/bench_reports.py [--sizes 10000 100000 1000000]
+
+"scans" runs the four aggregate queries reports_page used to make over
+bets; "rollups" runs the three rollup reads it makes now. Both are timed
+as the median of several runs on a database with bets spread over 90 days
+and 5000 users, a third of them settled.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+import rollups
+
+USERS = 5000
+DAYS = 90
+RUNS = 5
+
+
+def build_database(path, bets, seed=42):
+    db.set_db_path(path)
+    service.init_db()
+    db.release_connection()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (username, password, points, is_admin) VALUES (?, '', 0, 0)",
+                     [(f"user{i}",) for i in range(USERS)])
+    conn.execute("INSERT INTO matches (team1_id, team2_id, date, time, status) VALUES (1, 2, '2026-01-01', '20:00', 'live')")
+    conn.executemany('''
+    INSERT INTO bets (user_id, match_id, bet_type, amount, status, timestamp, odds)
+    VALUES (?, 1, 'draw', ?, ?, datetime('now', ?), 3.0)
+    ''', ((f"user{rng.randrange(USERS)}", rng.randrange(10, 500),
+           rng.choice(['pending', 'pending', 'won', 'lost']), f"-{rng.randrange(DAYS * 24)} hours")
+          for _ in range(bets)))
+    rollups.rebuild_rollups(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def scan_reports(conn):
+    conn.execute("SELECT status, COUNT(*), SUM(amount) FROM bets GROUP BY status").fetchall()
+    conn.execute('''
+    SELECT user_id, COUNT(*) as total_bets, SUM(amount) as total_amount
+    FROM bets GROUP BY user_id ORDER BY total_amount DESC LIMIT 10
+    ''').fetchall()
+    conn.execute('''
+    SELECT DATE(timestamp) as date, COUNT(*) as bets, SUM(amount) as volume
+    FROM bets WHERE timestamp >= date('now', '-30 days')
+    GROUP BY DATE(timestamp) ORDER BY date DESC
+    ''').fetchall()
+    conn.execute('''
+    SELECT SUM(CASE WHEN status = 'won' THEN amount ELSE 0 END),
+           SUM(CASE WHEN status = 'lost' THEN amount ELSE 0 END),
+           COUNT(CASE WHEN status = 'won' THEN 1 END),
+           COUNT(CASE WHEN status = 'lost' THEN 1 END)
+    FROM bets WHERE status IN ('won', 'lost')
+    ''').fetchall()
+
+
+def rollup_reports():
+    rollups.get_status_totals()
+    rollups.get_top_bettors(10)
+    rollups.get_daily_volume(30)
+
+
+def median_time(fn, *args):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'bets':>8} | {'scans (ms)':>10} | {'rollups (ms)':>12} | {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"reports_{size}.db")
+            build_database(path, size)
+            db.set_db_path(path)
+            scans = median_time(scan_reports, db.get_connection())
+            rolled = median_time(rollup_reports)
+            db.release_connection()
+            print(f"{size:>8} | {scans * 1000:>10.1f} | {rolled * 1000:>12.2f} | {scans / rolled:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Settle one match with the old per-bet loop and with update_match_result.
+
+    python benchmarks/bench_settlement.py [--sizes 10000 100000 1000000]
+
+Both runs start from the same database file, and the resulting user
+balances are compared so the set-based path is checked against the loop.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+from settlement import match_result
+
+USERS = 5000
+
+
+def build_database(path, bets, seed=42):
+    db.set_db_path(path)
+    service.init_db()
+    db.release_connection()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (username, password, points, is_admin) VALUES (?, '', 0, 0)",
+                     [(f"user{i}",) for i in range(USERS)])
+    conn.execute("INSERT INTO matches (team1_id, team2_id, date, time, status) VALUES (1, 2, '2026-01-01', '20:00', 'live')")
+    conn.execute("INSERT INTO odds (match_id, team1_win, draw, team2_win) VALUES (1, 1.87, 3.33, 2.41)")
+    odds = {'team1_win': 1.87, 'draw': 3.33, 'team2_win': 2.41}
+    bet_types = list(odds)
+    conn.executemany('''
+    INSERT INTO bets (user_id, match_id, bet_type, amount, status, timestamp, odds)
+    VALUES (?, 1, ?, ?, 'pending', '2026-01-01 19:00:00', ?)
+    ''', ((f"user{rng.randrange(USERS)}", bet_type, rng.randrange(10, 500), odds[bet_type])
+          for bet_type in (rng.choice(bet_types) for _ in range(bets))))
+    conn.commit()
+    # Fold the WAL into the main file so it can be copied as a plain file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+# update_match_result as it was before the set-based engine
+def legacy_update_match_result(path, match_id, team1_score, team2_score):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("UPDATE matches SET status = 'completed', team1_score = ?, team2_score = ? WHERE id = ?",
+              (team1_score, team2_score, match_id))
+    result = match_result(team1_score, team2_score)
+    c.execute('''
+    SELECT id, user_id, bet_type, amount FROM bets
+    WHERE match_id = ? AND status = 'pending' AND custom_bet_id IS NULL
+    ''', (match_id,))
+    bets = c.fetchall()
+    c.execute("SELECT team1_win, draw, team2_win FROM odds WHERE match_id = ?", (match_id,))
+    odds = c.fetchone()
+    for bet_id, user_id, bet_type, amount in bets:
+        if bet_type == result:
+            odds_value = odds[0] if bet_type == 'team1_win' else odds[1] if bet_type == 'draw' else odds[2]
+            winnings = int(amount * odds_value)
+            c.execute("UPDATE users SET points = points + ? WHERE username = ?", (winnings + amount, user_id))
+            c.execute("UPDATE bets SET status = 'won' WHERE id = ?", (bet_id,))
+        else:
+            c.execute("UPDATE bets SET status = 'lost' WHERE id = ?", (bet_id,))
+    conn.commit()
+    conn.close()
+
+
+def balances(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT username, points FROM users ORDER BY username").fetchall()
+    statuses = conn.execute("SELECT status, COUNT(*) FROM bets GROUP BY status ORDER BY status").fetchall()
+    conn.close()
+    return rows, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'bets':>8} | {'loop (s)':>9} | {'set-based (s)':>13} | {'speedup':>7} | same points")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            base = os.path.join(tmp, f"base_{size}.db")
+            build_database(base, size)
+            legacy_path = os.path.join(tmp, f"legacy_{size}.db")
+            new_path = os.path.join(tmp, f"new_{size}.db")
+            shutil.copy(base, legacy_path)
+            shutil.copy(base, new_path)
+
+            start = time.perf_counter()
+            legacy_update_match_result(legacy_path, 1, 2, 1)
+            legacy = time.perf_counter() - start
+
+            db.set_db_path(new_path)
+            start = time.perf_counter()
+            service.update_match_result(1, 2, 1)
+            new = time.perf_counter() - start
+            db.release_connection()
+
+            same = balances(legacy_path) == balances(new_path)
+            print(f"{size:>8} | {legacy:>9.3f} | {new:>13.3f} | {legacy / new:>6.1f}x | {same}")
+
+
+if __name__ == "__main__":
+    main()
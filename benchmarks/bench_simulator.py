@@ -0,0 +1,91 @@
+"""Time the Monte Carlo simulator on a matchday of pending bets.
+
+    python benchmarks/bench_simulator.py [--pending 100000] [--open 20] [--simulations 100000 1000000]
+
+Builds a loadgen database whose --open open matches carry about --pending
+pending bets, then times load_book() and simulate() for each simulation
+count. "mean error" compares the simulated mean profit with the exact
+expectation of the same model. "per bet" is the direct approach for
+comparison: Poisson scorelines for every match and every bet's payout
+checked in each draw. It is timed on 1,000 draws and scaled up.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import loadgen
+import odds_engine
+import simulator
+
+PER_BET_DRAWS = 1000
+
+
+# What the house makes on average under the simulator's own model
+def expected_profit(book):
+    probs = odds_engine.probabilities(odds_engine.fit_from_db(db.get_connection()), book.team1_ids, book.team2_ids)
+    custom_chance = np.minimum(1 / (book.custom_odds * (1 + odds_engine.MARGIN)), 1)
+    return book.stake - (probs * book.result_payouts).sum() - (custom_chance * book.custom_payouts).sum()
+
+
+# Scorelines drawn per match and every pending bet settled in every draw
+def per_bet(draws, seed=42):
+    conn = db.get_connection()
+    bets = np.array(conn.execute('''
+    SELECT m.team1_id, m.team2_id, CASE b.bet_type WHEN 'team1_win' THEN 0 WHEN 'draw' THEN 1 ELSE 2 END,
+           b.amount, b.odds
+    FROM bets b JOIN matches m ON m.id = b.match_id
+    WHERE b.status = 'pending' AND b.bet_type <> 'custom'
+    ''').fetchall(), dtype=np.float64)
+    ratings = odds_engine.fit_from_db(conn)
+    team1_goals, team2_goals = odds_engine.expected_goals(ratings, bets[:, 0].astype(np.int64),
+                                                          bets[:, 1].astype(np.int64))
+    payout = bets[:, 3] + (bets[:, 3] * bets[:, 4]).astype(np.int64)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for _ in range(draws):
+        result = np.sign(rng.poisson(team2_goals) - rng.poisson(team1_goals)) + 1
+        (payout * (result == bets[:, 2])).sum()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pending", type=int, default=100000)
+    parser.add_argument("--open", type=int, default=20)
+    parser.add_argument("--simulations", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # loadgen spreads bets evenly over matches; the open share of them stays pending
+        open_share = 1 - loadgen.COMPLETED_SHARE
+        loadgen.generate(os.path.join(tmp, "sim.db"), matches=round(args.open / open_share),
+                         bets=round(args.pending / open_share))
+
+        start = time.perf_counter()
+        book = simulator.load_book()
+        load_ms = (time.perf_counter() - start) * 1000
+        expected = expected_profit(book)
+        print(f"{book.bets:,} pending bets on {len(book.match_ids)} matches and {len(book.custom_payouts)} "
+              f"custom bets; load_book {load_ms:.0f} ms")
+
+        print(f"{'simulations':>11} | {'simulate (s)':>12} | {'mean error':>10} | {'VaR 95':>12} | {'per bet (s)':>11}")
+        per_bet_seconds = per_bet(PER_BET_DRAWS)
+        for simulations in args.simulations:
+            start = time.perf_counter()
+            profit = simulator.simulate(book, simulations, seed=42)
+            seconds = time.perf_counter() - start
+            summary = simulator.summarize(book, profit)
+            error = abs(summary['mean'] - expected) / max(abs(expected), 1)
+            print(f"{simulations:>11,} | {seconds:>12.2f} | {error * 100:>9.2f}% | {summary['var_95']:>12,.0f} | "
+                  f"{per_bet_seconds * simulations / PER_BET_DRAWS:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Time every public data function of guimabet_melhorado on generated databases of several sizes.
+
+    python benchmarks/run_benchmarks.py [--sizes 10000 100000 1000000] [--output benchmark_report]
+                                        [--baseline old_report.json] [--tolerance 1.5]
+
+For each size (number of bets; users, matches, custom bets and players
+scale with it) loadgen builds a database from a fixed seed, then each
+function is timed over several calls. Cached reads are timed cold (cache
+cleared before every call) so the numbers reflect the queries;
+get_home_feed is also timed warm. Write functions run last, on open
+matches and custom bets of the generated data.
+
+Results go to <output>.json and <output>.md. With --baseline, any median
+that got slower than tolerance x the baseline's is listed and the run
+exits with status 1, so it can gate a deployment.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import guimabet_melhorado as service
+import loadgen
+from cache import clear_cache
+
+SEED = 42
+RUNS = 7
+WRITE_RUNS = 3
+
+
+def sizes_for(bets):
+    return {
+        'users': max(100, bets // 100),
+        'teams': 20,
+        'players': 200,
+        'matches': max(50, bets // 200),
+        'custom_bets': max(100, bets // 100),
+        'bets': bets,
+    }
+
+
+# Ids the benchmark calls need, picked from the generated data
+def pick_context(conn):
+    heavy_user = conn.execute("SELECT user_id FROM bet_rollup_user ORDER BY volume DESC LIMIT 1").fetchone()[0]
+    open_matches = [row[0] for row in conn.execute('''
+    SELECT m.id FROM matches m
+    WHERE m.status IN ('upcoming', 'live')
+    ORDER BY (SELECT COUNT(*) FROM bets b WHERE b.match_id = m.id AND b.status = 'pending') DESC
+    ''')]
+    custom_bets = [row[0] for row in conn.execute('''
+    SELECT cb.id FROM custom_bets cb
+    WHERE cb.status = 'pending'
+    ORDER BY (SELECT COUNT(*) FROM bets b WHERE b.custom_bet_id = cb.id AND b.status = 'pending') DESC
+    ''')]
+    _, cursor = service.get_user_bets_page(heavy_user)
+    return {
+        'user': heavy_user,
+        'cursor': cursor,
+        'settle_matches': open_matches[:WRITE_RUNS],
+        'custom_bets': custom_bets[:WRITE_RUNS],
+        # Stays open while the busiest matches are settled
+        'bet_match': open_matches[-1],
+    }
+
+
+READS = [
+    ("get_upcoming_matches", lambda ctx: service.get_upcoming_matches()),
+    ("get_match_history", lambda ctx: service.get_match_history()),
+    ("get_custom_bets", lambda ctx: service.get_custom_bets()),
+    ("get_home_feed", lambda ctx: service.get_home_feed()),
+    ("get_user_points", lambda ctx: service.get_user_points(ctx['user'])),
+    ("get_user_bets", lambda ctx: service.get_user_bets(ctx['user'])),
+    ("get_user_bets_page", lambda ctx: service.get_user_bets_page(ctx['user'])),
+    ("get_user_bets_page (page 2)", lambda ctx: service.get_user_bets_page(ctx['user'], ctx['cursor'])),
+    ("get_all_teams", lambda ctx: service.get_all_teams()),
+    ("get_all_players", lambda ctx: service.get_all_players()),
+    ("get_all_users", lambda ctx: service.get_all_users()),
+    ("get_counters", lambda ctx: service.get_counters()),
+    ("get_leaderboard", lambda ctx: service.get_leaderboard(1)),
+    ("get_user_rank", lambda ctx: service.get_user_rank(ctx['user'])),
+]
+
+
+def time_calls(calls):
+    timings = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'max_ms': max(timings) * 1000,
+        'runs': len(timings),
+    }
+
+
+def cold(fn, ctx):
+    def call():
+        clear_cache()
+        fn(ctx)
+    return call
+
+
+def run_size(tmp, bets):
+    path = os.path.join(tmp, f"bench_{bets}.db")
+    counts = loadgen.generate(path, SEED, **sizes_for(bets))
+    conn = db.get_connection()
+    ctx = pick_context(conn)
+
+    results = {}
+    for name, fn in READS:
+        results[name] = time_calls([cold(fn, ctx)] * RUNS)
+    service.get_home_feed()
+    results["get_home_feed (warm cache)"] = time_calls([service.get_home_feed] * RUNS)
+
+    results["place_bet"] = time_calls([
+        lambda i=i: service.place_bet(f"user{i}", ctx['bet_match'], 'draw', 10) for i in range(RUNS)])
+    results["update_custom_bet_result"] = time_calls([
+        lambda cb=cb: service.update_custom_bet_result(cb, 'yes') for cb in ctx['custom_bets']])
+    results["update_match_result"] = time_calls([
+        lambda m=m: service.update_match_result(m, 2, 1) for m in ctx['settle_matches']])
+
+    db.release_connection()
+    return {'bets': bets, 'counts': counts, 'results': results}
+
+
+def to_markdown(report):
+    sizes = [run['bets'] for run in report['runs']]
+    lines = [
+        f"# Data layer benchmark ({report['generated_at']}, seed {report['seed']})",
+        "",
+        "Median milliseconds per call.",
+        "",
+        "| function | " + " | ".join(f"{size} bets" for size in sizes) + " |",
+        "|---|" + "---:|" * len(sizes),
+    ]
+    for name in report['runs'][0]['results']:
+        cells = [f"{run['results'][name]['median_ms']:.2f}" for run in report['runs']]
+        lines.append(f"| {name} | " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+# (size, function, baseline ms, current ms) for every median that grew
+# by more than `tolerance` times
+def find_regressions(report, baseline, tolerance):
+    previous = {(run['bets'], name): result['median_ms']
+                for run in baseline['runs'] for name, result in run['results'].items()}
+    regressions = []
+    for run in report['runs']:
+        for name, result in run['results'].items():
+            before = previous.get((run['bets'], name))
+            if before is not None and result['median_ms'] > before * tolerance:
+                regressions.append((run['bets'], name, before, result['median_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--output", default="benchmark_report", help="path prefix for the .json and .md report")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    report = {
+        'generated_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'seed': SEED,
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for bets in args.sizes:
+            report['runs'].append(run_size(tmp, bets))
+
+    with open(f"{args.output}.json", "w") as f:
+        json.dump(report, f, indent=2)
+    markdown = to_markdown(report)
+    with open(f"{args.output}.md", "w") as f:
+        f.write(markdown)
+    print(markdown)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for bets, name, before, after in regressions:
+            print(f"REGRESSION {name} at {bets} bets: {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
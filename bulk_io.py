@@ -0,0 +1,240 @@
+"""Stream teams, players, matches, custom bets and bets between guimabet.db and CSV/JSONL files.
+
+    python bulk_io.py export bets bets.jsonl
+    python bulk_io.py import teams teams.csv [--chunk-size 5000]
+
+The format comes from the file extension (.csv or .jsonl), or --format; a
+path of '-' reads stdin / writes stdout. Both directions stream: exports
+read the table with fetchmany and write row by row, imports read a chunk
+of rows at a time and insert it with executemany in one write transaction,
+so memory stays flat however large the file is.
+
+Files carry the table's ids so references between them (players to teams,
+bets to matches) survive the move; import teams and players before
+matches, matches before custom bets, and custom bets before bets. Rows without an id get the next free
+one. Exported matches include their odds, which are imported with them.
+Imported bets are added to the report rollups and the match exposure
+chunk by chunk, and the dashboard counters follow through their triggers.
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+from cache import bump_generation
+from db import get_connection, run_write_transaction
+from exposure import record_bet_exposure
+from migrations import migrate
+from rollups import record_bets
+
+# Rows read per fetchmany on export and inserted per transaction on import
+CHUNK_SIZE = 5000
+
+# Columns of each table as they appear in files; the export query yields
+# them in this order
+TABLES = {
+    'teams': {
+        'columns': ['id', 'name'],
+        'export': "SELECT id, name FROM teams ORDER BY id",
+        'insert': "INSERT INTO teams (id, name) VALUES (:id, :name)",
+    },
+    'players': {
+        'columns': ['id', 'name', 'team_id'],
+        'export': "SELECT id, name, team_id FROM players ORDER BY id",
+        'insert': "INSERT INTO players (id, name, team_id) VALUES (:id, :name, :team_id)",
+    },
+    'matches': {
+        'columns': ['id', 'team1_id', 'team2_id', 'date', 'time', 'status', 'team1_score', 'team2_score',
+                    'team1_win', 'draw', 'team2_win'],
+        'export': '''
+        SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
+               o.team1_win, o.draw, o.team2_win
+        FROM matches m
+        LEFT JOIN odds o ON o.match_id = m.id
+        ORDER BY m.id
+        ''',
+        # A one-digit hour ('9:00') is zero-padded so strftime can read it
+        'insert': '''
+        INSERT INTO matches (id, team1_id, team2_id, date, time, starts_at, status, team1_score, team2_score)
+        SELECT :id, :team1_id, :team2_id, :date, time, CAST(strftime('%s', :date || ' ' || time) AS INTEGER),
+               COALESCE(:status, 'upcoming'), :team1_score, :team2_score
+        FROM (SELECT CASE WHEN :time GLOB '[0-9]:*' THEN '0' || :time ELSE :time END AS time)
+        ''',
+    },
+    'custom_bets': {
+        'columns': ['id', 'match_id', 'description', 'odds', 'player_id', 'status', 'result'],
+        'export': "SELECT id, match_id, description, odds, player_id, status, result FROM custom_bets ORDER BY id",
+        'insert': '''
+        INSERT INTO custom_bets (id, match_id, description, odds, player_id, status, result)
+        VALUES (:id, :match_id, :description, :odds, :player_id, COALESCE(:status, 'pending'), :result)
+        ''',
+    },
+    'bets': {
+        'columns': ['id', 'user_id', 'match_id', 'bet_type', 'amount', 'status', 'timestamp',
+                    'custom_bet_id', 'player_id', 'odds'],
+        'export': '''
+        SELECT id, user_id, match_id, bet_type, amount, status, timestamp, custom_bet_id, player_id, odds
+        FROM bets
+        ORDER BY id
+        ''',
+        # Files from before bets carried their odds get the odds on file
+        'insert': '''
+        INSERT INTO bets (id, user_id, match_id, bet_type, amount, status, timestamp, placed_at,
+                          custom_bet_id, player_id, odds)
+        VALUES (:id, :user_id, :match_id, :bet_type, :amount, COALESCE(:status, 'pending'), :timestamp,
+                CAST(strftime('%s', :timestamp) AS INTEGER), :custom_bet_id, :player_id,
+                COALESCE(:odds, (SELECT odds FROM custom_bets WHERE id = :custom_bet_id),
+                         (SELECT CASE :bet_type WHEN 'team1_win' THEN team1_win WHEN 'draw' THEN draw
+                                                WHEN 'team2_win' THEN team2_win END
+                          FROM odds WHERE match_id = :match_id)))
+        ''',
+    },
+}
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith('.jsonl'):
+        return 'jsonl'
+    raise SystemExit(f"Can't tell the format of {path!r}; pass --format csv or --format jsonl")
+
+
+def _open(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+class _Progress:
+    def __init__(self, verb, table):
+        self.verb = verb
+        self.table = table
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def add(self, rows):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.start
+        print(f"\r{self.verb} {self.rows} {self.table} ({self.rows / elapsed if elapsed else 0:,.0f} rows/s)",
+              end='', file=sys.stderr)
+
+    def done(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.rows / elapsed if elapsed else 0
+        print(f"\r{self.verb} {self.rows} {self.table} in {elapsed:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+        return self.rows, elapsed
+
+
+# Write every row of `table` to `path`. Returns (rows, seconds).
+def export_table(table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    spec = TABLES[table]
+    fmt = _format(path, fmt)
+    columns = spec['columns']
+    progress = _Progress("Exported", table)
+
+    c = get_connection().cursor()
+    c.execute(spec['export'])
+    out = _open(path, 'w')
+    try:
+        writer = csv.writer(out) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(tuple(row) for row in rows)
+            else:
+                out.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+            progress.add(len(rows))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return progress.done()
+
+
+# File rows as dicts with every column of the table; blank CSV cells and
+# missing keys become NULL
+def _read_rows(f, fmt, columns):
+    records = csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f if line.strip())
+    for record in records:
+        yield {column: None if record.get(column) == '' else record.get(column) for column in columns}
+
+
+def _insert_chunk(table, spec, rows):
+    def write(c):
+        # Rows without an id take the next free ones, so matches can be
+        # linked to their odds without a round trip per row
+        missing = [row for row in rows if row['id'] is None]
+        if missing:
+            c.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            next_id = c.fetchone()[0] + 1
+            for offset, row in enumerate(missing):
+                row['id'] = next_id + offset
+
+        c.executemany(spec['insert'], rows)
+        if table == 'matches':
+            c.executemany('''
+            INSERT INTO odds (match_id, team1_win, draw, team2_win)
+            VALUES (:id, :team1_win, :draw, :team2_win)
+            ''', [row for row in rows if row['team1_win'] is not None])
+        elif table == 'bets':
+            record_bet_exposure(c, [row['id'] for row in rows])
+            record_bets(c, [(row['user_id'], (row['timestamp'] or '')[:10], row['status'] or 'pending',
+                             int(row['amount'] or 0)) for row in rows])
+        bump_generation(c)
+
+    run_write_transaction(write)
+
+
+# Insert rows (dicts holding every column of the table, None for NULL)
+# into `table`, one transaction per chunk. Returns (rows, seconds). A
+# failing chunk is rolled back and raises; chunks before it stay committed.
+def insert_rows(table, rows, chunk_size=CHUNK_SIZE, verb="Imported"):
+    spec = TABLES[table]
+    progress = _Progress(verb, table)
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        _insert_chunk(table, spec, chunk)
+        progress.add(len(chunk))
+    return progress.done()
+
+
+# Insert every row of the file at `path` into `table`
+def import_table(table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    fmt = _format(path, fmt)
+    f = _open(path, 'r')
+    try:
+        return insert_rows(table, _read_rows(f, fmt, TABLES[table]['columns']), chunk_size)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("path", help="file to read or write, '-' for stdin/stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    migrate()
+    if args.command == "import":
+        import_table(args.table, args.path, args.format, args.chunk_size)
+    else:
+        export_table(args.table, args.path, args.format, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Read-through cache for listing queries, keyed on a data generation counter.
+
+The counter lives in the app_meta table, so a write made by any process
+(player app, admin panel, settlement worker) invalidates every process's
+cache. Write functions call bump_generation() inside their own transaction;
+cached results only go stale after a real change, never on a timer.
+
+The pages' live sections poll the narrower 'feed_generation' through
+reload_if_changed(). An open tab that sees no change runs that one query
+per LIVE_REFRESH_SECONDS.
+"""
+import functools
+import os
+import threading
+
+from db import get_connection
+
+# Upper bound on cached (function, arguments) pairs before the cache is reset
+MAX_ENTRIES = 512
+
+# Seconds between the change probes of the pages' live sections
+LIVE_REFRESH_SECONDS = float(os.environ.get('GUIMABET_LIVE_REFRESH', 5))
+
+_entries = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+# Current data generation; one primary-key lookup. 'feed_generation' only
+# moves when matches, odds or custom bets change (see migrations v13).
+def get_generation(key='generation'):
+    conn = get_connection()
+    row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+# Mark the data as changed. Call with the cursor of the write transaction so
+# the new generation becomes visible together with the data.
+def bump_generation(c):
+    c.execute("UPDATE app_meta SET value = value + 1 WHERE key = 'generation'")
+
+
+# Callers get their own copy of every list and dict in a result, nested ones
+# included (a match's custom_bets in the home feed), so mutating a result
+# can't leak into the cache. Rows hold only scalars below that.
+def _copy(value):
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, dict):
+        value = dict(value)
+        for key, item in value.items():
+            if isinstance(item, (list, dict)):
+                value[key] = _copy(item)
+    return value
+
+
+def cached_read(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        generation = get_generation()
+        key = (name, args, tuple(sorted(kwargs.items())))
+        entry = _entries.get(key)
+        with _lock:
+            stats = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+            if entry is not None and entry[0] == generation:
+                stats['hits'] += 1
+                return _copy(entry[1])
+            stats['misses'] += 1
+
+        value = fn(*args, **kwargs)
+        with _lock:
+            if len(_entries) >= MAX_ENTRIES:
+                _entries.clear()
+            _entries[key] = (generation, value)
+        return _copy(value)
+
+    return wrapper
+
+
+# load() as kept in `store` (a page's st.session_state) under `name`,
+# called again only once the `key` generation has moved. A refresh that
+# finds nothing changed costs the one get_generation() lookup.
+def reload_if_changed(store, name, load, key='feed_generation'):
+    generation = get_generation(key)
+    entry = store.get(name)
+    if entry is None or entry[0] != generation:
+        entry = (generation, load())
+        store[name] = entry
+    return _copy(entry[1])
+
+
+# Hit/miss counters per cached function, plus the totals
+def cache_stats():
+    with _lock:
+        per_function = {name: dict(stats) for name, stats in _stats.items()}
+    hits = sum(stats['hits'] for stats in per_function.values())
+    misses = sum(stats['misses'] for stats in per_function.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': len(_entries),
+        'functions': per_function,
+    }
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _stats.clear()
@@ -0,0 +1,145 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+
+# Database file shared by the player app, the admin panel and background jobs
+DB_PATH = os.environ.get('GUIMABET_DB', 'guimabet.db')
+
+# How long a statement waits on a locked database before failing (milliseconds)
+BUSY_TIMEOUT_MS = int(os.environ.get('GUIMABET_BUSY_TIMEOUT_MS', '5000'))
+
+# Prepared statements kept per connection (sqlite3's default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Attempts made by run_write_transaction when the write lock is contended,
+# and the backoff between them (seconds, doubled per attempt, jittered)
+WRITE_RETRIES = 5
+RETRY_BASE_DELAY = 0.01
+RETRY_MAX_DELAY = 0.5
+
+# Connections parked for reuse once the thread that owned them has finished
+MAX_IDLE_CONNECTIONS = 16
+
+_local = threading.local()
+_idle = []
+_idle_lock = threading.Lock()
+
+
+# Holds the connection lent to one thread. When the thread ends its
+# thread-local storage is dropped and the finalizer hands the connection
+# back to the idle list, so Streamlit's per-rerun script threads reuse
+# connections instead of opening new ones.
+class _Lease:
+    def __init__(self, conn, path):
+        self.conn = conn
+        self.path = path
+        self._finalizer = weakref.finalize(self, _release, conn, path)
+
+    def release(self):
+        self._finalizer()
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def _release(conn, path):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
+
+    with _idle_lock:
+        if path == DB_PATH and len(_idle) < MAX_IDLE_CONNECTIONS:
+            _idle.append(conn)
+            return
+    conn.close()
+
+
+# Return the calling thread's connection, reusing an idle one when possible.
+# Rows come back as sqlite3.Row, so both row[0] and row['column'] work.
+def get_connection():
+    lease = getattr(_local, 'lease', None)
+    if lease is not None and lease.path == DB_PATH:
+        return lease.conn
+
+    if lease is not None:
+        lease.release()
+
+    conn = None
+    with _idle_lock:
+        if _idle:
+            conn = _idle.pop()
+    if conn is None:
+        conn = _open(DB_PATH)
+
+    _local.lease = _Lease(conn, DB_PATH)
+    return conn
+
+
+# Give the calling thread's connection back to the pool right away
+def release_connection():
+    lease = getattr(_local, 'lease', None)
+    if lease is not None:
+        _local.lease = None
+        lease.release()
+
+
+# Point every future connection at another database file (benchmarks, staging)
+def set_db_path(path):
+    global DB_PATH
+    release_connection()
+    with _idle_lock:
+        DB_PATH = path
+        idle = _idle[:]
+        _idle.clear()
+    for conn in idle:
+        conn.close()
+
+
+def _is_lock_error(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+# Run write(cursor) in one short BEGIN IMMEDIATE transaction and commit.
+# Taking the write lock up front means the transaction either gets it or
+# fails before doing any work; lock contention that outlasts busy_timeout
+# is retried with bounded exponential backoff. Any other exception rolls
+# back and propagates.
+def run_write_transaction(write, retries=None):
+    retries = WRITE_RETRIES if retries is None else retries
+    conn = get_connection()
+    for attempt in range(retries + 1):
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            result = write(c)
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            if not _is_lock_error(exc) or attempt == retries:
+                raise
+        except:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0))
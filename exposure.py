@@ -0,0 +1,144 @@
+"""How much the house stands to pay on each outcome of each match.
+
+match_exposure holds one row per open outcome: a match's team1_win, draw
+and team2_win (custom_bet_id 0), plus one per custom bet. Each row has the
+number of pending bets, their total stake and their potential payout,
+stake plus int(stake * accepted odds), which is what settlement would
+credit. Rows are added by place_bet and bulk imports. Settlement removes
+settled bets using the grouped query it already runs, and deleting a user
+subtracts that user's pending bets. An outcome with no pending bets left
+is deleted, so the table only ever holds open outcomes. Reading a match is
+a primary-key range, whatever the number of bets.
+
+Rebuild from bets (after a manual edit, say) with:
+
+    python exposure.py backfill
+"""
+import argparse
+import json
+
+from cache import bump_generation
+from db import get_connection
+from profiler import profiled
+
+
+# Add pending bets, by id, to their outcomes' exposure
+def record_bet_exposure(c, bet_ids):
+    c.execute('''
+    INSERT INTO match_exposure (match_id, custom_bet_id, outcome, bets, stake, payout)
+    SELECT match_id, COALESCE(custom_bet_id, 0), bet_type, COUNT(*), SUM(amount),
+           SUM(amount + CAST(amount * odds AS INTEGER))
+    FROM bets
+    WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending'
+    GROUP BY 1, 2, 3
+    ON CONFLICT (match_id, custom_bet_id, outcome) DO UPDATE
+    SET bets = bets + excluded.bets, stake = stake + excluded.stake, payout = payout + excluded.payout
+    ''', (json.dumps(list(bet_ids)),))
+
+
+# Take settled bets off their outcomes. `settled` holds (outcome, bets,
+# stake, payout) per outcome, from the settlement's grouped query.
+def release_exposure(c, match_id, custom_bet_id, settled):
+    c.executemany('''
+    UPDATE match_exposure SET bets = bets - ?, stake = stake - ?, payout = payout - ?
+    WHERE match_id = ? AND custom_bet_id = ? AND outcome = ?
+    ''', [(bets, stake, payout, match_id, custom_bet_id or 0, outcome)
+          for outcome, bets, stake, payout in settled])
+    c.execute("DELETE FROM match_exposure WHERE match_id = ? AND custom_bet_id = ? AND bets <= 0",
+              (match_id, custom_bet_id or 0))
+
+
+# Subtract the pending bets of a user that is about to be deleted
+def forget_user_exposure(c, user_id):
+    c.execute('''
+    UPDATE match_exposure SET bets = bets - u.n, stake = stake - u.total_stake, payout = payout - u.total_payout
+    FROM (
+        SELECT match_id, COALESCE(custom_bet_id, 0) AS custom_bet_id, bet_type AS outcome, COUNT(*) AS n,
+               SUM(amount) AS total_stake, SUM(amount + CAST(amount * odds AS INTEGER)) AS total_payout
+        FROM bets WHERE user_id = ? AND status = 'pending'
+        GROUP BY 1, 2, 3
+    ) AS u
+    WHERE match_exposure.match_id = u.match_id AND match_exposure.custom_bet_id = u.custom_bet_id
+      AND match_exposure.outcome = u.outcome
+    ''', (user_id,))
+    c.execute("DELETE FROM match_exposure WHERE bets <= 0")
+
+
+# Recompute the exposure of every pending bet inside the caller's transaction
+def rebuild_exposure(c):
+    c.execute("DELETE FROM match_exposure")
+    c.execute('''
+    INSERT INTO match_exposure (match_id, custom_bet_id, outcome, bets, stake, payout)
+    SELECT match_id, COALESCE(custom_bet_id, 0), bet_type, COUNT(*), SUM(amount),
+           SUM(amount + CAST(amount * odds AS INTEGER))
+    FROM bets
+    WHERE status = 'pending'
+    GROUP BY 1, 2, 3
+    ''')
+
+
+# Exposure of each open outcome of a match: result outcomes first, then
+# custom bets with their description
+@profiled
+def get_match_exposure(match_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT e.outcome, NULLIF(e.custom_bet_id, 0) AS custom_bet_id, cb.description, e.bets, e.stake, e.payout
+    FROM match_exposure e
+    LEFT JOIN custom_bets cb ON cb.id = e.custom_bet_id
+    WHERE e.match_id = ?
+    ORDER BY e.custom_bet_id, e.outcome
+    ''', (match_id,))
+    return [dict(row) for row in c.fetchall()]
+
+
+# Matches with the largest worst case for the house: the dearest result
+# outcome plus every custom bet paying out, minus all stakes on the match
+@profiled
+def get_exposure_overview(limit=10):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT e.match_id, COALESCE(t1.name, 'Unknown Team') AS team1_name,
+           COALESCE(t2.name, 'Unknown Team') AS team2_name, m.status,
+           SUM(e.bets) AS bets, SUM(e.stake) AS stake,
+           COALESCE(MAX(CASE WHEN e.custom_bet_id = 0 THEN e.payout END), 0)
+               + SUM(CASE WHEN e.custom_bet_id <> 0 THEN e.payout ELSE 0 END) - SUM(e.stake) AS worst_case
+    FROM match_exposure e
+    JOIN matches m ON m.id = e.match_id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    GROUP BY e.match_id
+    ORDER BY worst_case DESC
+    LIMIT ?
+    ''', (limit,))
+    return [dict(row) for row in c.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from migrations import migrate
+    migrate()
+
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        rebuild_exposure(c)
+        bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+
+    c.execute("SELECT COUNT(DISTINCT match_id), COALESCE(SUM(bets), 0) FROM match_exposure")
+    matches, bets = c.fetchone()
+    print(f"Exposure rebuilt: {bets} pending bets over {matches} matches")
+
+
+if __name__ == "__main__":
+    main()
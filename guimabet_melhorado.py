@@ -0,0 +1,848 @@
+"""Storage and business functions shared by the player app, the admin panel
+and background jobs.
+
+Nothing here imports Streamlit or pandas, so CLIs, workers and benchmarks
+can import it without paying for the UI stack. Both app.py and
+admin_panel_enhanced.py do `from guimabet_melhorado import *`; the queue,
+rollup and counter helpers the pages use are re-exported from here too.
+The odds engine (NumPy) is only imported by the functions that price
+matches.
+"""
+import datetime
+import hashlib
+import sqlite3
+
+from cache import bump_generation, cached_read
+from db import get_connection, run_write_transaction
+from exposure import forget_user_exposure, get_exposure_overview, get_match_exposure, record_bet_exposure
+from ledger import (close_account, get_balance_at, get_ledger_entries, reconcile, record_entry, rename_ledger_user,
+                    set_points)
+from migrations import migrate
+from profiler import profiled
+from rollups import (forget_user, get_daily_volume, get_status_totals, get_top_bettors, record_bet,
+                     rename_user)
+from settlement import (enqueue_custom_bet_settlement, enqueue_match_settlement, get_settlement_jobs,
+                        match_result, retry_settlement_job, settle_custom_bets, settle_match_bets,
+                        start_worker)
+
+# Initialize the database if it doesn't exist, applying any pending schema
+# migrations. Cheap when the schema is current: one PRAGMA user_version read.
+def init_db():
+    if migrate():
+        invalidate_name_cache()
+
+# Process-wide id -> name lookup for teams and players, loaded in one query.
+# add_team, add_player and init_db drop it after inserting rows.
+_name_cache = None
+
+def _load_names():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT 'team', id, name FROM teams
+    UNION ALL
+    SELECT 'player', id, name FROM players
+    ''')
+    names = {'team': {}, 'player': {}}
+    for kind, item_id, name in c.fetchall():
+        names[kind][item_id] = name
+    return names
+
+def _lookup_name(kind, item_id):
+    global _name_cache
+    names = _name_cache
+    if names is None:
+        names = _name_cache = _load_names()
+    if item_id in names[kind]:
+        return names[kind][item_id]
+    # Ids are AUTOINCREMENT, so an id above the highest one we know was most
+    # likely inserted by another process (e.g. the admin panel): reload once
+    if isinstance(item_id, int) and item_id > max(names[kind], default=0):
+        names = _name_cache = _load_names()
+        return names[kind].get(item_id)
+    return None
+
+def invalidate_name_cache():
+    global _name_cache
+    _name_cache = None
+
+# Get team name by ID
+@profiled
+def get_team_name(team_id):
+    name = _lookup_name('team', team_id)
+    return name if name is not None else "Unknown Team"
+
+# Get player name by ID
+@profiled
+def get_player_name(player_id):
+    name = _lookup_name('player', player_id)
+    return name if name is not None else "Unknown Player"
+
+# Login function
+@profiled
+def login(username, password):
+    conn = get_connection()
+    c = conn.cursor()
+    hashed_password = hashlib.sha256(password.encode()).hexdigest()
+    c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hashed_password))
+    user = c.fetchone()
+    return user
+
+# Register function; the admin user form also sets the starting points and role
+@profiled
+def register(username, password, points=100, is_admin=False):
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
+                 (username, hashed_password, points, 1 if is_admin else 0))
+        if points:
+            record_entry(c, username, 'signup', points)
+        bump_generation(c)
+        conn.commit()
+        return True
+    except:
+        conn.rollback()
+        return False
+
+# Get upcoming matches
+@profiled
+@cached_read
+def get_upcoming_matches():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
+           o.team1_win, o.draw, o.team2_win,
+           COALESCE(t1.name, 'Unknown Team') AS team1_name, COALESCE(t2.name, 'Unknown Team') AS team2_name
+    FROM matches m
+    LEFT JOIN odds o ON m.id = o.match_id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    WHERE m.status = 'upcoming' OR m.status = 'live'
+    ORDER BY m.starts_at, m.id
+    ''')
+    matches = [dict(row) for row in c.fetchall()]
+    return matches
+
+# Get match history
+@profiled
+@cached_read
+def get_match_history():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT m.id, m.team1_id, m.team2_id, m.date, m.time, m.status, m.team1_score, m.team2_score,
+           o.team1_win, o.draw, o.team2_win,
+           COALESCE(t1.name, 'Unknown Team') AS team1_name, COALESCE(t2.name, 'Unknown Team') AS team2_name
+    FROM matches m
+    LEFT JOIN odds o ON m.id = o.match_id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    WHERE m.status = 'completed'
+    ORDER BY m.starts_at DESC, m.id DESC
+    ''')
+    matches = [dict(row) for row in c.fetchall()]
+    return matches
+
+# Get custom bets for a match
+@profiled
+@cached_read
+def get_custom_bets(match_id=None):
+    conn = get_connection()
+    c = conn.cursor()
+    
+    if match_id:
+        c.execute('''
+        SELECT * FROM custom_bets WHERE match_id = ? AND status = 'pending'
+        ''', (match_id,))
+    else:
+        c.execute('SELECT * FROM custom_bets WHERE status = "pending"')
+    
+    custom_bets = [dict(row) for row in c.fetchall()]
+    return custom_bets
+
+# Everything home_page needs in two queries: every open match with its odds
+# and team names (get_upcoming_matches) and all of their pending custom bets
+# with player names, grouped under each match as match['custom_bets']
+@profiled
+@cached_read
+def get_home_feed():
+    matches = get_upcoming_matches()
+    by_id = {}
+    for match in matches:
+        match['custom_bets'] = []
+        by_id[match['id']] = match
+    
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT cb.id, cb.match_id, cb.description, cb.odds, cb.player_id, cb.status,
+           COALESCE(p.name, 'Unknown Player') AS player_name
+    FROM custom_bets cb
+    JOIN matches m ON cb.match_id = m.id
+    LEFT JOIN players p ON cb.player_id = p.id
+    WHERE cb.status = 'pending' AND m.status IN ('upcoming', 'live')
+    ORDER BY cb.id
+    ''')
+    for row in c.fetchall():
+        match = by_id.get(row['match_id'])
+        if match is not None:
+            match['custom_bets'].append(dict(row))
+    return matches
+
+# Current points of a user (0 if the user no longer exists)
+@profiled
+def get_user_points(username):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT points FROM users WHERE username = ?", (username,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+# Get user bets
+@profiled
+def get_user_bets(username):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT b.id, b.match_id, b.bet_type, b.amount, b.odds, b.status, b.timestamp, b.custom_bet_id, b.player_id,
+           m.team1_id, m.team2_id, m.date, m.time, m.status as match_status, m.team1_score, m.team2_score,
+           COALESCE(t1.name, 'Unknown Team') AS team1_name, COALESCE(t2.name, 'Unknown Team') AS team2_name
+    FROM bets b
+    JOIN matches m ON b.match_id = m.id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    WHERE b.user_id = ?
+    ORDER BY b.placed_at DESC, b.id DESC
+    ''', (username,))
+    bets = [dict(row) for row in c.fetchall()]
+    return bets
+
+# Bets per page of the bet history
+BET_HISTORY_PAGE_SIZE = 20
+
+# One page of a user's bets, newest first, keyed on (placed_at, id) so every
+# page is a single range scan of idx_bets_user_placed_at no matter how many
+# bets come before it. Custom bet descriptions and player names are joined
+# in. Pass the returned cursor back to get the next page; it is None on the
+# last page.
+@profiled
+def get_user_bets_page(username, cursor=None, limit=BET_HISTORY_PAGE_SIZE):
+    conn = get_connection()
+    c = conn.cursor()
+    keyset = "AND (b.placed_at, b.id) < (?, ?)" if cursor else ""
+    c.execute(f'''
+    SELECT b.id, b.match_id, b.bet_type, b.amount, b.odds, b.status, b.timestamp, b.placed_at, b.custom_bet_id,
+           b.player_id,
+           m.team1_id, m.team2_id, m.date, m.time, m.status as match_status, m.team1_score, m.team2_score,
+           COALESCE(t1.name, 'Unknown Team') AS team1_name, COALESCE(t2.name, 'Unknown Team') AS team2_name,
+           cb.description AS custom_description, p.name AS custom_player_name
+    FROM bets b
+    JOIN matches m ON b.match_id = m.id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    LEFT JOIN custom_bets cb ON b.custom_bet_id = cb.id
+    LEFT JOIN players p ON cb.player_id = p.id
+    WHERE b.user_id = ? {keyset}
+    ORDER BY b.placed_at DESC, b.id DESC
+    LIMIT ?
+    ''', (username, *(cursor or ()), limit + 1))
+    bets = [dict(row) for row in c.fetchall()]
+    if len(bets) <= limit:
+        return bets, None
+    bets = bets[:limit]
+    return bets, (bets[-1]['placed_at'], bets[-1]['id'])
+
+# Raised inside place_bet's transaction to roll it back with a user message
+class _BetRejected(Exception):
+    pass
+
+# Kinds of bet place_bet accepts; 'custom' needs a custom_bet_id
+BET_TYPES = ('team1_win', 'draw', 'team2_win', 'custom')
+
+# Place bet function. The debit, the open-match check and the insert happen
+# in one short write transaction, so concurrent sessions can't overspend.
+@profiled
+def place_bet(username, match_id, bet_type, amount, custom_bet_id=None, player_id=None):
+    # A non-positive stake would credit the user through the debit below
+    if bet_type not in BET_TYPES or (bet_type == 'custom') != (custom_bet_id is not None):
+        return False, "Tipo de aposta inválido"
+    if amount != int(amount) or amount <= 0:
+        return False, "O valor da aposta deve ser um número inteiro positivo"
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    def write(c):
+        # Debit only if the user can cover the stake
+        c.execute("UPDATE users SET points = points - ? WHERE username = ? AND points >= ?",
+                  (amount, username, amount))
+        if c.rowcount == 0:
+            c.execute("SELECT 1 FROM users WHERE username = ?", (username,))
+            raise _BetRejected("Pontos insuficientes" if c.fetchone() else "Usuário não encontrado")
+        
+        # Record the bet only while the match (and custom bet) is open for
+        # betting, at the odds on offer right now; settlement pays these.
+        # A bet without odds is refused by the bets_require_odds trigger.
+        try:
+            c.execute('''
+            INSERT INTO bets (user_id, match_id, bet_type, amount, status, timestamp, placed_at, custom_bet_id, player_id,
+                              odds)
+            SELECT ?, m.id, ?, ?, 'pending', ?, CAST(strftime('%s', ?) AS INTEGER), ?, ?,
+                   COALESCE(cb.odds, CASE ? WHEN 'team1_win' THEN o.team1_win WHEN 'draw' THEN o.draw
+                                            WHEN 'team2_win' THEN o.team2_win END)
+            FROM matches m
+            LEFT JOIN odds o ON o.match_id = m.id
+            LEFT JOIN custom_bets cb ON cb.id = ? AND cb.match_id = m.id AND cb.status = 'pending'
+            WHERE m.id = ? AND m.status IN ('upcoming', 'live')
+              AND (? IS NULL OR cb.id IS NOT NULL)
+            ''', (username, bet_type, amount, timestamp, timestamp, custom_bet_id, player_id, bet_type,
+                  custom_bet_id, match_id, custom_bet_id))
+        except sqlite3.IntegrityError:
+            raise _BetRejected("Odds indisponíveis para esta aposta")
+        if c.rowcount == 0:
+            raise _BetRejected("Apostas fechadas para este jogo")
+        
+        bet_id = c.lastrowid
+        record_entry(c, username, 'bet', -amount, f"bet:{bet_id}")
+        record_bet_exposure(c, [bet_id])
+        record_bet(c, username, timestamp[:10], amount)
+        bump_generation(c)
+    
+    try:
+        run_write_transaction(write)
+    except _BetRejected as e:
+        return False, str(e)
+    return True, "Aposta realizada com sucesso!"
+
+# Admin functions
+@profiled
+def add_match(team1_id, team2_id, date, time):
+    # strftime needs a two-digit hour ('9:00' -> '09:00')
+    if time[1:2] == ':':
+        time = '0' + time
+    
+    def write(c):
+        c.execute('''
+        INSERT INTO matches (team1_id, team2_id, date, time, starts_at, status)
+        VALUES (?, ?, ?, ?, CAST(strftime('%s', ? || ' ' || ?) AS INTEGER), ?)
+        ''', (team1_id, team2_id, date, time, date, time, 'upcoming'))
+        
+        match_id = c.lastrowid
+        
+        # Price from team strengths fitted on every completed match
+        from odds_engine import price_match
+        team1_win, draw, team2_win = price_match(c, team1_id, team2_id)
+        
+        c.execute('''
+        INSERT INTO odds (match_id, team1_win, draw, team2_win)
+        VALUES (?, ?, ?, ?)
+        ''', (match_id, team1_win, draw, team2_win))
+        
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+@profiled
+def update_match_result(match_id, team1_score, team2_score):
+    conn = get_connection()
+    c = conn.cursor()
+    
+    try:
+        # Update match status and scores
+        c.execute('''
+        UPDATE matches 
+        SET status = 'completed', team1_score = ?, team2_score = ?
+        WHERE id = ?
+        ''', (team1_score, team2_score, match_id))
+        
+        # Settle all standard bets for this match in a few set-based statements
+        settle_match_bets(c, match_id, match_result(team1_score, team2_score))
+        
+        bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return True
+
+@profiled
+def set_match_live(match_id):
+    def write(c):
+        c.execute("UPDATE matches SET status = 'live' WHERE id = ?", (match_id,))
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+@profiled
+def add_team(name):
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute("INSERT INTO teams (name) VALUES (?)", (name,))
+        bump_generation(c)
+        conn.commit()
+        invalidate_name_cache()
+        return True
+    except:
+        conn.rollback()
+        return False
+
+@profiled
+def add_player(name, team_id):
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute("INSERT INTO players (name, team_id) VALUES (?, ?)", (name, team_id))
+        bump_generation(c)
+        conn.commit()
+        invalidate_name_cache()
+        return True
+    except:
+        conn.rollback()
+        return False
+
+@profiled
+def add_custom_bet(match_id, description, odds, player_id=None):
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''
+        INSERT INTO custom_bets (match_id, description, odds, player_id, status)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (match_id, description, odds, player_id, 'pending'))
+        bump_generation(c)
+        conn.commit()
+        return True
+    except Exception as e:
+        print(e)
+        conn.rollback()
+        return False
+
+@profiled
+def update_custom_bet_result(custom_bet_id, result):
+    conn = get_connection()
+    c = conn.cursor()
+    
+    try:
+        # Update custom bet status and result
+        c.execute('''
+        UPDATE custom_bets 
+        SET status = 'completed', result = ?
+        WHERE id = ?
+        ''', (result, custom_bet_id))
+        
+        # Settle all bets for this custom bet
+        settle_custom_bets(c, custom_bet_id, result)
+        
+        bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return True
+
+@profiled
+@cached_read
+def get_all_teams():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM teams ORDER BY name")
+    teams = [dict(row) for row in c.fetchall()]
+    return teams
+
+@profiled
+@cached_read
+def get_all_players():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM players ORDER BY name")
+    players = [dict(row) for row in c.fetchall()]
+    return players
+
+@profiled
+def get_team_players(team_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM players WHERE team_id = ? ORDER BY name", (team_id,))
+    players = [dict(row) for row in c.fetchall()]
+    return players
+
+@profiled
+def get_match_players(match_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT p.* FROM players p
+    JOIN matches m ON (p.team_id = m.team1_id OR p.team_id = m.team2_id)
+    WHERE m.id = ?
+    ORDER BY p.name
+    ''', (match_id,))
+    players = [dict(row) for row in c.fetchall()]
+    return players
+
+@profiled
+@cached_read
+def get_all_users():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT username, points, is_admin FROM users ORDER BY points DESC")
+    users = [dict(row) for row in c.fetchall()]
+    return users
+
+# Dashboard counters (total_users, open_matches, pending_bets,
+# pending_proposals) in one read of the trigger-maintained counters table
+@profiled
+def get_counters():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT name, value FROM counters")
+    return {row['name']: row['value'] for row in c.fetchall()}
+
+# Rows per leaderboard page
+LEADERBOARD_PAGE_SIZE = 20
+
+# One page (1-based) of the leaderboard, ordered by points through
+# idx_users_points. Ties share a rank. Returns (rows, has_more).
+@profiled
+def get_leaderboard(page=1, page_size=LEADERBOARD_PAGE_SIZE):
+    offset = (page - 1) * page_size
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT username, points FROM users
+    ORDER BY points DESC, username
+    LIMIT ? OFFSET ?
+    ''', (page_size + 1, offset))
+    rows = [dict(row) for row in c.fetchall()]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not rows:
+        return rows, has_more
+    
+    # Everyone above a row has strictly more points, except ties with the
+    # row before it, so only the first row's rank needs a query
+    c.execute("SELECT COUNT(*) FROM users WHERE points > ?", (rows[0]['points'],))
+    rank = c.fetchone()[0] + 1
+    for i, row in enumerate(rows):
+        if i > 0 and row['points'] < rows[i - 1]['points']:
+            rank = offset + i + 1
+        row['rank'] = rank
+    return rows, has_more
+
+# Rank of a single user with one indexed count, or None if the user doesn't exist
+@profiled
+def get_user_rank(username):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT u.username, u.points,
+           (SELECT COUNT(*) FROM users WHERE points > u.points) + 1 AS rank
+    FROM users u
+    WHERE u.username = ?
+    ''', (username,))
+    row = c.fetchone()
+    return dict(row) if row else None
+
+@profiled
+def update_user_points(username, points):
+    def write(c):
+        set_points(c, username, points)
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+@profiled
+def update_user(username, new_username=None, new_points=None, is_admin=None):
+    def write(c):
+        user = username
+        if new_username and new_username != user:
+            # Check if new username already exists
+            c.execute("SELECT * FROM users WHERE username = ?", (new_username,))
+            if c.fetchone():
+                return False, "Nome de usuário já existe."
+            
+            # Update username in users table
+            c.execute("UPDATE users SET username = ? WHERE username = ?", (new_username, user))
+            
+            # Update username in bets table
+            c.execute("UPDATE bets SET user_id = ? WHERE user_id = ?", (new_username, user))
+            c.execute("UPDATE custom_bet_proposals SET username = ? WHERE username = ?", (new_username, user))
+            rename_user(c, user, new_username)
+            rename_ledger_user(c, user, new_username)
+            
+            user = new_username
+        
+        if new_points is not None:
+            set_points(c, user, new_points)
+        
+        if is_admin is not None:
+            c.execute("UPDATE users SET is_admin = ? WHERE username = ?", (1 if is_admin else 0, user))
+        
+        bump_generation(c)
+        return True, "Usuário atualizado com sucesso!"
+    
+    return run_write_transaction(write)
+
+@profiled
+def delete_user(username):
+    def write(c):
+        # Delete user's bets first
+        forget_user(c, username)
+        forget_user_exposure(c, username)
+        c.execute("DELETE FROM bets WHERE user_id = ?", (username,))
+        c.execute("DELETE FROM custom_bet_proposals WHERE username = ?", (username,))
+        
+        # Delete user, writing off the balance in the ledger
+        close_account(c, username)
+        c.execute("DELETE FROM users WHERE username = ?", (username,))
+        
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+# Odds categories (Gols, Jogadores, ...) in creation order
+@profiled
+@cached_read
+def get_odds_categories():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, name, description FROM odds_categories ORDER BY id")
+    return [dict(row) for row in c.fetchall()]
+
+# Bet templates of one category, or of all of them
+@profiled
+@cached_read
+def get_odds_templates(category_id=None):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT id, category_id, name, description, bet_type, default_odds, requires_player
+    FROM odds_templates
+    WHERE ? IS NULL OR category_id = ?
+    ORDER BY category_id, id
+    ''', (category_id, category_id))
+    return [dict(row) for row in c.fetchall()]
+
+@profiled
+def add_custom_odds_template(category_id, name, description, bet_type, default_odds, requires_player=False):
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''
+        INSERT INTO odds_templates (category_id, name, description, bet_type, default_odds, requires_player)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (category_id, name, description, bet_type, default_odds, 1 if requires_player else 0))
+        bump_generation(c)
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return False, "Já existe um template com este tipo de aposta."
+    return True, "Template criado com sucesso!"
+
+# Odds of a match with template, category and player names, in category order
+@profiled
+def get_match_odds(match_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT mo.id, mo.match_id, mo.template_id, mo.player_id, mo.odds_value, mo.updated_by, mo.updated_at,
+           t.name AS template_name, t.description, t.bet_type, oc.name AS category_name, p.name AS player_name
+    FROM match_odds mo
+    JOIN odds_templates t ON mo.template_id = t.id
+    JOIN odds_categories oc ON t.category_id = oc.id
+    LEFT JOIN players p ON mo.player_id = p.id
+    WHERE mo.match_id = ?
+    ORDER BY oc.id, t.id, p.name
+    ''', (match_id,))
+    return [dict(row) for row in c.fetchall()]
+
+# Price a match from every template at its default odds in one statement:
+# one row per template, or one per player of either team for player
+# templates. Odds the match already has are kept. Returns the rows created.
+@profiled
+def create_match_odds(match_id, username):
+    def write(c):
+        c.execute('''
+        INSERT OR IGNORE INTO match_odds (match_id, template_id, player_id, odds_value, created_by, created_at)
+        SELECT m.id, t.id, p.id, t.default_odds, ?, ?
+        FROM matches m
+        JOIN odds_templates t
+        LEFT JOIN players p ON t.requires_player = 1 AND p.team_id IN (m.team1_id, m.team2_id)
+        WHERE m.id = ? AND (t.requires_player = 0 OR p.id IS NOT NULL)
+        ''', (username, _now(), match_id))
+        created = c.rowcount
+        bump_generation(c)
+        return created
+    
+    return run_write_transaction(write)
+
+# Append odds changes of a match to odds_history inside the caller's
+# transaction. `changes` holds (market, player_id, old_odds, new_odds);
+# market is the 1X2 column name or the template's bet_type.
+def record_odds_changes(c, match_id, changes, username, reason=None):
+    now = _now()
+    c.executemany('''
+    INSERT INTO odds_history (match_id, market, player_id, old_odds, new_odds, changed_by, reason, changed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CAST(strftime('%s', ?) AS INTEGER))
+    ''', [(match_id, market, player_id, old, new, username, reason, now)
+          for market, player_id, old, new in changes if old != new])
+
+# Change the 1X2 odds of a match. Bets already placed keep the odds they
+# were accepted at.
+@profiled
+def update_odds(match_id, team1_win, draw, team2_win, username, reason=None):
+    def write(c):
+        c.execute("SELECT team1_win, draw, team2_win FROM odds WHERE match_id = ?", (match_id,))
+        current = c.fetchone()
+        if current is None:
+            return False
+        c.execute("UPDATE odds SET team1_win = ?, draw = ?, team2_win = ? WHERE match_id = ?",
+                  (team1_win, draw, team2_win, match_id))
+        record_odds_changes(c, match_id, [('team1_win', None, current['team1_win'], team1_win),
+                                          ('draw', None, current['draw'], draw),
+                                          ('team2_win', None, current['team2_win'], team2_win)],
+                            username, reason)
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+# Reprice the 1X2 odds of every upcoming match from one fit of the league,
+# in one transaction, logging each change. Live matches keep their odds.
+# Returns the number of matches repriced.
+@profiled
+def reprice_upcoming_matches(username, margin=None, reason="Recálculo pelo motor de odds"):
+    from odds_engine import price_fixtures
+    
+    def write(c):
+        c.execute('''
+        SELECT m.id, m.team1_id, m.team2_id, o.team1_win, o.draw, o.team2_win
+        FROM matches m
+        JOIN odds o ON o.match_id = m.id
+        WHERE m.status = 'upcoming'
+        ''')
+        matches = c.fetchall()
+        prices = price_fixtures(c, [(m['team1_id'], m['team2_id']) for m in matches], margin)
+        c.executemany("UPDATE odds SET team1_win = ?, draw = ?, team2_win = ? WHERE match_id = ?",
+                      [(*price, m['id']) for m, price in zip(matches, prices)])
+        for m, (team1_win, draw, team2_win) in zip(matches, prices):
+            record_odds_changes(c, m['id'], [('team1_win', None, m['team1_win'], team1_win),
+                                             ('draw', None, m['draw'], draw),
+                                             ('team2_win', None, m['team2_win'], team2_win)],
+                                username, reason)
+        bump_generation(c)
+        return len(matches)
+    
+    return run_write_transaction(write)
+
+@profiled
+def update_match_odds(odds_id, odds_value, username, reason=None):
+    def write(c):
+        c.execute('''
+        SELECT mo.match_id, mo.player_id, mo.odds_value, t.bet_type
+        FROM match_odds mo
+        JOIN odds_templates t ON mo.template_id = t.id
+        WHERE mo.id = ?
+        ''', (odds_id,))
+        current = c.fetchone()
+        if current is None:
+            return False
+        c.execute('''
+        UPDATE match_odds SET odds_value = ?, updated_by = ?, updated_at = ?, update_reason = ?
+        WHERE id = ?
+        ''', (odds_value, username, _now(), reason, odds_id))
+        record_odds_changes(c, current['match_id'],
+                            [(current['bet_type'], current['player_id'], current['odds_value'], odds_value)],
+                            username, reason)
+        bump_generation(c)
+        return True
+    
+    return run_write_transaction(write)
+
+# Latest odds changes of a match, newest first; a range scan of
+# idx_odds_history_match_changed_at
+@profiled
+def get_odds_history(match_id, limit=50):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT h.id, h.market, h.player_id, p.name AS player_name, h.old_odds, h.new_odds, h.changed_by, h.reason,
+           h.changed_at, datetime(h.changed_at, 'unixepoch') AS changed_time
+    FROM odds_history h
+    LEFT JOIN players p ON h.player_id = p.id
+    WHERE h.match_id = ?
+    ORDER BY h.changed_at DESC, h.id DESC
+    LIMIT ?
+    ''', (match_id, limit))
+    return [dict(row) for row in c.fetchall()]
+
+# A player's idea for a custom bet, queued for review while the match is open
+@profiled
+def propose_custom_bet(username, match_id, description, proposed_odds):
+    def write(c):
+        c.execute('''
+        INSERT INTO custom_bet_proposals (username, match_id, description, proposed_odds, status, created_at)
+        SELECT ?, id, ?, ?, 'pending', ?
+        FROM matches
+        WHERE id = ? AND status IN ('upcoming', 'live')
+        ''', (username, description, proposed_odds, _now(), match_id))
+        if c.rowcount == 0:
+            return False, "Apostas fechadas para este jogo"
+        bump_generation(c)
+        return True, "Proposta enviada para revisão!"
+    
+    return run_write_transaction(write)
+
+# Proposals (all, or only those with `status` / by `username`), newest
+# first, with the match's teams and kick-off
+@profiled
+def get_custom_bet_proposals(status=None, username=None):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT cp.*, m.team1_id, m.team2_id, m.date, m.time,
+           COALESCE(t1.name, 'Unknown Team') AS team1_name, COALESCE(t2.name, 'Unknown Team') AS team2_name
+    FROM custom_bet_proposals cp
+    JOIN matches m ON cp.match_id = m.id
+    LEFT JOIN teams t1 ON m.team1_id = t1.id
+    LEFT JOIN teams t2 ON m.team2_id = t2.id
+    WHERE (? IS NULL OR cp.status = ?) AND (? IS NULL OR cp.username = ?)
+    ORDER BY cp.created_at DESC, cp.id DESC
+    ''', (status, status, username, username))
+    return [dict(row) for row in c.fetchall()]
+
+# Approve or reject a pending proposal. Approving creates the custom bet at
+# final_odds (or the proposed odds) in the same transaction.
+@profiled
+def review_custom_bet_proposal(proposal_id, admin_username, action, response=None, final_odds=None):
+    status = 'approved' if action == 'approve' else 'rejected'
+    
+    def write(c):
+        c.execute('''
+        UPDATE custom_bet_proposals
+        SET status = ?, reviewed_by = ?, reviewed_at = ?, admin_response = ?
+        WHERE id = ? AND status = 'pending'
+        ''', (status, admin_username, _now(), response, proposal_id))
+        if c.rowcount == 0:
+            return False, "Proposta já revisada"
+        
+        if status == 'approved':
+            c.execute('''
+            INSERT INTO custom_bets (match_id, description, odds, status)
+            SELECT match_id, description, COALESCE(?, proposed_odds), 'pending'
+            FROM custom_bet_proposals WHERE id = ?
+            ''', (final_odds, proposal_id))
+            c.execute("UPDATE custom_bet_proposals SET custom_bet_id = ? WHERE id = ?", (c.lastrowid, proposal_id))
+        
+        bump_generation(c)
+        return True, "Proposta revisada!"
+    
+    return run_write_transaction(write)
@@ -0,0 +1,240 @@
+"""Append-only ledger of every change to users.points, with balance snapshots.
+
+Each change to a balance appends a points_ledger row. The kinds are:
+
+    opening     balance a user had when the ledger started (or loadgen gave)
+    signup      registration bonus
+    bet         stake debited by place_bet, ref "bet:<id>"
+    payout      winnings credited by settlement, ref "match:<id>" / "custom_bet:<id>"
+    adjustment  admin edit of a balance (new minus old)
+    closure     balance written off when a user is deleted
+
+Each row is written in the same transaction as the change, so users.points
+is a materialized sum of the user's rows. Triggers refuse deletes and any
+change to an entry. The one exception is user_id, which a rename carries
+over.
+
+take_snapshot() writes a balance_snapshots row for every user with entries
+since the previous snapshot. The settlement worker takes one every
+SNAPSHOT_INTERVAL seconds when idle. A balance at any moment is then the
+latest snapshot before it plus the few entries after it, two range reads
+on (user_id, ...) indexes. A reconciliation does the same for every user,
+without replaying bets.
+
+    python ledger.py snapshot      take a snapshot now
+    python ledger.py reconcile     list users whose points disagree with the ledger
+"""
+import argparse
+import datetime
+import os
+
+from cache import bump_generation
+from db import get_connection, run_write_transaction
+from profiler import profiled
+
+# Seconds between the snapshots the settlement worker takes
+SNAPSHOT_INTERVAL = float(os.environ.get('GUIMABET_SNAPSHOT_INTERVAL', 3600))
+
+def _now():
+    return int(datetime.datetime.now().timestamp())
+
+
+# Id of the newest ledger entry; entries appended after it have larger ids
+def last_entry_id(c):
+    return c.execute("SELECT COALESCE(MAX(id), 0) FROM points_ledger").fetchone()[0]
+
+
+# Append one entry. The caller changes users.points in the same transaction.
+def record_entry(c, user_id, kind, delta, ref=None):
+    c.execute("INSERT INTO points_ledger (user_id, kind, delta, ref, created_at) VALUES (?, ?, ?, ?, ?)",
+              (user_id, kind, delta, ref, _now()))
+
+
+# Append the entries produced by `select_sql`, which yields (user_id, delta)
+# rows, then credit them to users.points; returns the number of entries
+def record_and_apply(c, kind, ref, select_sql, params=()):
+    after = last_entry_id(c)
+    c.execute(f'''
+    INSERT INTO points_ledger (user_id, kind, delta, ref, created_at)
+    SELECT user_id, ?, delta, ?, ? FROM ({select_sql}) WHERE delta <> 0
+    ''', (kind, ref, _now(), *params))
+    c.execute('''
+    UPDATE users SET points = points + l.total
+    FROM (SELECT user_id, SUM(delta) AS total FROM points_ledger WHERE id > ? GROUP BY user_id) AS l
+    WHERE users.username = l.user_id
+    ''', (after,))
+    return c.execute("SELECT COUNT(*) FROM points_ledger WHERE id > ?", (after,)).fetchone()[0]
+
+
+# Set a balance to `points`, recording the difference as an adjustment
+def set_points(c, username, points, ref=None):
+    c.execute('''
+    INSERT INTO points_ledger (user_id, kind, delta, ref, created_at)
+    SELECT username, 'adjustment', ? - points, ?, ? FROM users
+    WHERE username = ? AND points <> ?
+    ''', (points, ref, _now(), username, points))
+    c.execute("UPDATE users SET points = ? WHERE username = ?", (points, username))
+
+
+# Write off the balance of a user that is about to be deleted
+def close_account(c, username):
+    c.execute('''
+    INSERT INTO points_ledger (user_id, kind, delta, ref, created_at)
+    SELECT username, 'closure', -points, NULL, ? FROM users
+    WHERE username = ? AND points <> 0
+    ''', (_now(), username))
+
+
+def rename_ledger_user(c, user_id, new_user_id):
+    c.execute("UPDATE points_ledger SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+    c.execute("UPDATE balance_snapshots SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+
+
+# An opening entry for every user the ledger has not seen, at their current
+# points (balances that predate the ledger, or users inserted directly)
+def record_opening_balances(c):
+    c.execute('''
+    INSERT INTO points_ledger (user_id, kind, delta, ref, created_at)
+    SELECT username, 'opening', points, NULL, ? FROM users u
+    WHERE points <> 0 AND NOT EXISTS (SELECT 1 FROM points_ledger l WHERE l.user_id = u.username)
+    ''', (_now(),))
+
+
+# Snapshot every user with entries since the previous snapshot, inside the
+# caller's transaction; returns the number of rows written. Afterwards every
+# entry up to the new ledger_snapshot_id is inside its user's latest snapshot.
+def take_snapshot(c):
+    previous = c.execute("SELECT COALESCE(MAX(value), 0) FROM app_meta WHERE key = 'ledger_snapshot_id'").fetchone()[0]
+    upto = last_entry_id(c)
+    now = _now()
+    c.execute('''
+    INSERT INTO balance_snapshots (user_id, ledger_id, balance, taken_at)
+    SELECT l.user_id, ?,
+           COALESCE((SELECT s.balance FROM balance_snapshots s WHERE s.user_id = l.user_id
+                     ORDER BY s.ledger_id DESC LIMIT 1), 0) + SUM(l.delta),
+           ?
+    FROM points_ledger l
+    WHERE l.id > ? AND l.id <= ?
+    GROUP BY l.user_id
+    ''', (upto, now, previous, upto))
+    written = c.rowcount
+    c.executemany("INSERT INTO app_meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                  [('ledger_snapshot_id', upto), ('ledger_snapshot_at', now)])
+    return written
+
+
+# Take a snapshot if SNAPSHOT_INTERVAL has passed and there are new entries;
+# called by the settlement worker between jobs
+def snapshot_if_due(interval=None):
+    interval = SNAPSHOT_INTERVAL if interval is None else interval
+    c = get_connection().cursor()
+    meta = dict(c.execute('''
+    SELECT key, value FROM app_meta WHERE key IN ('ledger_snapshot_id', 'ledger_snapshot_at')
+    ''').fetchall())
+    if _now() - meta.get('ledger_snapshot_at', 0) < interval or last_entry_id(c) <= meta.get('ledger_snapshot_id', 0):
+        return 0
+    return run_write_transaction(take_snapshot)
+
+
+# Balance of a user just after ledger entry `upto` (now when None), from
+# their latest snapshot before it plus the entries since
+def _balance_at(c, username, upto):
+    snapshot = c.execute('''
+    SELECT ledger_id, balance FROM balance_snapshots
+    WHERE user_id = ? AND ledger_id <= ?
+    ORDER BY ledger_id DESC LIMIT 1
+    ''', (username, upto)).fetchone()
+    since, balance = snapshot if snapshot else (0, 0)
+    balance += c.execute('''
+    SELECT COALESCE(SUM(delta), 0) FROM points_ledger WHERE user_id = ? AND id > ? AND id <= ?
+    ''', (username, since, upto)).fetchone()[0]
+    return balance
+
+
+# Balance of a user at a moment (a datetime or epoch seconds; now when None)
+@profiled
+def get_balance_at(username, when=None):
+    c = get_connection().cursor()
+    if when is None:
+        return _balance_at(c, username, last_entry_id(c))
+    if isinstance(when, datetime.datetime):
+        when = int(when.timestamp())
+    # Entries are appended in time order, so the ones up to `when` are an id prefix
+    last = c.execute('''
+    SELECT id FROM points_ledger WHERE created_at <= ? ORDER BY created_at DESC, id DESC LIMIT 1
+    ''', (when,)).fetchone()
+    return _balance_at(c, username, last[0]) if last else 0
+
+
+# Newest ledger entries of a user, with the balance after each one
+@profiled
+def get_ledger_entries(username, limit=50):
+    c = get_connection().cursor()
+    c.execute('''
+    SELECT id, kind, delta, ref, created_at, datetime(created_at, 'unixepoch') AS created_time
+    FROM points_ledger WHERE user_id = ?
+    ORDER BY id DESC LIMIT ?
+    ''', (username, limit))
+    entries = [dict(row) for row in c.fetchall()]
+    if entries:
+        balance = _balance_at(c, username, entries[0]['id'])
+        for entry in entries:
+            entry['balance'] = balance
+            balance -= entry['delta']
+    return entries
+
+
+# Users whose users.points differ from their ledger balance, and balances
+# left on users that no longer exist; an empty list means the books agree.
+# A balance is the user's latest snapshot plus the entries after the last
+# snapshot, a rowid range, so nothing older is read.
+@profiled
+def reconcile():
+    c = get_connection().cursor()
+    c.execute('''
+    WITH balances AS (
+        SELECT user_id, SUM(delta) AS balance FROM (
+            SELECT user_id, balance AS delta FROM (
+                SELECT user_id, MAX(ledger_id), balance FROM balance_snapshots GROUP BY user_id
+            )
+            UNION ALL
+            SELECT user_id, delta FROM points_ledger
+            WHERE id > (SELECT COALESCE(MAX(value), 0) FROM app_meta WHERE key = 'ledger_snapshot_id')
+        )
+        GROUP BY user_id
+    )
+    SELECT u.username AS user_id, u.points, COALESCE(b.balance, 0) AS ledger_balance
+    FROM users u LEFT JOIN balances b ON b.user_id = u.username
+    WHERE u.points IS NOT COALESCE(b.balance, 0)
+    UNION ALL
+    SELECT b.user_id, NULL, b.balance
+    FROM balances b
+    WHERE b.balance <> 0 AND NOT EXISTS (SELECT 1 FROM users WHERE username = b.user_id)
+    ''')
+    return [dict(row) for row in c.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["snapshot", "reconcile"])
+    args = parser.parse_args()
+
+    from migrations import migrate
+    migrate()
+
+    if args.command == "snapshot":
+        def write(c):
+            written = take_snapshot(c)
+            bump_generation(c)
+            return written
+
+        print(f"Snapshot taken for {run_write_transaction(write)} users")
+    else:
+        mismatches = reconcile()
+        for row in mismatches:
+            print(f"{row['user_id']}: points {row['points']}, ledger {row['ledger_balance']}")
+        print(f"{len(mismatches)} mismatches")
+
+
+if __name__ == "__main__":
+    main()
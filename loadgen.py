@@ -0,0 +1,212 @@
+"""Build a synthetic guimabet database of a chosen size from a reproducible seed.
+
+    python loadgen.py staging.db --users 10000 --matches 2000 --bets 1000000 [--seed 42]
+
+The database gets users, teams, players, matches with odds, custom bets and
+bets shaped like production data: most matches are finished, with scores
+and settled bets, and the rest are upcoming or live with pending bets.
+Bets are placed in the week before their match and written match by
+match in kick-off order, so ids roughly follow time as they do live.
+Rows go in through bulk_io, so counters and rollups come out consistent.
+The same seed and sizes always give the same rows.
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import random
+
+import db
+from bulk_io import insert_rows
+from db import get_connection
+from ledger import record_opening_balances
+from migrations import migrate
+from settlement import match_result
+
+# Defaults, scaled for a small league with a busy season
+DEFAULT_SIZES = {
+    'users': 1000,
+    'teams': 20,
+    'players': 200,
+    'matches': 500,
+    'custom_bets': 1000,
+    'bets': 100000,
+}
+
+# Share of matches already played; the rest are split between live and upcoming
+COMPLETED_SHARE = 0.8
+LIVE_SHARE = 0.05
+
+# Share of bets placed on a custom bet when the match has any
+CUSTOM_BET_SHARE = 0.2
+
+DAY = 86400
+
+BET_TYPES = ['team1_win', 'draw', 'team2_win']
+
+CUSTOM_BET_TEMPLATES = ["{} marca um gol", "{} marca dois gols", "{} dá uma assistência", "{} recebe cartão"]
+
+
+def _timestamp(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _users(rng, count):
+    password = hashlib.sha256("senha".encode()).hexdigest()
+    return [(f"user{i}", password, rng.randrange(100, 100000), 0) for i in range(count)]
+
+
+def _matches(rng, count, team_ids, now):
+    completed = int(count * COMPLETED_SHARE)
+    live = int(count * LIVE_SHARE)
+    matches = []
+    for i in range(count):
+        if i < completed:
+            starts_at = now - rng.randrange(1, 365) * DAY
+            status = 'completed'
+        elif i < completed + live:
+            starts_at = now - rng.randrange(3600)
+            status = 'live'
+        else:
+            starts_at = now + rng.randrange(1, 60) * DAY
+            status = 'upcoming'
+        starts_at -= starts_at % 3600
+        team1_id, team2_id = rng.sample(team_ids, 2)
+        scored = status == 'completed'
+        matches.append({
+            'team1_id': team1_id,
+            'team2_id': team2_id,
+            'starts_at': starts_at,
+            'status': status,
+            'team1_score': rng.randrange(6) if scored else None,
+            'team2_score': rng.randrange(6) if scored else None,
+            'team1_win': round(rng.uniform(1.5, 3.0), 2),
+            'draw': round(rng.uniform(2.0, 4.0), 2),
+            'team2_win': round(rng.uniform(1.8, 3.5), 2),
+        })
+    matches.sort(key=lambda match: match['starts_at'])
+    for match_id, match in enumerate(matches, start=1):
+        match['id'] = match_id
+        stamp = _timestamp(match.pop('starts_at'))
+        match['date'], match['time'] = stamp[:10], stamp[11:16]
+    return matches
+
+
+# Bets of every match, match by match in kick-off order, each one placed
+# during the week before kick-off (or before `now` for open matches)
+def _bets(rng, count, matches, custom_by_match, user_count, now):
+    per_match = [0] * len(matches)
+    for _ in range(count):
+        per_match[rng.randrange(len(matches))] += 1
+
+    for match, bets in zip(matches, per_match):
+        kickoff = int(datetime.datetime.fromisoformat(f"{match['date']} {match['time']}")
+                      .replace(tzinfo=datetime.timezone.utc).timestamp())
+        latest = min(kickoff, now)
+        placed = sorted(latest - rng.randrange(7 * DAY) for _ in range(bets))
+        settled = match['status'] == 'completed'
+        result = match_result(match['team1_score'], match['team2_score']) if settled else None
+        custom_bets = custom_by_match.get(match['id'], [])
+
+        for placed_at in placed:
+            bet = {
+                'id': None,
+                'user_id': f"user{rng.randrange(user_count)}",
+                'match_id': match['id'],
+                'amount': rng.randrange(10, 500),
+                'timestamp': _timestamp(placed_at),
+                'custom_bet_id': None,
+                'player_id': None,
+            }
+            if custom_bets and rng.random() < CUSTOM_BET_SHARE:
+                custom_bet = rng.choice(custom_bets)
+                bet['bet_type'] = 'custom'
+                bet['custom_bet_id'] = custom_bet['id']
+                bet['player_id'] = custom_bet['player_id']
+                bet['odds'] = custom_bet['odds']
+                won = custom_bet['result'] == 'yes'
+            else:
+                bet['bet_type'] = rng.choice(BET_TYPES)
+                bet['odds'] = match[bet['bet_type']]
+                won = bet['bet_type'] == result
+            bet['status'] = ('won' if won else 'lost') if settled else 'pending'
+            yield bet
+
+
+# Create the database at `path` (which must not exist yet) and fill it.
+# Returns the row count of every table generated.
+def generate(path, seed=42, **sizes):
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists; loadgen only fills a new database")
+    sizes = {**DEFAULT_SIZES, **sizes}
+    rng = random.Random(seed)
+    # Dates are relative to a fixed point so the same seed gives the same rows
+    now = int(datetime.datetime(2026, 6, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+    db.set_db_path(path)
+    migrate()
+
+    conn = get_connection()
+    conn.executemany("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
+                     _users(rng, sizes['users']))
+    record_opening_balances(conn.cursor())
+    conn.commit()
+
+    existing = conn.execute("SELECT COUNT(*) FROM teams").fetchone()[0]
+    insert_rows('teams', ({'id': None, 'name': f"Time {i}"} for i in range(existing + 1, sizes['teams'] + 1)),
+                verb="Generated")
+    team_ids = [row[0] for row in conn.execute("SELECT id FROM teams")]
+
+    players = [{'id': i, 'name': f"Jogador {i}", 'team_id': rng.choice(team_ids)}
+               for i in range(1, sizes['players'] + 1)]
+    insert_rows('players', players, verb="Generated")
+    players_by_team = {}
+    for player in players:
+        players_by_team.setdefault(player['team_id'], []).append(player)
+
+    matches = _matches(rng, sizes['matches'], team_ids, now)
+    insert_rows('matches', matches, verb="Generated")
+
+    custom_bets = []
+    custom_by_match = {}
+    for custom_bet_id in range(1, sizes['custom_bets'] + 1):
+        match = rng.choice(matches)
+        squad = players_by_team.get(match['team1_id'], []) + players_by_team.get(match['team2_id'], [])
+        player = rng.choice(squad) if squad else None
+        finished = match['status'] == 'completed'
+        custom_bet = {
+            'id': custom_bet_id,
+            'match_id': match['id'],
+            'description': rng.choice(CUSTOM_BET_TEMPLATES).format(player['name'] if player else "Alguém"),
+            'odds': round(rng.uniform(1.5, 6.0), 2),
+            'player_id': player['id'] if player else None,
+            'status': 'completed' if finished else 'pending',
+            'result': rng.choice(['yes', 'no']) if finished else None,
+        }
+        custom_bets.append(custom_bet)
+        custom_by_match.setdefault(match['id'], []).append(custom_bet)
+    insert_rows('custom_bets', custom_bets, verb="Generated")
+
+    insert_rows('bets', _bets(rng, sizes['bets'], matches, custom_by_match, sizes['users'], now),
+                verb="Generated")
+
+    conn.execute("PRAGMA optimize")
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('users', 'teams', 'players', 'matches', 'custom_bets', 'bets')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--seed", type=int, default=42)
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    args = parser.parse_args()
+
+    counts = generate(args.path, args.seed, **{name: getattr(args, name) for name in DEFAULT_SIZES})
+    for table, count in counts.items():
+        print(f"{table:>12}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,585 @@
+"""Versioned schema migrations keyed on PRAGMA user_version.
+
+Each migration runs once per database, in order, inside one write
+transaction that also bumps user_version. Add new steps to the end of
+MIGRATIONS; never edit one that has shipped.
+"""
+import hashlib
+
+from cache import bump_generation
+from db import get_connection
+from exposure import rebuild_exposure
+from ledger import record_opening_balances, take_snapshot
+from rollups import rebuild_rollups
+
+
+# v1: the original schema and seed rows. Uses IF NOT EXISTS so databases
+# created before migrations existed (user_version 0) upgrade in place.
+def _base_schema(c):
+    # Create users table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT,
+        points INTEGER,
+        is_admin INTEGER
+    )
+    ''')
+    
+    # Create teams table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS teams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT
+    )
+    ''')
+    
+    # Create players table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        team_id INTEGER,
+        FOREIGN KEY (team_id) REFERENCES teams (id)
+    )
+    ''')
+    
+    # Create matches table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS matches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        team1_id INTEGER,
+        team2_id INTEGER,
+        date TEXT,
+        time TEXT,
+        status TEXT DEFAULT 'upcoming',
+        team1_score INTEGER DEFAULT NULL,
+        team2_score INTEGER DEFAULT NULL,
+        FOREIGN KEY (team1_id) REFERENCES teams (id),
+        FOREIGN KEY (team2_id) REFERENCES teams (id)
+    )
+    ''')
+    
+    # Create odds table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS odds (
+        match_id INTEGER,
+        team1_win REAL,
+        draw REAL,
+        team2_win REAL,
+        FOREIGN KEY (match_id) REFERENCES matches (id)
+    )
+    ''')
+    
+    # Create bets table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        match_id INTEGER,
+        bet_type TEXT,
+        amount INTEGER,
+        status TEXT DEFAULT 'pending',
+        timestamp TEXT,
+        custom_bet_id INTEGER DEFAULT NULL,
+        player_id INTEGER DEFAULT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (username),
+        FOREIGN KEY (match_id) REFERENCES matches (id),
+        FOREIGN KEY (custom_bet_id) REFERENCES custom_bets (id),
+        FOREIGN KEY (player_id) REFERENCES players (id)
+    )
+    ''')
+    
+    # Create custom bets table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS custom_bets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        match_id INTEGER,
+        description TEXT,
+        odds REAL,
+        player_id INTEGER DEFAULT NULL,
+        status TEXT DEFAULT 'pending',
+        result TEXT DEFAULT NULL,
+        FOREIGN KEY (match_id) REFERENCES matches (id),
+        FOREIGN KEY (player_id) REFERENCES players (id)
+    )
+    ''')
+    
+    # Create settlement jobs table (results waiting for the background worker)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS settlement_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT UNIQUE,
+        kind TEXT,
+        target_id INTEGER,
+        result TEXT,
+        status TEXT DEFAULT 'queued',
+        total INTEGER DEFAULT 0,
+        processed INTEGER DEFAULT 0,
+        error TEXT DEFAULT NULL,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    
+    # Insert default admin user if not exists
+    c.execute("SELECT * FROM users WHERE username = 'admin'")
+    if not c.fetchone():
+        hashed_password = hashlib.sha256("123".encode()).hexdigest()
+        c.execute("INSERT INTO users (username, password, points, is_admin) VALUES (?, ?, ?, ?)",
+                 ("admin", hashed_password, 1000, 1))
+    
+    # Insert default teams if not exists
+    default_teams = ["Tropa da Sônia", "Cubanos", "Dynamos", "Os Feras", "Gaviões", "Leões do Recreio"]
+    for team in default_teams:
+        c.execute("SELECT * FROM teams WHERE name = ?", (team,))
+        if not c.fetchone():
+            c.execute("INSERT INTO teams (name) VALUES (?)", (team,))
+
+
+# v2: indexes for the hot paths (settlement, bet history, custom bets of a
+# match, open matches ordered by date/time)
+def _hot_path_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_match_status ON bets (match_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_user_timestamp ON bets (user_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_custom_bet_status ON bets (custom_bet_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_custom_bets_match_status ON custom_bets (match_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_status_date_time ON matches (status, date, time)")
+
+
+# v3: key/value table holding the data generation counter used by the read
+# cache (see cache.py)
+def _app_meta(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''')
+    c.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('generation', 0)")
+
+
+# v4: leaderboard index; serves both the ordered pages and rank counts
+def _leaderboard_index(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_points ON users (points DESC, username)")
+
+
+# v5: counters behind the admin dashboard, kept current by triggers so every
+# write path (UI, settlement worker, imports) maintains them. Bets only
+# leave 'pending' through settlement, which adjusts pending_bets once per
+# statement instead of paying a row trigger for every settled bet.
+def _dashboard_counters(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    c.execute('''
+    INSERT OR REPLACE INTO counters (name, value)
+    SELECT 'total_users', COUNT(*) FROM users
+    UNION ALL
+    SELECT 'open_matches', COUNT(*) FROM matches WHERE status IN ('upcoming', 'live')
+    UNION ALL
+    SELECT 'pending_bets', COUNT(*) FROM bets WHERE status = 'pending'
+    UNION ALL
+    SELECT 'pending_proposals', 0
+    ''')
+
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_users_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'total_users';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_users_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'total_users';
+    END
+    ''')
+
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_matches_insert AFTER INSERT ON matches
+    WHEN NEW.status IN ('upcoming', 'live')
+    BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'open_matches';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_matches_update AFTER UPDATE OF status ON matches
+    WHEN COALESCE(OLD.status IN ('upcoming', 'live'), 0) <> COALESCE(NEW.status IN ('upcoming', 'live'), 0)
+    BEGIN
+        UPDATE counters SET value = value + (CASE WHEN NEW.status IN ('upcoming', 'live') THEN 1 ELSE -1 END)
+        WHERE name = 'open_matches';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_matches_delete AFTER DELETE ON matches
+    WHEN OLD.status IN ('upcoming', 'live')
+    BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'open_matches';
+    END
+    ''')
+
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_bets_insert AFTER INSERT ON bets
+    WHEN NEW.status = 'pending'
+    BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'pending_bets';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_bets_delete AFTER DELETE ON bets
+    WHEN OLD.status = 'pending'
+    BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'pending_bets';
+    END
+    ''')
+
+
+# v6: per-day, per-user and per-status betting totals for the reports page,
+# filled from the existing bets (see rollups.py for how they stay current)
+def _bet_rollups(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bet_rollup_daily (
+        day TEXT PRIMARY KEY,
+        bets INTEGER NOT NULL DEFAULT 0,
+        volume INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bet_rollup_user (
+        user_id TEXT PRIMARY KEY,
+        bets INTEGER NOT NULL DEFAULT 0,
+        volume INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bet_rollup_user_volume ON bet_rollup_user (volume DESC)")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bet_rollup_status (
+        status TEXT PRIMARY KEY,
+        bets INTEGER NOT NULL DEFAULT 0,
+        volume INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    rebuild_rollups(c)
+
+
+# v7: integer epoch columns for ordering and range scans; the text columns
+# stay for display. Times are the app's naive local wall-clock strings read
+# as UTC, which keeps their order and makes strftime('%s', ...) the one
+# conversion used everywhere. The text-ordered indexes they replace go.
+def _epoch_columns(c):
+    c.execute("ALTER TABLE bets ADD COLUMN placed_at INTEGER")
+    c.execute("UPDATE bets SET placed_at = CAST(strftime('%s', timestamp) AS INTEGER)")
+    c.execute("ALTER TABLE matches ADD COLUMN starts_at INTEGER")
+    c.execute("UPDATE matches SET starts_at = CAST(strftime('%s', date || ' ' || time) AS INTEGER)")
+
+    c.execute("DROP INDEX IF EXISTS idx_bets_user_timestamp")
+    c.execute("DROP INDEX IF EXISTS idx_matches_status_date_time")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_user_placed_at ON bets (user_id, placed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_placed_at ON bets (placed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_status_starts_at ON matches (status, starts_at)")
+
+
+# v8: odds catalogue used by the admin panel (categories of bet templates,
+# per-match odds generated from them) and bet proposals sent by users, with
+# the dashboard's pending_proposals counter kept by triggers
+def _odds_catalogue(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS odds_categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        description TEXT
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS odds_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER,
+        name TEXT,
+        description TEXT,
+        bet_type TEXT UNIQUE,
+        default_odds REAL,
+        requires_player INTEGER DEFAULT 0,
+        FOREIGN KEY (category_id) REFERENCES odds_categories (id)
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_odds_templates_category ON odds_templates (category_id)")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS match_odds (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        match_id INTEGER,
+        template_id INTEGER,
+        player_id INTEGER DEFAULT NULL,
+        odds_value REAL,
+        created_by TEXT,
+        created_at TEXT,
+        updated_by TEXT DEFAULT NULL,
+        updated_at TEXT DEFAULT NULL,
+        update_reason TEXT DEFAULT NULL,
+        FOREIGN KEY (match_id) REFERENCES matches (id),
+        FOREIGN KEY (template_id) REFERENCES odds_templates (id),
+        FOREIGN KEY (player_id) REFERENCES players (id)
+    )
+    ''')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_match_odds_match_template_player "
+              "ON match_odds (match_id, template_id, COALESCE(player_id, 0))")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS custom_bet_proposals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        match_id INTEGER,
+        description TEXT,
+        proposed_odds REAL,
+        status TEXT DEFAULT 'pending',
+        created_at TEXT,
+        reviewed_by TEXT DEFAULT NULL,
+        reviewed_at TEXT DEFAULT NULL,
+        admin_response TEXT DEFAULT NULL,
+        custom_bet_id INTEGER DEFAULT NULL,
+        FOREIGN KEY (username) REFERENCES users (username),
+        FOREIGN KEY (match_id) REFERENCES matches (id),
+        FOREIGN KEY (custom_bet_id) REFERENCES custom_bets (id)
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_custom_bet_proposals_status ON custom_bet_proposals (status, created_at)")
+
+    categories = [
+        ("Gols", "Apostas sobre o número de gols da partida", [
+            ("Mais de 2.5 gols", "A partida termina com 3 gols ou mais", "over_2_5", 1.9, 0),
+            ("Menos de 2.5 gols", "A partida termina com 2 gols ou menos", "under_2_5", 1.9, 0),
+            ("Ambas marcam", "Os dois times marcam pelo menos um gol", "both_score", 1.8, 0),
+        ]),
+        ("Jogadores", "Apostas sobre o desempenho de um jogador", [
+            ("Jogador marca", "O jogador marca pelo menos um gol", "player_scores", 3.0, 1),
+            ("Jogador dá assistência", "O jogador dá pelo menos uma assistência", "player_assists", 3.5, 1),
+        ]),
+        ("Disciplina", "Apostas sobre cartões", [
+            ("Cartão vermelho", "Algum jogador recebe cartão vermelho", "red_card", 4.0, 0),
+        ]),
+    ]
+    for name, description, templates in categories:
+        c.execute("INSERT OR IGNORE INTO odds_categories (name, description) VALUES (?, ?)", (name, description))
+        c.execute("SELECT id FROM odds_categories WHERE name = ?", (name,))
+        category_id = c.fetchone()[0]
+        c.executemany('''
+        INSERT OR IGNORE INTO odds_templates (category_id, name, description, bet_type, default_odds, requires_player)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(category_id, *template) for template in templates])
+
+    c.execute('''
+    UPDATE counters SET value = (SELECT COUNT(*) FROM custom_bet_proposals WHERE status = 'pending')
+    WHERE name = 'pending_proposals'
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_proposals_insert AFTER INSERT ON custom_bet_proposals
+    WHEN NEW.status = 'pending'
+    BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'pending_proposals';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_proposals_update AFTER UPDATE OF status ON custom_bet_proposals
+    WHEN COALESCE(OLD.status = 'pending', 0) <> COALESCE(NEW.status = 'pending', 0)
+    BEGIN
+        UPDATE counters SET value = value + (CASE WHEN NEW.status = 'pending' THEN 1 ELSE -1 END)
+        WHERE name = 'pending_proposals';
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS counters_proposals_delete AFTER DELETE ON custom_bet_proposals
+    WHEN OLD.status = 'pending'
+    BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'pending_proposals';
+    END
+    ''')
+
+
+# v9: the odds a bet was accepted at, stored on the bet so settlement pays
+# from the bet row alone, and an append-only log of odds changes per match.
+# Existing bets take the odds on file now, which is what settlement would
+# have paid them.
+def _bet_odds(c):
+    c.execute("ALTER TABLE bets ADD COLUMN odds REAL")
+    c.execute('''
+    UPDATE bets SET odds = CASE bets.bet_type
+        WHEN 'team1_win' THEN o.team1_win WHEN 'draw' THEN o.draw WHEN 'team2_win' THEN o.team2_win END
+    FROM odds o
+    WHERE bets.custom_bet_id IS NULL AND o.match_id = bets.match_id
+    ''')
+    c.execute('''
+    UPDATE bets SET odds = cb.odds
+    FROM custom_bets cb
+    WHERE bets.custom_bet_id = cb.id
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS bets_require_odds BEFORE INSERT ON bets
+    WHEN NEW.odds IS NULL
+    BEGIN
+        SELECT RAISE(ABORT, 'bets.odds is required');
+    END
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS odds_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        match_id INTEGER NOT NULL,
+        market TEXT NOT NULL,
+        player_id INTEGER,
+        old_odds REAL,
+        new_odds REAL NOT NULL,
+        changed_by TEXT,
+        reason TEXT,
+        changed_at INTEGER NOT NULL,
+        FOREIGN KEY (match_id) REFERENCES matches (id)
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_odds_history_match_changed_at ON odds_history (match_id, changed_at)")
+
+
+# v10: odds rows are looked up and updated by match; batch repricing made
+# the missing index show (one full scan of odds per match)
+def _odds_match_index(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_odds_match ON odds (match_id)")
+
+
+# v11: stake and potential payout of the pending bets on every open outcome
+# (see exposure.py for how it stays current), filled from the pending bets
+def _match_exposure(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS match_exposure (
+        match_id INTEGER NOT NULL,
+        custom_bet_id INTEGER NOT NULL DEFAULT 0,
+        outcome TEXT NOT NULL,
+        bets INTEGER NOT NULL DEFAULT 0,
+        stake INTEGER NOT NULL DEFAULT 0,
+        payout INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (match_id, custom_bet_id, outcome)
+    ) WITHOUT ROWID
+    ''')
+    rebuild_exposure(c)
+
+
+# v12: append-only ledger of balance changes and its snapshots (see
+# ledger.py). Balances from before the ledger start as one opening entry
+# per user, snapshotted right away.
+def _points_ledger(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS points_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        ref TEXT,
+        created_at INTEGER NOT NULL
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_points_ledger_user ON points_ledger (user_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_points_ledger_created_at ON points_ledger (created_at)")
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS points_ledger_no_delete BEFORE DELETE ON points_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'points_ledger is append-only');
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS points_ledger_no_update BEFORE UPDATE OF id, kind, delta, ref, created_at ON points_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'points_ledger is append-only');
+    END
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS balance_snapshots (
+        user_id TEXT NOT NULL,
+        ledger_id INTEGER NOT NULL,
+        balance INTEGER NOT NULL,
+        taken_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, ledger_id)
+    ) WITHOUT ROWID
+    ''')
+    record_opening_balances(c)
+    take_snapshot(c)
+
+
+# v13: feed_generation, a counter that only moves when something the live
+# sections show changes (matches, odds, custom bets, team and player
+# names). Triggers bump it for every writer, so pages can poll it instead
+# of rerunning their queries; bets and balances leave it alone.
+def _feed_generation(c):
+    c.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('feed_generation', 0)")
+    events = [(table, event) for table in ('matches', 'odds', 'custom_bets')
+              for event in ('INSERT', 'UPDATE', 'DELETE')]
+    events += [('teams', 'UPDATE OF name'), ('players', 'UPDATE OF name')]
+    for table, event in events:
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS feed_generation_{table}_{event.split()[0].lower()} AFTER {event} ON {table}
+        BEGIN
+            UPDATE app_meta SET value = value + 1 WHERE key = 'feed_generation';
+        END
+        ''')
+
+
+# v14: legacy times with a one-digit hour ('9:00') left starts_at NULL in
+# the v7 backfill, and get_upcoming_matches sorted those matches first. The
+# times are zero-padded and starts_at computed again for them.
+def _pad_match_times(c):
+    c.execute("UPDATE matches SET time = '0' || time WHERE time GLOB '[0-9]:*'")
+    c.execute('''
+    UPDATE matches SET starts_at = CAST(strftime('%s', date || ' ' || time) AS INTEGER)
+    WHERE starts_at IS NULL
+    ''')
+
+
+MIGRATIONS = [
+    (1, _base_schema),
+    (2, _hot_path_indexes),
+    (3, _app_meta),
+    (4, _leaderboard_index),
+    (5, _dashboard_counters),
+    (6, _bet_rollups),
+    (7, _epoch_columns),
+    (8, _odds_catalogue),
+    (9, _bet_odds),
+    (10, _odds_match_index),
+    (11, _match_exposure),
+    (12, _points_ledger),
+    (13, _feed_generation),
+    (14, _pad_match_times),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Bring the database up to SCHEMA_VERSION. Returns the versions applied,
+# which is an empty list (one PRAGMA read) when the schema is current.
+def migrate(conn=None):
+    conn = conn or get_connection()
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return []
+
+    c = conn.cursor()
+    applied = []
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        # Another process may have migrated while we waited for the lock
+        version = get_schema_version(conn)
+        for target, step in MIGRATIONS:
+            if target > version:
+                step(c)
+                c.execute(f"PRAGMA user_version = {target}")
+                applied.append(target)
+        # Migrations may rewrite data, so cached listings are stale
+        bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return applied
@@ -0,0 +1,167 @@
+"""Match odds from team strengths fitted on every completed match.
+
+Goals follow a Poisson model: the home side (team1) scores at
+mu * home * attack[team1] * defence[team2] and the away side at
+mu * attack[team2] * defence[team1]. mu is the league's goals per side per
+match. Strengths are the maximum-likelihood fixed point, solved with a few
+dozen vectorized passes of np.bincount over all matches at once. Older
+matches count less (HALF_LIFE_DAYS). Every team also gets PRIOR_MATCHES
+average games, so new or rarely seen teams price near the league average.
+
+Win/draw/loss probabilities come from the joint score grid up to
+MAX_GOALS. They are turned into decimal odds with a proportional margin
+(MARGIN, or GUIMABET_ODDS_MARGIN). The whole league is priced in one call.
+This module only reads the database; guimabet_melhorado writes the odds.
+"""
+import collections
+import math
+import os
+
+import numpy as np
+
+# Bookmaker margin added on top of fair odds (0.05 = 105% overround)
+MARGIN = float(os.environ.get('GUIMABET_ODDS_MARGIN', 0.05))
+
+# Weight of a match halves every HALF_LIFE_DAYS before the newest one
+HALF_LIFE_DAYS = 365
+
+# Average games every team is assumed to have played before its real ones
+PRIOR_MATCHES = 2.0
+
+# Goals per side per match when there is no history at all
+DEFAULT_GOALS = 1.35
+
+# Highest score per side in the probability grid
+MAX_GOALS = 10
+
+FIT_ITERATIONS = 50
+TOLERANCE = 1e-7
+
+# Odds are never offered below or above these
+MIN_ODDS = 1.01
+MAX_ODDS = 50.0
+
+Ratings = collections.namedtuple('Ratings', ['attack', 'defence', 'home', 'mu'])
+
+
+# Fit strengths from arrays of team ids, goals and per-match weights. Team
+# ids index the attack/defence arrays directly; ids above the largest one
+# seen price as average teams.
+def fit(team1_ids, team2_ids, team1_goals, team2_goals, weights=None, size=None):
+    team1_ids = np.asarray(team1_ids, dtype=np.int64)
+    team2_ids = np.asarray(team2_ids, dtype=np.int64)
+    team1_goals = np.asarray(team1_goals, dtype=np.float64)
+    team2_goals = np.asarray(team2_goals, dtype=np.float64)
+    weights = np.ones(len(team1_ids)) if weights is None else np.asarray(weights, dtype=np.float64)
+    size = max(size or 0, int(max(team1_ids.max(initial=0), team2_ids.max(initial=0))) + 1)
+
+    total_weight = weights.sum()
+    if total_weight == 0:
+        return Ratings(np.ones(size), np.ones(size), 1.0, DEFAULT_GOALS)
+    mu = float((weights * (team1_goals + team2_goals)).sum() / (2 * total_weight)) or DEFAULT_GOALS
+    home = float((weights * team1_goals).sum() / (weights * team2_goals).sum().clip(min=1e-9)) ** 0.5
+
+    def per_team(ids, values):
+        return np.bincount(ids, values, minlength=size)
+
+    scored = per_team(team1_ids, weights * team1_goals) + per_team(team2_ids, weights * team2_goals)
+    conceded = per_team(team1_ids, weights * team2_goals) + per_team(team2_ids, weights * team1_goals)
+    prior = PRIOR_MATCHES * mu
+
+    attack = np.ones(size)
+    defence = np.ones(size)
+    for _ in range(FIT_ITERATIONS):
+        # Goals each team would score/concede against its actual opponents
+        # with attack (or defence) 1, then the ratio to the real ones
+        attack_exposure = (per_team(team1_ids, weights * home * defence[team2_ids])
+                           + per_team(team2_ids, weights * defence[team1_ids]))
+        new_attack = (scored + prior) / (mu * attack_exposure + prior)
+        defence_exposure = (per_team(team2_ids, weights * home * new_attack[team1_ids])
+                            + per_team(team1_ids, weights * new_attack[team2_ids]))
+        new_defence = (conceded + prior) / (mu * defence_exposure + prior)
+        home = float((weights * team1_goals).sum()
+                     / (weights * mu * new_attack[team1_ids] * new_defence[team2_ids]).sum().clip(min=1e-9))
+
+        change = max(np.abs(new_attack - attack).max(), np.abs(new_defence - defence).max())
+        attack, defence = new_attack, new_defence
+        if change < TOLERANCE:
+            break
+    return Ratings(attack, defence, home, mu)
+
+
+def _strength(values, ids):
+    # Teams the fit never saw are average
+    padded = np.ones(max(len(values), int(ids.max(initial=0)) + 1))
+    padded[:len(values)] = values
+    return padded[ids]
+
+
+# Expected goals of each side for arrays of fixtures
+def expected_goals(ratings, team1_ids, team2_ids):
+    team1_ids = np.asarray(team1_ids, dtype=np.int64)
+    team2_ids = np.asarray(team2_ids, dtype=np.int64)
+    team1 = ratings.mu * ratings.home * _strength(ratings.attack, team1_ids) * _strength(ratings.defence, team2_ids)
+    team2 = ratings.mu * _strength(ratings.attack, team2_ids) * _strength(ratings.defence, team1_ids)
+    return team1, team2
+
+
+def _poisson_pmf(rates):
+    goals = np.arange(MAX_GOALS + 1)
+    log_factorial = np.array([math.lgamma(k + 1) for k in goals])
+    return np.exp(goals * np.log(rates[:, None]) - rates[:, None] - log_factorial)
+
+
+# (n, 3) array of team1_win/draw/team2_win probabilities
+def probabilities(ratings, team1_ids, team2_ids):
+    team1, team2 = expected_goals(ratings, team1_ids, team2_ids)
+    grid = _poisson_pmf(team1)[:, :, None] * _poisson_pmf(team2)[:, None, :]
+    result = np.stack([np.tril(grid, -1).sum(axis=(1, 2)),
+                       np.trace(grid, axis1=1, axis2=2),
+                       np.triu(grid, 1).sum(axis=(1, 2))], axis=1)
+    # Scores beyond the grid are spread proportionally
+    return result / result.sum(axis=1, keepdims=True)
+
+
+# Decimal odds with a proportional margin, rounded like the rest of the app
+# and kept within [MIN_ODDS, MAX_ODDS] (a probability of 0 gets MAX_ODDS)
+def to_odds(probs, margin=None):
+    margin = MARGIN if margin is None else margin
+    with np.errstate(divide='ignore'):
+        odds = 1 / (probs * (1 + margin))
+    return np.clip(np.round(odds, 2), MIN_ODDS, MAX_ODDS)
+
+
+# Completed matches as arrays for fit(); weights decay with age
+def load_history(c):
+    rows = c.execute('''
+    SELECT team1_id, team2_id, team1_score, team2_score, starts_at
+    FROM matches
+    WHERE status = 'completed' AND team1_score IS NOT NULL AND team2_score IS NOT NULL
+    ''').fetchall()
+    history = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    # A match without a parsable start counts as the newest one
+    starts_at = np.nan_to_num(history[:, 4], nan=np.nanmax(history[:, 4], initial=0))
+    age_days = (starts_at.max(initial=0) - starts_at) / 86400
+    weights = 0.5 ** (age_days / HALF_LIFE_DAYS)
+    return history[:, 0], history[:, 1], history[:, 2], history[:, 3], weights
+
+
+def fit_from_db(c):
+    size = c.execute("SELECT COALESCE(MAX(id), 0) FROM teams").fetchone()[0] + 1
+    team1_ids, team2_ids, team1_goals, team2_goals, weights = load_history(c)
+    return fit(team1_ids.astype(np.int64), team2_ids.astype(np.int64), team1_goals, team2_goals, weights, size)
+
+
+# Odds for a list of (team1_id, team2_id) fixtures from one fit of the
+# league; a list of (team1_win, draw, team2_win) float tuples
+def price_fixtures(c, fixtures, margin=None):
+    if not fixtures:
+        return []
+    ratings = fit_from_db(c)
+    team1_ids, team2_ids = zip(*fixtures)
+    odds = to_odds(probabilities(ratings, team1_ids, team2_ids), margin)
+    return [tuple(float(value) for value in row) for row in odds]
+
+
+def price_match(c, team1_id, team2_id, margin=None):
+    return price_fixtures(c, [(team1_id, team2_id)], margin)[0]
@@ -0,0 +1,190 @@
+"""Per-rerun profile of data access: calls, latency, rows and SQL statements.
+
+Data functions are wrapped with @profiled and raw queries in the pages go
+through profiled_block() or read_sql(). Each Streamlit script run is
+bracketed by start_run() / finish_run(); while a run is open, every SQL
+statement on the thread's connection is counted through sqlite's trace
+callback, so each function's numbers include the round-trips it made.
+Outside a run the wrappers cost one attribute lookup and nothing is traced.
+
+Finished runs are kept in a ring buffer per process (recent_runs(), shown
+in the admin "Relatórios" page). Set GUIMABET_PROFILE_FILE to also append
+every run to that file as one JSON line.
+"""
+import collections
+import contextlib
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+from db import get_connection
+
+# Runs kept in memory for the reports page
+RING_SIZE = 200
+
+# File every finished run is appended to as a JSON line (off when unset)
+PROFILE_FILE = os.environ.get('GUIMABET_PROFILE_FILE')
+
+_local = threading.local()
+_runs = collections.deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+
+
+class _Run:
+    def __init__(self, page):
+        self.page = page
+        self.started_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.functions = {}
+
+    def count_statement(self, _sql):
+        self.queries += 1
+
+    def record(self, name, seconds, rows, queries):
+        stats = self.functions.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'queries': 0})
+        ms = seconds * 1000
+        stats['calls'] += 1
+        stats['total_ms'] += ms
+        stats['max_ms'] = max(stats['max_ms'], ms)
+        stats['rows'] += rows
+        stats['queries'] += queries
+
+    def to_dict(self):
+        return {
+            'page': self.page,
+            'started_at': self.started_at,
+            'duration_ms': (time.perf_counter() - self.start) * 1000,
+            'queries': self.queries,
+            'functions': self.functions,
+        }
+
+
+# Rows in a data function's result: list length, the first element of a
+# (rows, cursor) pair, 0 for None and 1 for anything else
+def _count_rows(result):
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+# Open a profile for the current script run. The connection's trace
+# callback is only installed for the duration of the run.
+def start_run(page=None):
+    run = _Run(page)
+    _local.run = run
+    get_connection().set_trace_callback(run.count_statement)
+    return run
+
+
+# Name the page once the script has routed to it
+def set_page(page):
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.page = page
+
+
+def finish_run():
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return None
+    _local.run = None
+    get_connection().set_trace_callback(None)
+
+    entry = run.to_dict()
+    with _lock:
+        _runs.append(entry)
+        if PROFILE_FILE:
+            with open(PROFILE_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+
+def profiled(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = getattr(_local, 'run', None)
+        if run is None:
+            return fn(*args, **kwargs)
+        start, queries, result = time.perf_counter(), run.queries, None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        finally:
+            run.record(name, time.perf_counter() - start, _count_rows(result), run.queries - queries)
+
+    return wrapper
+
+
+class _Block:
+    rows = 0
+
+
+# Profile an inline query under `name`; set block.rows to record the rows
+@contextlib.contextmanager
+def profiled_block(name):
+    block = _Block()
+    run = getattr(_local, 'run', None)
+    if run is None:
+        yield block
+        return
+    start, queries = time.perf_counter(), run.queries
+    try:
+        yield block
+    finally:
+        run.record(name, time.perf_counter() - start, block.rows, run.queries - queries)
+
+
+# pandas.read_sql_query on the pooled connection, profiled under `name`
+def read_sql(name, sql, params=None):
+    import pandas as pd
+
+    with profiled_block(name) as block:
+        df = pd.read_sql_query(sql, get_connection(), params=params)
+        block.rows = len(df)
+    return df
+
+
+# Finished runs, oldest first
+def recent_runs():
+    with _lock:
+        return list(_runs)
+
+
+def clear_runs():
+    with _lock:
+        _runs.clear()
+
+
+# Totals over the recent runs: one row per page (runs, average and max
+# duration, average statements) and one per function (calls, total and
+# max latency, rows, statements), slowest first
+def profile_summary():
+    pages, functions = {}, {}
+    for run in recent_runs():
+        page = pages.setdefault(run['page'] or '-', {'runs': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0})
+        page['runs'] += 1
+        page['total_ms'] += run['duration_ms']
+        page['max_ms'] = max(page['max_ms'], run['duration_ms'])
+        page['queries'] += run['queries']
+        for name, stats in run['functions'].items():
+            total = functions.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'queries': 0})
+            total['calls'] += stats['calls']
+            total['total_ms'] += stats['total_ms']
+            total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+            total['rows'] += stats['rows']
+            total['queries'] += stats['queries']
+
+    page_rows = [{'page': name, 'runs': p['runs'], 'avg_ms': p['total_ms'] / p['runs'], 'max_ms': p['max_ms'],
+                  'avg_queries': p['queries'] / p['runs']} for name, p in pages.items()]
+    function_rows = [{'function': name, **stats} for name, stats in functions.items()]
+    page_rows.sort(key=lambda row: row['avg_ms'], reverse=True)
+    function_rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return page_rows, function_rows
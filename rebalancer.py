@@ -0,0 +1,126 @@
+"""Batch rebalancing of result odds from where the money is.
+
+Each pass prices every open match (upcoming or live) in one go. Its
+team1_win/draw/team2_win probabilities blend the odds engine's fitted
+probabilities with the share of the match's pending stake on each outcome
+(from match_exposure). The blend weight is stake / (stake + LIQUIDITY):
+a match with little money on it stays at the model's price. The more is
+staked, the more the odds follow the stake, but the model always keeps at
+least MODEL_FLOOR of the weight, so an outcome nobody backed still gets a
+finite price. Probabilities become odds with the target margin, capped at
+odds_engine.MAX_ODDS.
+
+The pass works on arrays for all matches at once. Only the matches whose
+odds moved are written, in one transaction, and every change gets an
+odds_history entry with REASON. Bets already placed keep their odds. The
+engine anchors every pass, so running it again on the same stakes changes
+nothing. It also overwrites manual edits on open matches.
+
+    python rebalancer.py [--margin 0.05] [--liquidity 5000] [--every SECONDS]
+
+With --every it keeps running, one pass per interval.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import odds_engine
+from cache import bump_generation
+from db import run_write_transaction
+from guimabet_melhorado import record_odds_changes
+from profiler import profiled
+
+# Pending stake (points) on a match at which the stake counts as much as the model
+LIQUIDITY = float(os.environ.get('GUIMABET_REBALANCE_LIQUIDITY', 5000))
+
+# Share of the blend the model keeps however much is staked
+MODEL_FLOOR = 0.2
+
+# Author and reason written to odds_history
+USERNAME = 'rebalancer'
+REASON = "Rebalanceamento por exposição"
+
+OUTCOMES = ('team1_win', 'draw', 'team2_win')
+
+
+# Probabilities moved towards each match's stake distribution; model and
+# stakes are (n, 3) arrays, liquidity must be positive
+def blend(model, stakes, liquidity=None):
+    liquidity = LIQUIDITY if liquidity is None else liquidity
+    if liquidity <= 0:
+        raise ValueError("liquidity must be positive")
+    total = stakes.sum(axis=1, keepdims=True)
+    share = np.divide(stakes, total, out=np.zeros_like(stakes), where=total > 0)
+    weight = np.minimum(total / (total + liquidity), 1 - MODEL_FLOOR)
+    return (1 - weight) * model + weight * share
+
+
+# Open matches with their current odds and pending stake per result outcome
+def _load_open_matches(c):
+    rows = c.execute('''
+    SELECT m.id, m.team1_id, m.team2_id, o.team1_win, o.draw, o.team2_win,
+           COALESCE(SUM(CASE WHEN e.outcome = 'team1_win' THEN e.stake END), 0),
+           COALESCE(SUM(CASE WHEN e.outcome = 'draw' THEN e.stake END), 0),
+           COALESCE(SUM(CASE WHEN e.outcome = 'team2_win' THEN e.stake END), 0)
+    FROM matches m
+    JOIN odds o ON o.match_id = m.id
+    LEFT JOIN match_exposure e ON e.match_id = m.id AND e.custom_bet_id = 0
+    WHERE m.status IN ('upcoming', 'live')
+    GROUP BY m.id
+    ''').fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, 9)
+
+
+# One pass over every open match; returns (matches checked, matches changed)
+@profiled
+def rebalance_odds(username=USERNAME, margin=None, liquidity=None, reason=REASON):
+    def write(c):
+        matches = _load_open_matches(c)
+        if not len(matches):
+            return 0, 0
+        ratings = odds_engine.fit_from_db(c)
+        model = odds_engine.probabilities(ratings, matches[:, 1], matches[:, 2])
+        current, stakes = matches[:, 3:6], matches[:, 6:9]
+        odds = odds_engine.to_odds(blend(model, stakes, liquidity), margin)
+
+        changed = np.flatnonzero((np.abs(odds - current) >= 0.005).any(axis=1))
+        c.executemany("UPDATE odds SET team1_win = ?, draw = ?, team2_win = ? WHERE match_id = ?",
+                      [(*odds[i].tolist(), int(matches[i, 0])) for i in changed])
+        for i in changed:
+            record_odds_changes(c, int(matches[i, 0]),
+                                [(outcome, None, float(old), float(new))
+                                 for outcome, old, new in zip(OUTCOMES, current[i], odds[i])],
+                                username, reason)
+        if len(changed):
+            bump_generation(c)
+        return len(matches), len(changed)
+
+    return run_write_transaction(write)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--margin", type=float, default=None, help=f"house margin (default {odds_engine.MARGIN})")
+    parser.add_argument("--liquidity", type=float, default=None, help=f"see LIQUIDITY (default {LIQUIDITY:g})")
+    parser.add_argument("--every", type=float, default=None, help="seconds between passes; one pass when unset")
+    args = parser.parse_args()
+    if args.liquidity is not None and args.liquidity <= 0:
+        parser.error("--liquidity must be positive")
+
+    from migrations import migrate
+    migrate()
+
+    while True:
+        start = time.perf_counter()
+        checked, changed = rebalance_odds(margin=args.margin, liquidity=args.liquidity)
+        print(f"{changed}/{checked} open matches rebalanced in {(time.perf_counter() - start) * 1000:.0f} ms",
+              flush=True)
+        if args.every is None:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
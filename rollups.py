@@ -0,0 +1,168 @@
+"""Betting rollups behind the admin reports: totals per day, per user and per status.
+
+The tables are maintained incrementally by the code that changes bets:
+place_bet adds each new bet, bulk imports add theirs a chunk at a time,
+settlement moves whole chunks from 'pending' to 'won'/'lost' with one
+grouped query, and deleting a user subtracts that user's bets. Reports read a few rollup rows instead of scanning bets.
+
+Existing data (or rollups that drifted after a manual edit of bets) is
+rebuilt from scratch with:
+
+    python rollups.py backfill
+"""
+import argparse
+
+from cache import bump_generation
+from db import get_connection
+from profiler import profiled
+
+
+# Count one new pending bet. `day` is the YYYY-MM-DD prefix of its timestamp.
+def record_bet(c, user_id, day, amount):
+    record_bets(c, [(user_id, day, 'pending', amount)])
+
+
+# Count a batch of new bets given as (user_id, day, status, amount). The
+# batch is summed here first, so each rollup row is written once per batch.
+def record_bets(c, bets):
+    daily, users, statuses = {}, {}, {}
+    for user_id, day, status, amount in bets:
+        for totals, key in ((daily, day), (users, user_id), (statuses, status)):
+            count, volume = totals.get(key, (0, 0))
+            totals[key] = (count + 1, volume + amount)
+
+    for table, column, totals in (('bet_rollup_daily', 'day', daily),
+                                  ('bet_rollup_user', 'user_id', users),
+                                  ('bet_rollup_status', 'status', statuses)):
+        c.executemany(f'''
+        INSERT INTO {table} ({column}, bets, volume) VALUES (?, ?, ?)
+        ON CONFLICT ({column}) DO UPDATE SET bets = bets + excluded.bets, volume = volume + excluded.volume
+        ''', [(key, count, volume) for key, (count, volume) in totals.items()])
+
+
+# Move settled bets out of 'pending'. `moved` holds (status, bets, volume)
+# per new status, as returned by a GROUP BY over the bets being settled.
+def record_settlement(c, moved):
+    for status, bets, volume in moved:
+        c.execute('''
+        INSERT INTO bet_rollup_status (status, bets, volume) VALUES (?, ?, ?)
+        ON CONFLICT (status) DO UPDATE SET bets = bets + excluded.bets, volume = volume + excluded.volume
+        ''', (status, bets, volume))
+        c.execute('''
+        UPDATE bet_rollup_status SET bets = bets - ?, volume = volume - ?
+        WHERE status = 'pending'
+        ''', (bets, volume))
+
+
+# Subtract every bet of a user that is about to be deleted
+def forget_user(c, user_id):
+    c.execute('''
+    UPDATE bet_rollup_daily SET bets = bets - d.n, volume = volume - d.total
+    FROM (
+        SELECT substr(timestamp, 1, 10) AS day, COUNT(*) AS n, SUM(amount) AS total
+        FROM bets WHERE user_id = ?
+        GROUP BY day
+    ) AS d
+    WHERE bet_rollup_daily.day = d.day
+    ''', (user_id,))
+    c.execute('''
+    UPDATE bet_rollup_status SET bets = bets - s.n, volume = volume - s.total
+    FROM (
+        SELECT status, COUNT(*) AS n, SUM(amount) AS total
+        FROM bets WHERE user_id = ?
+        GROUP BY status
+    ) AS s
+    WHERE bet_rollup_status.status = s.status
+    ''', (user_id,))
+    c.execute("DELETE FROM bet_rollup_user WHERE user_id = ?", (user_id,))
+
+
+def rename_user(c, user_id, new_user_id):
+    c.execute("UPDATE bet_rollup_user SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+
+
+# Recompute all three rollups from bets inside the caller's transaction
+def rebuild_rollups(c):
+    c.execute("DELETE FROM bet_rollup_daily")
+    c.execute('''
+    INSERT INTO bet_rollup_daily (day, bets, volume)
+    SELECT substr(timestamp, 1, 10), COUNT(*), SUM(amount)
+    FROM bets
+    GROUP BY 1
+    ''')
+    c.execute("DELETE FROM bet_rollup_user")
+    c.execute('''
+    INSERT INTO bet_rollup_user (user_id, bets, volume)
+    SELECT user_id, COUNT(*), SUM(amount)
+    FROM bets
+    GROUP BY user_id
+    ''')
+    c.execute("DELETE FROM bet_rollup_status")
+    c.execute('''
+    INSERT INTO bet_rollup_status (status, bets, volume)
+    SELECT status, COUNT(*), SUM(amount)
+    FROM bets
+    GROUP BY status
+    ''')
+
+
+# Bets and volume per status
+@profiled
+def get_status_totals():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT status, bets, volume FROM bet_rollup_status WHERE bets > 0 ORDER BY status")
+    return [dict(row) for row in c.fetchall()]
+
+
+@profiled
+def get_top_bettors(limit=10):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT user_id, bets, volume FROM bet_rollup_user
+    ORDER BY volume DESC
+    LIMIT ?
+    ''', (limit,))
+    return [dict(row) for row in c.fetchall()]
+
+
+# Bets and volume per day over the last `days` days, newest first
+@profiled
+def get_daily_volume(days=30):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT day, bets, volume FROM bet_rollup_daily
+    WHERE day >= date('now', ?) AND bets > 0
+    ORDER BY day DESC
+    ''', (f'-{days} days',))
+    return [dict(row) for row in c.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from migrations import migrate
+    migrate()
+
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        rebuild_rollups(c)
+        bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+
+    c.execute("SELECT COUNT(*), COALESCE(SUM(bets), 0) FROM bet_rollup_daily")
+    days, bets = c.fetchone()
+    print(f"Rollups rebuilt: {bets} bets over {days} days")
+
+
+if __name__ == "__main__":
+    main()
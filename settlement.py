@@ -0,0 +1,332 @@
+"""Set-based settlement of pending bets.
+
+Winners get their stake back plus int(amount * odds), the same rounding the
+per-bet loop used. The odds are the ones stored on the bet when it was
+placed, so later odds changes never affect bets already accepted.
+CAST(x AS INTEGER) truncates toward zero exactly like Python's int(), and
+amount * odds is the same IEEE double in both, so the credited points are
+identical.
+
+Results entered in the admin pages are queued in settlement_jobs and
+settled by a background worker thread in chunked transactions, so the
+Streamlit run that enqueued them never waits on the bets. Every process
+that serves a page runs a worker; a job another worker left 'running' is
+only claimed again once it has made no progress for STALE_AFTER seconds.
+"""
+import datetime
+import threading
+import traceback
+
+from cache import bump_generation
+from db import get_connection, run_write_transaction
+from exposure import release_exposure
+from ledger import record_and_apply, snapshot_if_due
+from profiler import profiled
+from rollups import record_settlement
+
+# Bets settled per transaction by the background worker
+CHUNK_SIZE = 5000
+
+# Seconds the idle worker sleeps before looking for queued jobs again
+POLL_INTERVAL = 2.0
+
+# Seconds a 'running' job can go without progress before another worker
+# takes it as abandoned by a process that died and claims it again. run_job
+# touches updated_at after every chunk, so a live worker never gets near it.
+STALE_AFTER = 60.0
+
+
+# Outcome of a match from its final score
+def match_result(team1_score, team2_score):
+    if team1_score > team2_score:
+        return 'team1_win'
+    elif team1_score < team2_score:
+        return 'team2_win'
+    return 'draw'
+
+
+# Bookkeeping shared by both settle functions once bets have left 'pending':
+# the dashboard's pending_bets counter and the report rollups. `moved` holds
+# (status, bets, volume) for each new status.
+def _settled(c, moved):
+    count = sum(row[1] for row in moved)
+    c.execute("UPDATE counters SET value = value - ? WHERE name = 'pending_bets'", (count,))
+    record_settlement(c, moved)
+    return count
+
+
+# Settle every pending standard bet of a match, or only those with
+# id <= up_to_id. Each bet pays at the odds it was accepted at (bets.odds),
+# so this only touches bets, users and the points ledger. Runs inside the caller's
+# transaction and returns the number of bets settled.
+def settle_match_bets(c, match_id, result, up_to_id=None):
+    # One payout entry per user with their aggregated winnings, credited in
+    # one statement
+    record_and_apply(c, 'payout', f"match:{match_id}", '''
+    SELECT user_id, SUM(amount + CAST(amount * odds AS INTEGER)) AS delta
+    FROM bets
+    WHERE match_id = ? AND status = 'pending' AND custom_bet_id IS NULL AND bet_type = ?
+      AND (? IS NULL OR id <= ?)
+    GROUP BY user_id
+    ''', (match_id, result, up_to_id, up_to_id))
+
+    # Totals per bet type for the exposure and (as won/lost) the rollups,
+    # then mark won/lost by comparing bet_type to the result
+    c.execute('''
+    SELECT bet_type, COUNT(*), SUM(amount), SUM(amount + CAST(amount * odds AS INTEGER))
+    FROM bets
+    WHERE match_id = ? AND status = 'pending' AND custom_bet_id IS NULL
+      AND (? IS NULL OR id <= ?)
+    GROUP BY bet_type
+    ''', (match_id, up_to_id, up_to_id))
+    settled = [tuple(row) for row in c.fetchall()]
+    release_exposure(c, match_id, None, settled)
+    moved = {}
+    for bet_type, bets, stake, _ in settled:
+        outcome = 'won' if bet_type == result else 'lost'
+        count, volume = moved.get(outcome, (0, 0))
+        moved[outcome] = (count + bets, volume + stake)
+    c.execute('''
+    UPDATE bets SET status = CASE WHEN bet_type = ? THEN 'won' ELSE 'lost' END
+    WHERE match_id = ? AND status = 'pending' AND custom_bet_id IS NULL
+      AND (? IS NULL OR id <= ?)
+    ''', (result, match_id, up_to_id, up_to_id))
+    return _settled(c, [(outcome, bets, volume) for outcome, (bets, volume) in moved.items()])
+
+
+# Settle every pending bet on a custom bet ('yes' pays out, anything else
+# loses) at each bet's accepted odds, or only those with id <= up_to_id
+def settle_custom_bets(c, custom_bet_id, result, up_to_id=None):
+    if result == 'yes':
+        record_and_apply(c, 'payout', f"custom_bet:{custom_bet_id}", '''
+        SELECT user_id, SUM(amount + CAST(amount * odds AS INTEGER)) AS delta
+        FROM bets
+        WHERE custom_bet_id = ? AND status = 'pending'
+          AND (? IS NULL OR id <= ?)
+        GROUP BY user_id
+        ''', (custom_bet_id, up_to_id, up_to_id))
+
+    outcome = 'won' if result == 'yes' else 'lost'
+    c.execute('''
+    SELECT match_id, bet_type, COUNT(*), SUM(amount), SUM(amount + CAST(amount * odds AS INTEGER))
+    FROM bets
+    WHERE custom_bet_id = ? AND status = 'pending'
+      AND (? IS NULL OR id <= ?)
+    GROUP BY match_id, bet_type
+    ''', (custom_bet_id, up_to_id, up_to_id))
+    settled = c.fetchall()
+    for match_id, bet_type, bets, stake, payout in settled:
+        release_exposure(c, match_id, custom_bet_id, [(bet_type, bets, stake, payout)])
+    moved = [(outcome, sum(row[2] for row in settled), sum(row[3] for row in settled))] if settled else []
+    c.execute('''
+    UPDATE bets SET status = ?
+    WHERE custom_bet_id = ? AND status = 'pending'
+      AND (? IS NULL OR id <= ?)
+    ''', (outcome, custom_bet_id, up_to_id, up_to_id))
+    return _settled(c, moved)
+
+
+def _now(ago=0):
+    return (datetime.datetime.now() - datetime.timedelta(seconds=ago)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Pending-bet filter for each kind of job
+_JOB_SCOPES = {
+    'match': "match_id = ? AND status = 'pending' AND custom_bet_id IS NULL",
+    'custom_bet': "custom_bet_id = ? AND status = 'pending'",
+}
+
+
+# Create the job row, or return the existing one for the same idempotency
+# key. close_sql marks the match/custom bet as finished in the same
+# transaction, so no new bets can come in once the job exists.
+def _enqueue(kind, target_id, result, close_sql, close_params):
+    key = f"{kind}:{target_id}"
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT * FROM settlement_jobs WHERE idempotency_key = ?", (key,))
+        job = c.fetchone()
+        if job is not None and job['status'] == 'failed':
+            job = _requeue(c, job['id'])
+        elif job is None:
+            c.execute(close_sql, close_params)
+            c.execute(f"SELECT COUNT(*) FROM bets WHERE {_JOB_SCOPES[kind]}", (target_id,))
+            total = c.fetchone()[0]
+            now = _now()
+            c.execute('''
+            INSERT INTO settlement_jobs (idempotency_key, kind, target_id, result, status, total, processed, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 'queued', ?, 0, ?, ?)
+            ''', (key, kind, target_id, result, total, now, now))
+            c.execute("SELECT * FROM settlement_jobs WHERE id = ?", (c.lastrowid,))
+            job = c.fetchone()
+            bump_generation(c)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    _wakeup.set()
+    return dict(job)
+
+
+# Queue settlement of a match result. Clicking "Finalizar" twice (or a rerun
+# firing it again) returns the job that already exists.
+@profiled
+def enqueue_match_settlement(match_id, team1_score, team2_score):
+    return _enqueue('match', match_id, match_result(team1_score, team2_score), '''
+    UPDATE matches
+    SET status = 'completed', team1_score = ?, team2_score = ?
+    WHERE id = ?
+    ''', (team1_score, team2_score, match_id))
+
+
+# Queue settlement of a custom bet result ('yes' / 'no')
+@profiled
+def enqueue_custom_bet_settlement(custom_bet_id, result):
+    return _enqueue('custom_bet', custom_bet_id, result, '''
+    UPDATE custom_bets
+    SET status = 'completed', result = ?
+    WHERE id = ?
+    ''', (result, custom_bet_id))
+
+
+# Jobs for the admin progress panel: everything still queued, running or
+# failed (waiting for a retry) plus the most recently finished ones
+@profiled
+def get_settlement_jobs(recent=5):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+    SELECT * FROM settlement_jobs WHERE status IN ('queued', 'running', 'failed')
+    UNION ALL
+    SELECT * FROM (
+        SELECT * FROM settlement_jobs WHERE status = 'done'
+        ORDER BY id DESC LIMIT ?
+    )
+    ''', (recent,))
+    return [dict(row) for row in c.fetchall()]
+
+
+# Claim the oldest queued job, or a running one whose worker stopped making
+# progress STALE_AFTER seconds ago
+# Put a failed job back in the queue; it resumes from the bets still pending
+def _requeue(c, job_id):
+    c.execute("UPDATE settlement_jobs SET status = 'queued', error = NULL, updated_at = ? WHERE id = ?",
+              (_now(), job_id))
+    bump_generation(c)
+    c.execute("SELECT * FROM settlement_jobs WHERE id = ?", (job_id,))
+    return c.fetchone()
+
+
+# Retry a failed job from the admin pages; returns False when the job is
+# not (or no longer) failed
+@profiled
+def retry_settlement_job(job_id):
+    def write(c):
+        c.execute("SELECT status FROM settlement_jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+        if row is None or row['status'] != 'failed':
+            return False
+        _requeue(c, job_id)
+        return True
+
+    retried = run_write_transaction(write)
+    if retried:
+        _wakeup.set()
+    return retried
+
+
+def _claim_next_job(c):
+    conn = c.connection
+    c.execute("BEGIN IMMEDIATE")
+    c.execute('''
+    SELECT * FROM settlement_jobs
+    WHERE status = 'queued' OR (status = 'running' AND updated_at < ?)
+    ORDER BY id LIMIT 1
+    ''', (_now(STALE_AFTER),))
+    job = c.fetchone()
+    if job is not None:
+        c.execute("UPDATE settlement_jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                  (_now(), job['id']))
+    conn.commit()
+    return job
+
+
+# Settle a job chunk by chunk, one short write transaction per chunk.
+# Chunks only touch bets that are still pending, so re-running a job that
+# was interrupted half-way is safe. A chunk that finds the database locked
+# is retried with run_write_transaction's backoff; the job only fails on
+# other errors or once the retries run out, and can then be requeued.
+def run_job(job, chunk_size=CHUNK_SIZE):
+    settle = settle_match_bets if job['kind'] == 'match' else settle_custom_bets
+    scope = _JOB_SCOPES[job['kind']]
+
+    # Settle the next chunk; returns False once no pending bets are left
+    def chunk(c):
+        c.execute(f"SELECT id FROM bets WHERE {scope} ORDER BY id LIMIT 1 OFFSET ?",
+                  (job['target_id'], chunk_size - 1))
+        bound = c.fetchone()
+        settled = settle(c, job['target_id'], job['result'], bound[0] if bound else None)
+        c.execute('''
+        UPDATE settlement_jobs SET processed = processed + ?, updated_at = ?
+        WHERE id = ?
+        ''', (settled, _now(), job['id']))
+        if bound is None:
+            c.execute("UPDATE settlement_jobs SET status = 'done', updated_at = ? WHERE id = ?",
+                      (_now(), job['id']))
+        bump_generation(c)
+        return bound is not None
+
+    try:
+        while run_write_transaction(chunk):
+            pass
+    except Exception:
+        error = traceback.format_exc(limit=3)
+
+        def fail(c):
+            c.execute("UPDATE settlement_jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                      (error, _now(), job['id']))
+            bump_generation(c)
+
+        run_write_transaction(fail)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _worker_loop():
+    c = get_connection().cursor()
+    while True:
+        try:
+            job = _claim_next_job(c)
+        except Exception:
+            c.connection.rollback()
+            job = None
+        if job is not None:
+            try:
+                run_job(job)
+            except Exception:
+                # Not even the failure could be recorded; the job stays
+                # 'running' and is reclaimed once it is STALE_AFTER old
+                traceback.print_exc()
+            continue
+        # Idle: take the periodic ledger snapshot when one is due
+        try:
+            snapshot_if_due()
+        except Exception:
+            traceback.print_exc()
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+# Start the background settlement worker once per process
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="settlement-worker", daemon=True)
+            _worker.start()
+    return _worker
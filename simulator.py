@@ -0,0 +1,157 @@
+"""Monte Carlo distribution of the house's profit on pending bets.
+
+load_book() reads every pending bet of the chosen matches into NumPy
+arrays. Each bet pays amount + int(amount * odds) if it wins, the same
+rule settlement applies. The payouts are summed per (match, result outcome)
+and per custom bet, so a simulation never looks at individual bets.
+
+simulate() draws both sides' goals for every match from the odds engine's
+Poisson model (odds_engine.expected_goals) and pays the result outcome the
+scoreline settles. Each custom bet wins independently, with the probability
+implied by its odds less MARGIN. The house's profit in a simulation is
+every pending stake minus what it pays. Simulations run in chunks, so
+memory stays flat however many are asked for.
+
+Simplifications: live matches are simulated from kick-off (the app keeps
+no live score), and custom bets do not depend on the scoreline.
+
+    python simulator.py [--matches ID ...] [--simulations 1000000] [--seed 42]
+
+Without --matches every open match is simulated together, as one matchday.
+"""
+import argparse
+import collections
+import json
+import time
+
+import numpy as np
+
+import odds_engine
+from db import get_connection
+from profiler import profiled
+
+# Random numbers drawn per chunk; bounds memory to a few hundred MB
+CHUNK_DRAWS = 10_000_000
+
+# Pending bets of a set of matches, reduced to what the simulation needs:
+# match_ids (n,), team ids (n,), result_payouts (n, 3), custom_payouts (k,),
+# custom_odds (k,), stake (total of every bet) and the bet count
+Book = collections.namedtuple('Book', ['match_ids', 'team1_ids', 'team2_ids', 'result_payouts',
+                                       'custom_payouts', 'custom_odds', 'stake', 'bets'])
+
+
+# Pending bets of `match_ids` (every open match when None) as a Book
+@profiled
+def load_book(match_ids=None):
+    c = get_connection().cursor()
+    if match_ids is None:
+        match_ids = [row[0] for row in c.execute("SELECT id FROM matches WHERE status IN ('upcoming', 'live')")]
+    match_ids = sorted(set(match_ids))
+    ids = json.dumps(match_ids)
+
+    teams = np.array(c.execute('''
+    SELECT id, team1_id, team2_id FROM matches WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id
+    ''', (ids,)).fetchall(), dtype=np.int64).reshape(-1, 3)
+    bets = np.array(c.execute('''
+    SELECT match_id, CASE bet_type WHEN 'team1_win' THEN 0 WHEN 'draw' THEN 1 WHEN 'team2_win' THEN 2 ELSE -1 END,
+           COALESCE(custom_bet_id, 0), amount, odds
+    FROM bets
+    WHERE match_id IN (SELECT value FROM json_each(?)) AND status = 'pending'
+    ''', (ids,)).fetchall(), dtype=np.float64).reshape(-1, 5)
+
+    rows = np.searchsorted(teams[:, 0], bets[:, 0])
+    outcome = bets[:, 1].astype(np.int64)
+    amount = bets[:, 3].astype(np.int64)
+    # int(amount * odds) as settlement computes it, in double precision
+    payout = amount + (bets[:, 3] * bets[:, 4]).astype(np.int64)
+
+    is_result = outcome >= 0
+    result_payouts = np.bincount(rows[is_result] * 3 + outcome[is_result], payout[is_result],
+                                 minlength=len(teams) * 3).reshape(-1, 3).astype(np.int64)
+    custom_ids, custom_rows = np.unique(bets[~is_result, 2].astype(np.int64), return_inverse=True)
+    custom_payouts = np.bincount(custom_rows, payout[~is_result], minlength=len(custom_ids))
+    # A custom bet's odds are the stake-weighted odds its bets were accepted at
+    custom_odds = (np.bincount(custom_rows, bets[~is_result, 3] * bets[~is_result, 4], minlength=len(custom_ids))
+                   / np.bincount(custom_rows, bets[~is_result, 3], minlength=len(custom_ids)).clip(min=1))
+    return Book(teams[:, 0], teams[:, 1], teams[:, 2], result_payouts, custom_payouts, custom_odds,
+                int(amount.sum()), len(amount))
+
+
+# House profit of each of `simulations` draws, as an int64 array
+def simulate(book, simulations=100_000, seed=None, margin=None):
+    margin = odds_engine.MARGIN if margin is None else margin
+    rng = np.random.default_rng(seed)
+    ratings = odds_engine.fit_from_db(get_connection())
+    team1_goals, team2_goals = odds_engine.expected_goals(ratings, book.team1_ids, book.team2_ids)
+    custom_lose = 1 - np.minimum(1 / (book.custom_odds * (1 + margin)), 1)
+
+    # Paying every home win, then the extra for each result past it
+    payouts = book.result_payouts.astype(np.float64)
+    base = book.stake - payouts[:, 0].sum()
+    draw_extra = payouts[:, 1] - payouts[:, 0]
+    away_extra = payouts[:, 2] - payouts[:, 1]
+    custom_payouts = book.custom_payouts.astype(np.float64)
+
+    matches, customs = len(book.match_ids), len(book.custom_payouts)
+    chunk = max(1, CHUNK_DRAWS // max(2 * matches + customs, 1))
+    profit = np.empty(simulations, dtype=np.int64)
+    for start in range(0, simulations, chunk):
+        size = min(chunk, simulations - start)
+        # One scoreline per match and simulation
+        team1 = rng.poisson(team1_goals, (size, matches))
+        team2 = rng.poisson(team2_goals, (size, matches))
+        paid = (team1 <= team2) @ draw_extra + (team1 < team2) @ away_extra
+        if customs:
+            paid += (rng.random((size, customs), dtype=np.float32) >= custom_lose) @ custom_payouts
+        profit[start:start + size] = base - np.rint(paid).astype(np.int64)
+    return profit
+
+
+# Summary of a profit array: mean, spread, loss chance, value at risk (the
+# loss exceeded in 5% / 1% of draws), the worst draw and the worst case
+# possible (every bet paying its dearest outcome)
+def summarize(book, profit):
+    worst_possible = book.stake - int(book.result_payouts.max(axis=1, initial=0).sum() + book.custom_payouts.sum())
+    return {
+        'matches': len(book.match_ids),
+        'bets': book.bets,
+        'stake': book.stake,
+        'simulations': len(profit),
+        'mean': float(profit.mean()) if len(profit) else 0.0,
+        'std': float(profit.std()) if len(profit) else 0.0,
+        'loss_chance': float((profit < 0).mean()) if len(profit) else 0.0,
+        'var_95': float(-np.percentile(profit, 5)) if len(profit) else 0.0,
+        'var_99': float(-np.percentile(profit, 1)) if len(profit) else 0.0,
+        'worst_simulated': int(profit.min()) if len(profit) else book.stake,
+        'best_simulated': int(profit.max()) if len(profit) else book.stake,
+        'worst_possible': worst_possible,
+    }
+
+
+# Load, simulate and summarize in one call; returns (summary, profit array)
+@profiled
+def simulate_matches(match_ids=None, simulations=100_000, seed=None, margin=None):
+    book = load_book(match_ids)
+    profit = simulate(book, simulations, seed, margin)
+    return summarize(book, profit), profit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, nargs="+", default=None, help="match ids (default: every open match)")
+    parser.add_argument("--simulations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    from migrations import migrate
+    migrate()
+
+    start = time.perf_counter()
+    summary, _ = simulate_matches(args.matches, args.simulations, args.seed)
+    for name, value in summary.items():
+        print(f"{name:<16} {value:,.2f}" if isinstance(value, float) else f"{name:<16} {value:,}")
+    print(f"{'elapsed':<16} {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
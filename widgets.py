@@ -0,0 +1,32 @@
+"""Streamlit sections shared by app.py and admin_panel_enhanced.py.
+
+Everything below the UI lives in guimabet_melhorado, which stays free of
+Streamlit so api.py and the command-line tools can use it.
+"""
+import streamlit as st
+
+from cache import reload_if_changed
+from settlement import get_settlement_jobs, retry_settlement_job
+
+
+# Progress of settlement jobs; refreshes itself while the page is open,
+# querying the jobs only after a write
+@st.fragment(run_every=2)
+def settlement_progress(title="Liquidação de Apostas"):
+    jobs = reload_if_changed(st.session_state, 'settlement_jobs', get_settlement_jobs, 'generation')
+    if not jobs:
+        return
+
+    st.subheader(title)
+    for job in jobs:
+        label = f"Partida #{job['target_id']}" if job['kind'] == 'match' else f"Aposta personalizada #{job['target_id']}"
+        if job['status'] in ('queued', 'running'):
+            fraction = job['processed'] / job['total'] if job['total'] else 0.0
+            st.progress(min(fraction, 1.0), text=f"{label}: {job['processed']}/{job['total']} apostas")
+        elif job['status'] == 'failed':
+            st.error(f"{label}: falha na liquidação")
+            if st.button("Tentar novamente", key=f"retry_settlement_{job['id']}"):
+                retry_settlement_job(job['id'])
+                st.rerun()
+        else:
+            st.caption(f"{label}: {job['processed']} apostas liquidadas")